@@ -0,0 +1,16 @@
+# File: properties/migrations/0009_public_catalog_view.py
+
+from django.db import migrations
+
+from properties.catalog import drop_view, recreate_view
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('properties', '0008_partion_localiuzeaccomodation'),  # Replace with the latest migration that adds a column the view selects
+    ]
+
+    operations = [
+        # Drops any earlier definition (CREATE MATERIALIZED VIEW cannot replace one) and recreates it
+        migrations.RunPython(recreate_view, drop_view),
+    ]
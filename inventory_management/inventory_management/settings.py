@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from . import startup
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -43,12 +46,21 @@ INSTALLED_APPS = [
     'import_export',
 ]
 
+# Short-lived commands and workers start without the admin registrations and
+# UI-only apps (see inventory_management/startup.py and `manage.py startup_report`)
+STARTUP_PROFILE = os.environ.get(startup.PROFILE_ENV, 'full')
+
+if STARTUP_PROFILE == 'lean':
+    INSTALLED_APPS = startup.lean_apps(INSTALLED_APPS)
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'properties.middleware.PrimaryPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'properties.middleware.ProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -88,6 +100,52 @@ DATABASES = {
     }
 }
 
+# Read replicas, given as overrides of the default connection,
+# e.g. [{'HOST': 'postgres-replica'}]. Leave empty to send all traffic to default.
+DATABASE_REPLICAS = []
+
+for index, replica in enumerate(DATABASE_REPLICAS, start=1):
+    DATABASES[f'replica{index}'] = {
+        **DATABASES['default'],
+        'OPTIONS': {'connect_timeout': 2},
+        **replica,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['properties.routers.PrimaryReplicaRouter']
+
+# Bookkeeping that must never be read stale or pin reads: jobs, profiles, the database cache and sessions
+DATABASE_PRIMARY_ONLY_MODELS = [
+    'properties.Job', 'properties.RequestProfile', 'django_cache.CacheEntry', 'sessions.Session',
+]
+
+REPLICA_MAX_LAG = 5  # Seconds of replication lag before a replica is taken out of rotation
+
+REPLICA_LAG_CHECK_INTERVAL = 10  # Seconds between replica lag checks, per process
+
+PRIMARY_PIN_SECONDS = 10  # Reads stay on the primary this long after a write
+
+PRIMARY_PIN_COOKIE = 'db_primary_pin'
+
+
+# Cache
+# Database-backed so all workers and hosts share it without another service
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'django_cache',
+    }
+}
+
+LOCATION_PAGE_CACHE_TIMEOUT = 60 * 60  # Seconds a rendered location page fragment is kept
+
+LOCATION_PAGE_SIZE = 24  # Accommodations per location page
+
+LISTINGS_API_PAGE_SIZE = 50  # Default page size of /api/accommodations
+
+LISTINGS_API_MAX_PAGE_SIZE = 200
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -125,7 +183,157 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+STATIC_ROOT = BASE_DIR / 'staticfiles'  # Filled by collectstatic and build_assets
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Bulk accommodation changes (see properties/bulk.py)
+
+BULK_UPDATE_BATCH_SIZE = 10000  # Rows per UPDATE statement and transaction
+
+
+# Background jobs (see properties/jobs.py and `manage.py run_workers`)
+
+JOB_WORKER_PROCESSES = 2  # Size of the run_workers process pool
+
+JOB_POLL_INTERVAL = 2  # Seconds between queue polls when idle
+
+JOB_MAX_ATTEMPTS = 3  # Default attempts before a job is marked failed
+
+JOB_RETRY_BACKOFF = 30  # Seconds before the first retry, doubled for each further attempt
+
+JOB_STALE_TIMEOUT = 600  # Running jobs without a heartbeat for this long are requeued
+
+JOB_OUTPUT_DIR = BASE_DIR / 'job_output'  # Files produced by jobs, e.g. exports
+
+MEDIA_ROOT = BASE_DIR / 'media'  # Under the project volume, so web and worker containers see the same files
+
+# Uploaded import files are read back by the location_import job in the worker container
+IMPORT_EXPORT_TMP_STORAGE_CLASS = 'import_export.tmp_storages.MediaStorage'
+
+
+# Change feed API (see properties/changefeed.py)
+
+CHANGEFEED_TOKENS = []  # Bearer tokens accepted from downstream consumers, in addition to staff sessions
+
+CHANGEFEED_PAGE_SIZE = 1000  # Default number of entries per page
+
+CHANGEFEED_MAX_PAGE_SIZE = 10000
+
+CHANGEFEED_RETENTION_DAYS = 90  # Monthly partitions older than this are dropped by changelog_maintenance
+
+
+# Materialized catalog of published accommodations (see properties/catalog.py and `manage.py refresh_public_catalog`)
+
+PUBLIC_CATALOG_LANGUAGE = 'en'  # Description shown when an accommodation has several localizations
+
+PUBLIC_CATALOG_REFRESH_INTERVAL = 300  # Seconds between refreshes of the scheduled job (refresh_public_catalog --schedule)
+
+
+# Price history and trend rollups (see properties/prices.py and `manage.py price_history_maintenance`)
+
+PRICE_HISTORY_RETENTION_DAYS = 400  # Raw monthly partitions older than this are dropped; rollups are kept
+
+
+# Staff request profiler (see properties/profiler.py)
+
+PROFILER_ENABLED = True
+
+PROFILER_QUERY_PARAM = '_profile'  # ?_profile=1 profiles the request
+
+PROFILER_HEADER = 'X-Profile'  # ... as does an `X-Profile: 1` header
+
+PROFILER_INTERVAL = 0.005  # Seconds between stack samples
+
+PROFILER_MAX_QUERIES = 2000  # SQL statements kept per profile
+
+
+# Load-test results (see properties/loadtest.py and `manage.py loadtest`)
+
+LOADTEST_RESULTS_DIR = BASE_DIR / 'loadtest_results'  # One JSON file per run, named <time>-<git revision>
+
+
+# HTTP validators on location pages and JSON endpoints (see properties/conditional.py)
+
+HTTP_CACHE_MAX_AGE = 60  # Seconds browsers and shared caches may reuse anonymous responses without revalidating
+
+
+# Amenity dictionary (see Amenity in properties/models.py)
+
+AMENITY_NAMES_CHECK_INTERVAL = 30  # Seconds a process trusts its id -> name cache before checking for renames
+
+
+# Content-addressed localization policies (see Policy in properties/models.py)
+
+POLICY_CACHE_SIZE = 5000  # Policy documents kept in each process's LRU cache
+
+
+# Accommodation vs Location consistency audit (see properties/geoaudit.py)
+
+GEO_AUDIT_MAX_DISTANCE_KM = {  # Farthest an accommodation may be from its location's center
+    'continent': 6000,
+    'country': 2500,
+    'state': 800,
+    'city': 100,
+}
+
+
+# Listing rank score (see properties/ranking.py)
+
+RANKING_WEIGHTS = {'review': 0.6, 'completeness': 0.3, 'recency': 0.1}
+
+RANKING_TARGETS = {'languages': 3, 'images': 10, 'amenities': 15}  # Counts that earn full completeness credit
+
+RANKING_RECENCY_HALF_LIFE_DAYS = 90  # Age at which the recency component is halved
+
+
+# Nearest listings per location (see properties/nearest.py)
+
+NEAREST_LISTINGS_LIMIT = 20  # Accommodations stored per location center
+
+
+# Geohash grid rollups of published accommodations (see properties/geogrid.py)
+
+GEOGRID_MAX_LEVEL = 7  # Finest rollup level (geohash length; level 7 cells are ~150 m)
+
+GEOGRID_MAX_CELLS = 2000  # Cells returned per /api/geogrid/ response
+
+
+# Polygon area search (see properties/area_search.py)
+
+AREA_SEARCH_MAX_VERTICES = 50000  # Larger submitted polygons are rejected
+
+AREA_SEARCH_SIMPLIFY_TOLERANCE = 0.0001  # Degrees (~10 m) a simplified edge may deviate from the drawn one
+
+AREA_SEARCH_SUBDIVIDE_VERTICES = 256  # Max vertices per ST_Subdivide piece probing the center index
+
+AREA_SEARCH_MAX_RESULTS = 10000  # Features per response; more sets "truncated"
+
+AREA_SEARCH_COUNT_TTL = 15 * 60  # Seconds before a saved search's result count is recounted by a job
+
+AREA_SEARCH_PAGE_SIZE = 50  # Saved searches per page of GET /api/area-search/
+
+
+# Memory-mapped Location tree snapshot shared by all workers (see properties/location_index.py)
+
+LOCATION_INDEX_PATH = BASE_DIR / 'var' / 'location_index.bin'
+
+LOCATION_INDEX_CHECK_INTERVAL = 30  # Seconds between checks of the Location version row for a rebuilt file
+
+
+# Self-hosted CSS (see properties/assets.py and `manage.py build_assets`)
+
+ASSET_SOURCES = {'app.css': 'properties/css/app.css'}  # Logical name -> source in the static files
+
+ASSET_CONTENT_GLOBS = [  # Files scanned for used class names when purging
+    BASE_DIR / 'properties' / 'templates' / '**' / '*.html',
+    BASE_DIR / 'properties' / '*.py',
+]
+
+SERVE_STATIC_ASSETS = True  # Serve STATIC_ROOT from Django when no CDN or web server is in front
+
+STATIC_ASSET_MAX_AGE = 3600  # Cache lifetime of static files without a content hash in their name
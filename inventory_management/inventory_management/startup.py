@@ -0,0 +1,114 @@
+"""
+Startup profiles.
+
+The ``full`` profile (web servers and interactive commands) installs every
+app. The ``lean`` profile, used by manage.py for the commands in
+LEAN_COMMANDS and inherited by the processes they spawn, starts without
+what only the admin and the HTML pages need: the admin stays installed for
+its models but its registrations are not autodiscovered (so
+``properties/admin.py``, ``import_export.admin`` and ``leaflet.admin`` are
+never imported), the ``leaflet`` and ``import_export`` apps are left out,
+and system checks are skipped. ``manage.py startup_report`` measures both.
+
+The profile can be forced with INVENTORY_STARTUP_PROFILE=full|lean.
+"""
+import os
+import re
+import subprocess
+import sys
+import time
+
+PROFILE_ENV = 'INVENTORY_STARTUP_PROFILE'
+
+# Non-web commands that never touch the admin, import/export or map widgets
+LEAN_COMMANDS = {
+    'audit_geo_consistency',
+    'build_location_index',
+    'changelog_maintenance',
+    'dedupe_policies',
+    'encode_amenities',
+    'generate_sitemap',
+    'price_history_maintenance',
+    'rank_accommodations',
+    'rebuild_geogrid',
+    'refresh_nearest_listings',
+    'refresh_public_catalog',
+    'run_workers',
+    'startup_report',
+}
+
+# Apps only used to render the admin and its import/export and map widgets
+UI_ONLY_APPS = ['leaflet', 'import_export']
+
+
+def select_profile(argv):
+    """Choose the profile for a manage.py invocation; returns the (possibly adjusted) argv."""
+    command = argv[1] if len(argv) > 1 else None
+    profile = os.environ.setdefault(PROFILE_ENV, 'lean' if command in LEAN_COMMANDS else 'full')
+    if profile == 'lean' and command and '--skip-checks' not in argv:
+        # Checks import the URLconf and every view; deploys run `manage.py check` instead
+        argv = [*argv, '--skip-checks']
+    return argv
+
+
+def lean_apps(installed_apps):
+    """INSTALLED_APPS for the lean profile."""
+    apps = []
+    for app in installed_apps:
+        if app == 'django.contrib.admin':
+            # Keeps LogEntry and the admin templates, skips admin.autodiscover()
+            apps.append('django.contrib.admin.apps.SimpleAdminConfig')
+        elif app not in UI_ONLY_APPS:
+            apps.append(app)
+    return apps
+
+
+IMPORT_TIME_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def parse_import_times(stderr):
+    """``{module: (self µs, cumulative µs, depth)}`` from ``python -X importtime`` output."""
+    modules = {}
+    for line in stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            modules[match[4]] = (int(match[1]), int(match[2]), len(match[3]) // 2)
+    return modules
+
+
+SETUP_SCRIPT = 'import time, django; start = time.perf_counter(); django.setup(); print(time.perf_counter() - start)'
+
+
+def measure(profile, runs=3):
+    """
+    Start Django in fresh interpreters with ``profile`` and return the fastest
+    run: ``{'profile', 'setup_seconds', 'wall_seconds', 'modules'}``.
+    """
+    env = {**os.environ, PROFILE_ENV: profile}
+    env.setdefault('DJANGO_SETTINGS_MODULE', 'inventory_management.settings')
+    best = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', SETUP_SCRIPT],
+            env=env, capture_output=True, text=True, check=True,
+        )
+        wall = time.perf_counter() - started
+        if best is None or wall < best['wall_seconds']:
+            best = {
+                'profile': profile,
+                'setup_seconds': float(result.stdout.strip().splitlines()[-1]),
+                'wall_seconds': wall,
+                'modules': parse_import_times(result.stderr),
+            }
+    return best
+
+
+def top_packages(modules, limit=15):
+    """Top-level packages by cumulative import time (µs), slowest first."""
+    roots = {name: cumulative for name, (_, cumulative, depth) in modules.items() if depth == 0}
+    packages = {}
+    for name, cumulative in roots.items():
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0) + cumulative
+    return sorted(packages.items(), key=lambda item: item[1], reverse=True)[:limit]
@@ -14,11 +14,18 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
+from properties.views import StaticAssetView
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('', include('properties.urls')),  # Include properties app URLs
 ]
+
+if settings.SERVE_STATIC_ASSETS:
+    # Before the properties URLs, whose location pages catch every other path
+    urlpatterns.append(re_path(r'^static/(?P<path>.+)$', StaticAssetView.as_view(), name='static_asset'))
+
+urlpatterns.append(path('', include('properties.urls')))  # Include properties app URLs
@@ -7,6 +7,9 @@ import sys
 def main():
     """Run administrative tasks."""
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'inventory_management.settings')
+    from inventory_management.startup import select_profile
+
+    argv = select_profile(sys.argv)
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
@@ -15,7 +18,7 @@ def main():
             "available on your PYTHONPATH environment variable? Did you "
             "forget to activate a virtual environment?"
         ) from exc
-    execute_from_command_line(sys.argv)
+    execute_from_command_line(argv)
 
 
 if __name__ == '__main__':
@@ -1,11 +1,35 @@
-from django.contrib import admin
+import os
+
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
 from django.contrib.auth.models import Group
 from django.contrib.auth.models import User
 from django.contrib.auth.admin import UserAdmin
+from django.core.exceptions import PermissionDenied
+from django.db.models import Count
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404, redirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils.decorators import method_decorator
+from django.utils.html import format_html
+from django.views.decorators.http import require_POST
 from import_export.admin import ImportExportModelAdmin
 from leaflet.admin import LeafletGeoAdmin
-from .models import Location, Accommodation, LocalizeAccommodation
+from . import area_search, bulk, jobs, profiler
+from .forms import (
+    AccommodationAdminForm, LocalizeAccommodationAdminForm, MoveLocationForm, ReassignOwnerForm, SavedAreaSearchAdminForm,
+)
+from .models import (
+    Location, Accommodation, Amenity, LocalizeAccommodation, Policy, Job, RequestProfile, GeoAuditRun,
+    GeoConsistencyIssue, SavedAreaSearch,
+)
 from .resources import LocationResource
+from .tasks import IMPORT_CHUNK_SIZE, serialize_query
+
+
+def dotted_path(cls):
+    return f"{cls.__module__}.{cls.__qualname__}"
 
 
 # Admin configuration for Location model using LeafletGeoAdmin
@@ -19,14 +43,63 @@ class LocationAdmin(ImportExportModelAdmin, LeafletGeoAdmin):
     #     'DEFAULT_ZOOM': 6,         # Default zoom level
     # }
 
+    @method_decorator(require_POST)
+    def process_import(self, request, **kwargs):
+        """
+        Queue the confirmed import as a background job instead of
+        importing the whole file inside the request.
+        """
+        if not self.has_import_permission(request):
+            raise PermissionDenied
+
+        confirm_form = self.create_confirm_form(request)
+        if not confirm_form.is_valid():
+            # Let import-export re-render the confirm page with the errors
+            return super().process_import(request, **kwargs)
+
+        input_format = self.get_import_formats()[int(confirm_form.cleaned_data['format'])]
+        binary = input_format(encoding=self.from_encoding).is_binary()
+        job = jobs.enqueue('location_import', {
+            'import_file_name': confirm_form.cleaned_data['import_file_name'],
+            'original_file_name': confirm_form.cleaned_data['original_file_name'],
+            'input_format': dotted_path(input_format),
+            'tmp_storage_class': dotted_path(self.get_tmp_storage_class()),
+            'encoding': None if binary else self.from_encoding,
+            'user_id': request.user.pk,
+        }, user=request.user, max_attempts=1)  # The job removes the uploaded file, so it cannot be retried
+
+        messages.success(
+            request,
+            f'Import queued as background job #{job.pk}. Rows are committed in chunks of {IMPORT_CHUNK_SIZE}; '
+            f'if the import fails partway, the chunks before the failure stay imported.',
+        )
+        return redirect('admin:properties_job_change', job.pk)
+
+    def _do_file_export(self, file_format, request, queryset, export_form=None):
+        """Queue the export as a background job; the file is downloaded from the job page."""
+        if not self.has_export_permission(request):
+            raise PermissionDenied
+
+        job = jobs.enqueue('location_export', {
+            'query': serialize_query(queryset),
+            'file_format': dotted_path(type(file_format)),
+            'filename': self.get_export_filename(request, queryset, file_format),
+            'encoding': self.to_encoding,
+        }, user=request.user)
+
+        messages.success(request, f'Export queued as background job #{job.pk}.')
+        return redirect('admin:properties_job_change', job.pk)
+
 
 class AccommodationAdmin(LeafletGeoAdmin):
     list_display = ('id', 'title', 'user_id', 'feed', 'country_code', 'usd_rate', 'review_score', 'bedroom_count', 'published', 'created_at', 'updated_at')
-    search_fields = ('title', 'country_code', 'location_id__title', 'amenities')
+    search_fields = ('title', 'country_code', 'location_id__title')
     list_filter = ('published', 'location_id')
+    form = AccommodationAdminForm
     raw_id_fields = ('location_id', 'user_id')
     ordering = ('-created_at',)
     autocomplete_fields = ["location_id"]
+    actions = ['publish_selected', 'unpublish_selected', 'reassign_owner', 'move_location']
 
     settings_overrides = {  # Optional: Customize Leaflet map settings
         'DEFAULT_CENTER': (0, 0),  # Latitude and Longitude for default map center
@@ -36,10 +109,69 @@ class AccommodationAdmin(LeafletGeoAdmin):
     def get_queryset(self, request):
         """Limit queryset to show only accommodations created by the logged-in user for Property Owners."""
         qs = super().get_queryset(request)
-        if request.user.groups.filter(name='Property Owners').exists():
-            # Show only the accommodations created by the logged-in user
-            return qs.filter(user_id=request.user)
-        return qs  # Admins can see all accommodations
+        # Property Owners only see their own accommodations, admins see all
+        return bulk.scope_to_user(qs, request.user)
+
+    def get_search_results(self, request, queryset, search_term):
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        # Amenities are stored as dictionary ids, so match the names first
+        if search_term:
+            amenity_ids = list(Amenity.objects.filter(name__icontains=search_term).values_list('id', flat=True)[:100])
+            if amenity_ids:
+                results |= queryset.filter(amenity_ids__overlap=amenity_ids)
+        return results, may_have_duplicates
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        if bulk.is_property_owner(request.user):
+            # Owners cannot give their accommodations away
+            actions.pop('reassign_owner', None)
+        return actions
+
+    @admin.action(description='Publish selected accommodations', permissions=['change'])
+    def publish_selected(self, request, queryset):
+        count = bulk.publish(queryset)
+        self.message_user(request, f'Published {count} accommodations.', messages.SUCCESS)
+
+    @admin.action(description='Unpublish selected accommodations', permissions=['change'])
+    def unpublish_selected(self, request, queryset):
+        count = bulk.unpublish(queryset)
+        self.message_user(request, f'Unpublished {count} accommodations.', messages.SUCCESS)
+
+    @admin.action(description='Reassign owner of selected accommodations', permissions=['change'])
+    def reassign_owner(self, request, queryset):
+        return self._bulk_form_action(
+            request, queryset, ReassignOwnerForm, 'Reassign owner',
+            lambda form: bulk.reassign_owner(queryset, form.cleaned_data['user']),
+        )
+
+    @admin.action(description='Move selected accommodations to another location', permissions=['change'])
+    def move_location(self, request, queryset):
+        return self._bulk_form_action(
+            request, queryset, MoveLocationForm, 'Move to location',
+            lambda form: bulk.move_location(queryset, form.cleaned_data['location']),
+        )
+
+    def _bulk_form_action(self, request, queryset, form_class, title, apply):
+        """Show an intermediate form for an action, then run ``apply(form)`` on submit."""
+        form = form_class(request.POST if 'apply' in request.POST else None)
+        if form.is_valid():
+            count = apply(form)
+            self.message_user(request, f'{title}: updated {count} accommodations.', messages.SUCCESS)
+            return None
+
+        context = {
+            **self.admin_site.each_context(request),
+            'title': title,
+            'opts': self.model._meta,
+            'form': form,
+            'count': queryset.count(),
+            'action': request.POST['action'],
+            'selected': request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            'select_across': request.POST.get('select_across') == '1',
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+        }
+        return TemplateResponse(request, 'admin/properties/accommodation/bulk_action.html', context)
 
     def get_form(self, request, obj=None, **kwargs):
         """
@@ -71,11 +203,200 @@ class AccommodationAdmin(LeafletGeoAdmin):
 
 
 class LocalizeAccommodationAdmin(admin.ModelAdmin):
+    form = LocalizeAccommodationAdminForm
     list_display = ('id', 'property_id', 'language', 'description')
     search_fields = ('property_id__title', 'language')
     list_filter = ('language',)
 
 
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'progress_bar', 'progress_message', 'attempts', 'created_by', 'created_at', 'finished_at')
+    list_filter = ('status', 'kind')
+    search_fields = ('kind', 'progress_message')
+    readonly_fields = (
+        'kind', 'status', 'progress_bar', 'progress_message', 'download_link', 'payload', 'result', 'error',
+        'attempts', 'max_attempts', 'cancel_requested', 'run_after', 'locked_by', 'heartbeat_at',
+        'created_by', 'created_at', 'started_at', 'finished_at',
+    )
+    exclude = ('progress',)
+    actions = ['cancel_jobs', 'retry_jobs']
+
+    def has_add_permission(self, request):
+        # Jobs are only created by enqueueing work
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description='Progress')
+    def progress_bar(self, obj):
+        return format_html('<progress value="{}" max="100"></progress> {}%', obj.progress, obj.progress)
+
+    @admin.display(description='Output')
+    def download_link(self, obj):
+        if obj.status != Job.SUCCEEDED or not (obj.result or {}).get('filename'):
+            return '-'
+        url = reverse('admin:properties_job_download', args=[obj.pk])
+        return format_html('<a href="{}">{}</a>', url, obj.result['filename'])
+
+    def get_urls(self):
+        urls = super().get_urls()
+        my_urls = [
+            path(
+                '<path:object_id>/download/',
+                self.admin_site.admin_view(self.download_view),
+                name='properties_job_download',
+            ),
+        ]
+        return my_urls + urls
+
+    def download_view(self, request, object_id):
+        """Serve a file produced by a finished job (e.g. a Location export)."""
+        job = get_object_or_404(Job, pk=object_id)
+        if not self.has_view_permission(request, job):
+            raise PermissionDenied
+        output = job.result or {}
+        if not output.get('filename') or not os.path.exists(output.get('file', '')):
+            raise Http404('This job has no downloadable output.')
+        return FileResponse(
+            open(output['file'], 'rb'),
+            as_attachment=True,
+            filename=output['filename'],
+            content_type=output.get('content_type'),
+        )
+
+    @admin.action(description='Cancel selected jobs')
+    def cancel_jobs(self, request, queryset):
+        for job in queryset.filter(status__in=[Job.QUEUED, Job.RUNNING]):
+            jobs.cancel(job)
+        self.message_user(request, 'Cancellation requested for the selected jobs.', messages.SUCCESS)
+
+    @admin.action(description='Retry selected jobs')
+    def retry_jobs(self, request, queryset):
+        for job in queryset.filter(status__in=[Job.FAILED, Job.CANCELLED]):
+            jobs.retry(job)
+        self.message_user(request, 'Failed and cancelled jobs were queued again.', messages.SUCCESS)
+
+
+class GeoAuditRunAdmin(admin.ModelAdmin):
+    list_display = ('id', 'started_at', 'duration', 'checked_count', 'issues_link')
+    readonly_fields = ('started_at', 'duration', 'checked_count', 'issue_count', 'thresholds')
+
+    def has_add_permission(self, request):
+        # Runs are recorded by `manage.py audit_geo_consistency`
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description='Issues', ordering='issue_count')
+    def issues_link(self, obj):
+        url = reverse('admin:properties_geoconsistencyissue_changelist') + f'?run__id__exact={obj.pk}'
+        return format_html('<a href="{}">{}</a>', url, obj.issue_count)
+
+
+class GeoConsistencyIssueAdmin(admin.ModelAdmin):
+    list_display = (
+        'accommodation_link', 'location_id', 'location_type', 'distance_km', 'max_distance_km',
+        'accommodation_country', 'location_country', 'too_far', 'country_mismatch',
+    )
+    list_filter = ('run', 'location_type', 'too_far', 'country_mismatch')
+    search_fields = ('property_id__id', 'location_id__id', 'location_id__title')
+    list_select_related = ('location_id',)
+    ordering = ('-run', '-distance_km')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description='Accommodation', ordering='property_id')
+    def accommodation_link(self, obj):
+        url = reverse('admin:properties_accommodation_change', args=[obj.property_id_id])
+        return format_html('<a href="{}">{}</a>', url, obj.property_id_id)
+
+
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ('id', 'method', 'path', 'status_code', 'duration_ms', 'query_count', 'query_time_ms', 'created_by', 'created_at')
+    list_filter = ('method', 'status_code')
+    search_fields = ('path',)
+    readonly_fields = ('method', 'path', 'status_code', 'duration', 'query_count', 'query_time', 'created_by', 'created_at')
+    exclude = ('samples', 'queries', 'sample_interval')
+
+    def has_add_permission(self, request):
+        # Profiles are recorded by ProfilerMiddleware
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description='Duration (ms)', ordering='duration')
+    def duration_ms(self, obj):
+        return f'{obj.duration:.1f}'
+
+    @admin.display(description='SQL time (ms)', ordering='query_time')
+    def query_time_ms(self, obj):
+        return f'{obj.query_time:.1f}'
+
+    def change_view(self, request, object_id, form_url='', extra_context=None):
+        profile = self.get_object(request, object_id)
+        extra_context = extra_context or {}
+        if profile is not None:
+            rows = profiler.flame_rows(profile.samples)
+            duration = profile.duration or 1
+            extra_context.update({
+                'flame_rows': rows,
+                'flame_height': (max((row['depth'] for row in rows), default=0) + 1) * 18,
+                'sample_count': sum(profile.samples.values()),
+                'queries': [
+                    {**query, 'left': query['start'] * 100 / duration, 'width': query['duration'] * 100 / duration}
+                    for query in profile.queries
+                ],
+            })
+        return super().change_view(request, object_id, form_url, extra_context)
+
+
+class AmenityAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name')
+    search_fields = ('name',)
+    ordering = ('name',)
+
+
+class PolicyAdmin(admin.ModelAdmin):
+    list_display = ('id', 'digest', 'localization_count')
+    search_fields = ('digest',)
+    readonly_fields = ('digest', 'document')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(localization_count=Count('localizeaccommodation'))
+
+    @admin.display(description='Localizations', ordering='localization_count')
+    def localization_count(self, obj):
+        return obj.localization_count
+
+    def has_add_permission(self, request):
+        # Policies are content-addressed and only created by saving localizations
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+class SavedAreaSearchAdmin(LeafletGeoAdmin):
+    form = SavedAreaSearchAdminForm
+    list_display = ('name', 'created_by', 'vertex_count', 'original_vertex_count', 'result_count', 'counted_at', 'created_at')
+    search_fields = ('name',)
+    readonly_fields = ('original_vertex_count', 'vertex_count', 'result_count', 'counted_at', 'created_by')
+
+    def save_model(self, request, obj, form, change):
+        obj.vertex_count = obj.geometry.num_coords
+        obj.created_by = obj.created_by or request.user
+        obj.counted_at = None
+        super().save_model(request, obj, form, change)
+        area_search.schedule_recounts([obj])
+
+
 class CustomUserAdmin(UserAdmin):
     model = User
     list_display = ['id', 'username', 'email', 'is_active', 'is_staff']
@@ -86,6 +407,13 @@ class CustomUserAdmin(UserAdmin):
 # Register models with the admin interface
 admin.site.register(Location, LocationAdmin)
 admin.site.register(Accommodation, AccommodationAdmin)
+admin.site.register(Amenity, AmenityAdmin)
 admin.site.register(LocalizeAccommodation, LocalizeAccommodationAdmin)
+admin.site.register(Policy, PolicyAdmin)
+admin.site.register(Job, JobAdmin)
+admin.site.register(RequestProfile, RequestProfileAdmin)
+admin.site.register(GeoAuditRun, GeoAuditRunAdmin)
+admin.site.register(GeoConsistencyIssue, GeoConsistencyIssueAdmin)
+admin.site.register(SavedAreaSearch, SavedAreaSearchAdmin)
 admin.site.unregister(User)
 admin.site.register(User, CustomUserAdmin)
@@ -0,0 +1,68 @@
+"""
+Bulk conversion of the legacy ``amenities`` JSON column into the Amenity
+dictionary and ``Accommodation.amenity_ids``. Saves encode on their own.
+"""
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import Accommodation, forget_amenity_names
+from .partitions import map_partitions
+
+# Names already in the dictionary are left out before inserting: rows skipped by
+# ON CONFLICT still use up a value of the (smallint) id sequence
+DICTIONARY_SQL = """
+INSERT INTO properties_amenity (name)
+SELECT DISTINCT left(item.name, 100)
+FROM properties_accommodation, jsonb_array_elements_text(amenities) AS item(name)
+WHERE jsonb_typeof(amenities) = 'array'
+  AND NOT EXISTS (SELECT 1 FROM properties_amenity amenity WHERE amenity.name = left(item.name, 100))
+ON CONFLICT (name) DO NOTHING
+"""
+
+# Ids in the order the names were listed, duplicates dropped
+ENCODE_SQL = """
+ARRAY(
+    SELECT amenity.id
+    FROM jsonb_array_elements_text(
+        CASE WHEN jsonb_typeof(properties_accommodation.amenities) = 'array'
+             THEN properties_accommodation.amenities ELSE '[]'::jsonb END
+    ) WITH ORDINALITY AS item(name, position)
+    JOIN properties_amenity amenity ON amenity.name = left(item.name, 100)
+    GROUP BY amenity.id
+    ORDER BY min(item.position)
+)::smallint[]
+"""
+
+
+def fill_dictionary():
+    with connection.cursor() as cursor:
+        cursor.execute(DICTIONARY_SQL)
+        return cursor.rowcount
+
+
+def encode(queryset, batch_size=10000):
+    """Encode the rows of ``queryset`` that still have JSON amenities, in batches. Returns the count."""
+    pending = queryset.filter(legacy_amenities__isnull=False)
+    encoded = 0
+    while True:
+        pks = list(pending.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return encoded
+        encoded += pending.filter(pk__in=pks).update(
+            amenity_ids=RawSQL(ENCODE_SQL, []), legacy_amenities=None
+        )
+
+
+def encode_all(batch_size=10000, workers=None):
+    """Add every amenity name to the dictionary, then encode all partitions concurrently."""
+    added = fill_dictionary()
+    encoded = sum(map_partitions(
+        Accommodation.objects.all(), lambda queryset: encode(queryset, batch_size), workers=workers
+    ))
+    return added, encoded
+
+
+def amenity_saved(sender, instance, created, **kwargs):
+    # New names are picked up on the first miss; renamed ones are not
+    if not created:
+        forget_amenity_names()
@@ -1,6 +1,81 @@
 from django.apps import AppConfig
+from django.db import DEFAULT_DB_ALIAS
+from django.core.management import call_command
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
+
+
+def create_changelog_partitions(sender, using, **kwargs):
+    from .changefeed import ensure_partitions
+
+    if using == DEFAULT_DB_ALIAS:
+        ensure_partitions()
+
+
+def create_price_history(sender, using, **kwargs):
+    from .prices import ensure_price_history
+
+    if using == DEFAULT_DB_ALIAS:
+        ensure_price_history()
+
+
+def create_location_index_generation(sender, using, **kwargs):
+    from .location_index import ensure_generation
+
+    if using == DEFAULT_DB_ALIAS:
+        ensure_generation()
+
+
+def create_cache_table(sender, using, **kwargs):
+    # The default cache is database-backed so every worker sees the same page versions
+    call_command('createcachetable', database=using, verbosity=0)
 
 
 class PropertiesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'properties'
\ No newline at end of file
+    name = 'properties'
+
+    def ready(self):
+        # Register background job handlers
+        from . import tasks  # noqa: F401
+        from . import amenities, changefeed, geogrid, nearest, page_cache, ranking
+        from .models import Accommodation, Amenity, LocalizeAccommodation, Location
+        from .signals import accommodations_bulk_changed
+
+        # Change feed capture
+        for model in changefeed.TRACKED_MODELS.values():
+            post_save.connect(changefeed.record_save, sender=model, dispatch_uid=f'changefeed_save_{model.__name__}')
+            post_delete.connect(changefeed.record_delete, sender=model, dispatch_uid=f'changefeed_delete_{model.__name__}')
+        accommodations_bulk_changed.connect(changefeed.record_bulk_change, dispatch_uid='changefeed_bulk')
+
+        # Incremental maintenance of the nearest listings table
+        pre_save.connect(nearest.remember_previous_placement, sender=Accommodation, dispatch_uid='nearest_pre_save')
+        post_save.connect(nearest.accommodation_saved, sender=Accommodation, dispatch_uid='nearest_save')
+        post_delete.connect(nearest.accommodation_deleted, sender=Accommodation, dispatch_uid='nearest_delete')
+        post_save.connect(nearest.location_saved, sender=Location, dispatch_uid='nearest_location_save')
+        accommodations_bulk_changed.connect(nearest.accommodations_bulk_changed, dispatch_uid='nearest_bulk')
+
+        # Location page fragment invalidation
+        pre_save.connect(page_cache.remember_previous_location, sender=Accommodation, dispatch_uid='page_cache_pre_save')
+        post_save.connect(page_cache.accommodation_changed, sender=Accommodation, dispatch_uid='page_cache_save')
+        post_delete.connect(page_cache.accommodation_changed, sender=Accommodation, dispatch_uid='page_cache_delete')
+        accommodations_bulk_changed.connect(page_cache.accommodations_bulk_changed, dispatch_uid='page_cache_bulk')
+
+        # Geo grid rollups
+        pre_save.connect(geogrid.remember_previous_contribution, sender=Accommodation, dispatch_uid='geogrid_pre_save')
+        post_save.connect(geogrid.accommodation_saved, sender=Accommodation, dispatch_uid='geogrid_save')
+        post_delete.connect(geogrid.accommodation_deleted, sender=Accommodation, dispatch_uid='geogrid_delete')
+        accommodations_bulk_changed.connect(geogrid.accommodations_bulk_changed, dispatch_uid='geogrid_bulk')
+
+        # Rank score
+        post_save.connect(ranking.accommodation_saved, sender=Accommodation, dispatch_uid='ranking_save')
+        post_save.connect(ranking.localization_changed, sender=LocalizeAccommodation, dispatch_uid='ranking_localization_save')
+        post_delete.connect(ranking.localization_changed, sender=LocalizeAccommodation, dispatch_uid='ranking_localization_delete')
+
+        # Amenity names cached per process
+        post_save.connect(amenities.amenity_saved, sender=Amenity, dispatch_uid='amenity_names_save')
+
+        # The change log is partitioned, which migrations cannot express
+        post_migrate.connect(create_changelog_partitions, sender=self)
+        post_migrate.connect(create_price_history, sender=self)
+        post_migrate.connect(create_location_index_generation, sender=self)
+        post_migrate.connect(create_cache_table, sender=self)
@@ -0,0 +1,181 @@
+"""
+Area search: published accommodations inside a polygon drawn on a map.
+
+Polygons arrive as GeoJSON and are validated (repaired if self-intersecting)
+and simplified within AREA_SEARCH_SIMPLIFY_TOLERANCE before they reach the
+database, since containment tests cost time per vertex. PostgreSQL then cuts
+the polygon with ``ST_Subdivide`` into pieces of at most
+AREA_SEARCH_SUBDIVIDE_VERTICES vertices, each probing the published-only
+GiST index on ``center`` with its own small bounding box. One huge polygon
+would have a bounding box covering most of its rows' neighbours, and test all
+of them against every vertex.
+
+Results are streamed from a server-side cursor as a GeoJSON FeatureCollection.
+Saved searches (SavedAreaSearch) keep their simplified polygon and a cached
+result count, recounted by a background job once it is older than
+AREA_SEARCH_COUNT_TTL seconds; listing searches never runs a polygon query.
+"""
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.gis.gdal import GDALException
+from django.contrib.gis.geos import GEOSException, GEOSGeometry, MultiPolygon, Polygon
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.utils.timezone import now
+
+from . import jobs
+from .models import Accommodation
+
+PIECES_SQL = """
+WITH pieces AS (
+    SELECT ST_Subdivide(%(area)s::geometry, %(max_vertices)s) AS geom
+)
+"""
+
+# Points on the edge between two pieces match both; rows are keyed by (feed, id)
+MATCHES_SQL = PIECES_SQL + """
+SELECT DISTINCT ON (acc.feed, acc.id) {columns}
+FROM pieces
+JOIN properties_accommodation acc ON acc.published AND ST_Intersects(pieces.geom, acc.center)
+ORDER BY acc.feed, acc.id
+LIMIT %(limit)s
+"""
+
+COUNT_SQL = PIECES_SQL + """
+SELECT count(*) FROM (
+    SELECT DISTINCT acc.feed, acc.id
+    FROM pieces
+    JOIN properties_accommodation acc ON acc.published AND ST_Intersects(pieces.geom, acc.center)
+) matches
+"""
+
+RESULT_COLUMNS = (
+    'acc.id, acc.feed, acc.title, acc.country_code, acc.location_id_id, acc.usd_rate, acc.review_score, '
+    'acc.bedroom_count, ST_X(acc.center), ST_Y(acc.center)'
+)
+
+PROPERTIES = ('id', 'feed', 'title', 'country_code', 'location_id', 'usd_rate', 'review_score', 'bedroom_count')
+
+
+class InvalidArea(ValueError):
+    """The submitted geometry cannot be searched."""
+
+
+def polygons(geometry):
+    """The polygons of a (multi)polygon or of the polygonal parts of a collection."""
+    if isinstance(geometry, Polygon):
+        return [geometry]
+    if geometry.geom_type in ('MultiPolygon', 'GeometryCollection'):
+        return [polygon for part in geometry for polygon in polygons(part)]
+    return []
+
+
+def prepare(geometry):
+    """
+    Validate, repair and simplify a polygon or multipolygon. Returns
+    ``(MultiPolygon, vertices before simplification)``; raises InvalidArea.
+    """
+    if geometry.geom_type not in ('Polygon', 'MultiPolygon'):
+        raise InvalidArea('Expected a Polygon or MultiPolygon.')
+    if geometry.srid not in (None, 4326):
+        geometry = geometry.transform(4326, clone=True)
+    vertices = geometry.num_coords
+    if vertices > settings.AREA_SEARCH_MAX_VERTICES:
+        raise InvalidArea(f'Polygons may have at most {settings.AREA_SEARCH_MAX_VERTICES} vertices.')
+    west, south, east, north = geometry.extent
+    if west < -180 or east > 180 or south < -90 or north > 90:
+        raise InvalidArea('Coordinates must be longitude, latitude in degrees.')
+    if not geometry.valid:
+        # Hand-drawn shapes often cross themselves; keep the area they enclose
+        geometry = geometry.make_valid()
+
+    simplified = geometry.simplify(settings.AREA_SEARCH_SIMPLIFY_TOLERANCE, preserve_topology=True)
+    parts = [polygon for polygon in polygons(simplified) if not polygon.empty]
+    if not parts or MultiPolygon(*parts).area == 0:
+        raise InvalidArea('The area is empty.')
+    return MultiPolygon(*parts, srid=4326), vertices
+
+
+def parse(body):
+    """``prepare()`` a GeoJSON Polygon, MultiPolygon or Feature given as text."""
+    try:
+        data = json.loads(body)
+        if isinstance(data, dict) and data.get('type') == 'Feature':
+            data = data.get('geometry')
+        geometry = GEOSGeometry(json.dumps(data))
+    except (TypeError, ValueError, GEOSException, GDALException) as e:
+        raise InvalidArea('Expected a GeoJSON Polygon, MultiPolygon or Feature.') from e
+    return prepare(geometry)
+
+
+def params(area, **extra):
+    return {'area': area.hexewkb.decode(), 'max_vertices': settings.AREA_SEARCH_SUBDIVIDE_VERTICES, **extra}
+
+
+def count(area):
+    """Number of published accommodations in ``area``."""
+    with connections[Accommodation.objects.all().db].cursor() as cursor:
+        cursor.execute(COUNT_SQL, params(area))
+        return cursor.fetchone()[0]
+
+
+def features(area, limit):
+    """
+    GeoJSON features of at most ``limit`` accommodations in ``area``, read
+    from a server-side cursor. Yields lists of features, one per fetched chunk.
+    The limit is applied in SQL: outside a transaction the cursor is declared
+    WITH HOLD, and PostgreSQL materializes all of its rows up front.
+    """
+    columns = len(PROPERTIES)
+    with connections[Accommodation.objects.all().db].chunked_cursor() as cursor:
+        cursor.execute(MATCHES_SQL.format(columns=RESULT_COLUMNS), params(area, limit=limit))
+        while rows := cursor.fetchmany(1000):
+            yield [
+                {
+                    'type': 'Feature',
+                    'geometry': {'type': 'Point', 'coordinates': [row[columns], row[columns + 1]]},
+                    'properties': dict(zip(PROPERTIES, row[:columns])),
+                }
+                for row in rows
+            ]
+
+
+def stream(area, vertices, limit=None):
+    """
+    The search results as chunks of a GeoJSON FeatureCollection of at most
+    ``limit`` features, with ``"truncated": true`` if there were more.
+    """
+    limit = limit or settings.AREA_SEARCH_MAX_RESULTS
+    yield '{"type": "FeatureCollection", "vertices": %s, "features": [' % json.dumps(
+        {'submitted': vertices, 'searched': area.num_coords}
+    )
+    returned, truncated = 0, False
+    # One row more than needed tells whether there were more
+    for chunk in features(area, limit + 1):
+        if returned + len(chunk) > limit:
+            chunk, truncated = chunk[:limit - returned], True
+        if chunk:
+            yield (',' if returned else '') + ','.join(json.dumps(f, cls=DjangoJSONEncoder) for f in chunk)
+            returned += len(chunk)
+    yield '], "truncated": %s}' % json.dumps(truncated)
+
+
+def is_stale(search):
+    return search.counted_at is None or search.counted_at < now() - timedelta(seconds=settings.AREA_SEARCH_COUNT_TTL)
+
+
+def recount(search):
+    """Count a saved search's results and cache the count. Runs in the ``count_area_search`` job."""
+    search.result_count = count(search.geometry)
+    search.counted_at = now()
+    search.save(update_fields=['result_count', 'counted_at'])
+    return search.result_count
+
+
+def schedule_recounts(searches):
+    """Queue a recount of the saved searches whose count is older than AREA_SEARCH_COUNT_TTL."""
+    for search in searches:
+        if is_stale(search):
+            jobs.enqueue_unique('count_area_search', {'search_id': search.pk})
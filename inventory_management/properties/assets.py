@@ -0,0 +1,211 @@
+"""
+Static asset pipeline for the public templates.
+
+``build_assets`` reads the CSS sources from the static files, drops rules whose
+classes are not used anywhere in the templates (purge), minifies the rest,
+writes content-hashed files to ``STATIC_ROOT/assets`` with gzip and brotli
+variants next to them, and records the hashed names in a manifest read by the
+``{% asset_url %}`` template tag.
+"""
+import glob
+import gzip
+import hashlib
+import json
+import os
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip variants are always written
+    brotli = None
+
+# Extensions worth precompressing
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.map')
+
+MANIFEST_NAME = 'manifest.json'
+
+CLASS_SELECTOR = re.compile(r'\.((?:\\.|[\w-])+)')
+CONTENT_TOKEN = re.compile(r'[\w:/.-]+')
+
+
+def output_dir():
+    return os.path.join(settings.STATIC_ROOT, 'assets')
+
+
+def collect_used_classes(patterns):
+    """Every token in the content files that could be a class name (a superset is fine)."""
+    used = set()
+    for pattern in patterns:
+        for path in glob.glob(os.fspath(pattern), recursive=True):
+            with open(path, encoding='utf-8') as f:
+                used.update(CONTENT_TOKEN.findall(f.read()))
+    return used
+
+
+def _matching_brace(css, start):
+    depth = 0
+    for i in range(start, len(css)):
+        if css[i] == '{':
+            depth += 1
+        elif css[i] == '}':
+            depth -= 1
+            if depth == 0:
+                return i
+    raise ValueError('Unbalanced braces in CSS')
+
+
+def parse_css(css):
+    """
+    Split CSS into nodes: ``('rule', selector, body)``, ``('group', prelude, nodes)``
+    for @media/@supports, and ``('raw', text)`` for anything else.
+    """
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    nodes = []
+    pos = 0
+    while True:
+        brace = css.find('{', pos)
+        semicolon = css.find(';', pos)
+        if brace == -1 and semicolon == -1:
+            break
+        if semicolon != -1 and (brace == -1 or semicolon < brace):
+            # Statement at-rule such as @import or @charset
+            nodes.append(('raw', css[pos:semicolon + 1].strip()))
+            pos = semicolon + 1
+            continue
+        prelude = css[pos:brace].strip()
+        end = _matching_brace(css, brace)
+        body = css[brace + 1:end]
+        if prelude.startswith(('@media', '@supports')):
+            nodes.append(('group', prelude, parse_css(body)))
+        elif prelude.startswith('@'):
+            nodes.append(('raw', f"{prelude}{{{body}}}"))
+        else:
+            nodes.append(('rule', prelude, body))
+        pos = end + 1
+    return nodes
+
+
+def selector_used(selector, used):
+    classes = [name.replace('\\', '') for name in CLASS_SELECTOR.findall(selector)]
+    return all(name in used for name in classes)
+
+
+def purge(nodes, used):
+    """Drop rules none of whose selectors can match the used classes."""
+    kept = []
+    for node in nodes:
+        if node[0] == 'rule':
+            if any(selector_used(s, used) for s in node[1].split(',')):
+                kept.append(node)
+        elif node[0] == 'group':
+            children = purge(node[2], used)
+            if children:
+                kept.append(('group', node[1], children))
+        else:
+            kept.append(node)
+    return kept
+
+
+def _minify_selector(selector):
+    selector = re.sub(r'\s+', ' ', selector.strip())
+    return re.sub(r'\s*([,>~+])\s*', r'\1', selector)
+
+
+def _minify_body(body):
+    body = re.sub(r'\s+', ' ', body.strip())
+    body = re.sub(r'\s*([:;,])\s*', r'\1', body)
+    return body.rstrip(';')
+
+
+def serialize(nodes):
+    """Minified CSS text for parsed nodes."""
+    parts = []
+    for node in nodes:
+        if node[0] == 'rule':
+            parts.append(f"{_minify_selector(node[1])}{{{_minify_body(node[2])}}}")
+        elif node[0] == 'group':
+            prelude = re.sub(r'\s+', ' ', node[1])
+            parts.append(f"{prelude}{{{serialize(node[2])}}}")
+        else:
+            parts.append(re.sub(r'\s+', ' ', node[1]))
+    return ''.join(parts)
+
+
+def precompress(path):
+    """Write ``path.gz`` (and ``path.br`` when brotli is installed) next to ``path``."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    written = []
+    with open(path + '.gz', 'wb') as f:
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    written.append(path + '.gz')
+    if brotli is not None:
+        with open(path + '.br', 'wb') as f:
+            f.write(brotli.compress(data, quality=11))
+        written.append(path + '.br')
+    return written
+
+
+def build_css(name, source, used):
+    """Purge, minify and hash one stylesheet. Returns its path relative to STATIC_ROOT."""
+    source_path = finders.find(source)
+    if source_path is None:
+        raise FileNotFoundError(f"Static source '{source}' not found")
+    with open(source_path, encoding='utf-8') as f:
+        css = serialize(purge(parse_css(f.read()), used))
+
+    data = css.encode()
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    stem, ext = os.path.splitext(name)
+    relative = f"assets/{stem}.{digest}{ext}"
+    path = os.path.join(settings.STATIC_ROOT, relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    precompress(path)
+    return relative
+
+
+def build_assets():
+    """Build every entry of ASSET_SOURCES and write the manifest. Returns the manifest."""
+    used = collect_used_classes(settings.ASSET_CONTENT_GLOBS)
+    manifest = {name: build_css(name, source, used) for name, source in settings.ASSET_SOURCES.items()}
+    with open(os.path.join(output_dir(), MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=4)
+    _manifest_cache.clear()
+    return manifest
+
+
+def precompress_static_root():
+    """Precompress collected static files (admin, leaflet, ...) whose variants are missing or stale."""
+    count = 0
+    for root, _, files in os.walk(settings.STATIC_ROOT):
+        for filename in files:
+            path = os.path.join(root, filename)
+            if not filename.endswith(COMPRESSIBLE):
+                continue
+            if os.path.exists(path + '.gz') and os.path.getmtime(path + '.gz') >= os.path.getmtime(path):
+                continue
+            precompress(path)
+            count += 1
+    return count
+
+
+# (mtime, manifest) of the last manifest read by this process
+_manifest_cache = {}
+
+
+def load_manifest():
+    """The build manifest (logical name -> hashed path), reloaded when the file changes."""
+    path = os.path.join(output_dir(), MANIFEST_NAME)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return {}
+    if _manifest_cache.get('mtime') != mtime:
+        with open(path) as f:
+            _manifest_cache.update(mtime=mtime, manifest=json.load(f))
+    return _manifest_cache['manifest']
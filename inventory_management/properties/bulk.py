@@ -0,0 +1,94 @@
+"""
+Set-based bulk changes for accommodations, shared by the admin actions and
+the ``bulk_accommodations`` management command.
+"""
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.utils.timezone import now
+
+from .models import Accommodation
+from .signals import accommodations_bulk_changed
+
+PROPERTY_OWNERS_GROUP = 'Property Owners'
+
+
+def is_property_owner(user):
+    return user.groups.filter(name=PROPERTY_OWNERS_GROUP).exists()
+
+
+def scope_to_user(queryset, user):
+    """Limit an Accommodation queryset to what ``user`` may manage."""
+    if is_property_owner(user):
+        return queryset.filter(user_id=user)
+    return queryset
+
+
+# Keys are compared and ordered in the "C" collation (code point order), the order
+# Python compares strings in, so the next batch starts after the largest key
+# of this one whatever the database collation.
+UPDATE_SQL = """
+UPDATE properties_accommodation acc SET {assignments}
+FROM (
+    SELECT id, feed, location_id_id FROM ({selection}) selection
+    WHERE (feed, id COLLATE "C") > (%s, %s)
+    ORDER BY feed, id COLLATE "C"
+    LIMIT %s
+) batch
+WHERE acc.feed = batch.feed AND acc.id = batch.id
+RETURNING acc.id, acc.feed, batch.location_id_id
+"""
+
+
+def bulk_update(queryset, batch_size=None, **changes):
+    """
+    Apply ``changes`` to every accommodation in ``queryset``, bump
+    ``updated_at`` and send ``accommodations_bulk_changed``. The rows are
+    changed by UPDATE statements filtered by the queryset itself, in batches
+    of ``batch_size`` rows in ``(feed, id)`` order, each batch in its own
+    transaction with its own signal, so a whole-feed change never holds its
+    locks or its keys all at once. Returns the number of updated rows.
+    """
+    batch_size = batch_size or settings.BULK_UPDATE_BATCH_SIZE
+    changes = {**changes, 'updated_at': now()}
+    fields = [Accommodation._meta.get_field(name) for name in changes]
+    assignments = ', '.join(f'{connection.ops.quote_name(field.column)} = %s' for field in fields)
+    values = [
+        field.get_db_prep_save(value.pk if isinstance(value, models.Model) else value, connection)
+        for field, value in zip(fields, changes.values())
+    ]
+    selection, selection_params = queryset.order_by().values('id', 'feed', 'location_id').query.sql_with_params()
+    sql = UPDATE_SQL.format(assignments=assignments, selection=selection)
+    del changes['updated_at']
+
+    count, last = 0, (-1, '')
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(sql, [*values, *selection_params, *last, batch_size])
+            rows = cursor.fetchall()
+            if not rows:
+                return count
+            keys = [(pk, feed) for pk, feed, _ in rows]
+            location_ids = sorted({location_id for _, _, location_id in rows})
+            transaction.on_commit(
+                lambda keys=keys, location_ids=location_ids: accommodations_bulk_changed.send(
+                    sender=Accommodation, keys=keys, changes=changes, location_ids=location_ids
+                )
+            )
+        count += len(rows)
+        last = max((feed, pk) for pk, feed in keys)
+
+
+def publish(queryset, batch_size=None):
+    return bulk_update(queryset.filter(published=False), published=True, batch_size=batch_size)
+
+
+def unpublish(queryset, batch_size=None):
+    return bulk_update(queryset.filter(published=True), published=False, batch_size=batch_size)
+
+
+def reassign_owner(queryset, user, batch_size=None):
+    return bulk_update(queryset, user_id=user, batch_size=batch_size)
+
+
+def move_location(queryset, location, batch_size=None):
+    return bulk_update(queryset, location_id=location, batch_size=batch_size)
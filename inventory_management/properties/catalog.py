@@ -0,0 +1,119 @@
+"""
+Public catalog: a materialized view of the published accommodations only,
+denormalized with their Location breadcrumb and their description in the
+primary language (PUBLIC_CATALOG_LANGUAGE, else the first localization).
+
+Public pages read PublicCatalogEntry instead of the accommodation table, so
+they never touch pages of unpublished feed rows. The view is refreshed with
+``REFRESH MATERIALIZED VIEW CONCURRENTLY`` (readers are never blocked, and
+only rows that differ are written), and only when the change feed has
+entries past the cursor of the previous refresh. The location pages the
+changed accommodations are listed on, before and after the refresh, are
+invalidated once the new rows are visible.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from . import changefeed, page_cache
+from .changefeed import model_label
+from .models import Accommodation, LocalizeAccommodation, Location, PublicCatalogEntry
+
+VIEW = 'properties_publiccatalog'
+
+# Change feed cursor the last refresh covered; without it the next refresh is a full one
+CURSOR_KEY = 'public-catalog-cursor'
+
+CREATE_VIEW_SQL = """
+CREATE MATERIALIZED VIEW properties_publiccatalog AS
+WITH RECURSIVE trail AS (
+    SELECT id, ARRAY[id]::varchar[] AS ids, ARRAY[title]::varchar[] AS titles
+    FROM properties_location
+    WHERE parent_id_id IS NULL
+    UNION ALL
+    SELECT child.id, trail.ids || child.id, trail.titles || child.title
+    FROM properties_location child
+    JOIN trail ON child.parent_id_id = trail.id
+)
+SELECT acc.id, acc.feed, acc.title, acc.country_code, acc.location_id_id, acc.bedroom_count,
+       acc.review_score, acc.usd_rate, acc.center, acc.images, acc.rank_score, acc.created_at, acc.updated_at,
+       coalesce(trail.ids, '{}') AS breadcrumb_ids, coalesce(trail.titles, '{}') AS breadcrumb,
+       localized.language, localized.description
+FROM properties_accommodation acc
+LEFT JOIN trail ON trail.id = acc.location_id_id
+LEFT JOIN LATERAL (
+    SELECT language, description
+    FROM properties_localizeaccommodation
+    WHERE property_id_id = acc.id
+    ORDER BY language = %s DESC, id
+    LIMIT 1
+) localized ON true
+WHERE acc.published;
+
+-- Required by REFRESH ... CONCURRENTLY
+CREATE UNIQUE INDEX publiccatalog_id_uniq ON properties_publiccatalog (id);
+-- Location and country pages, best ranked first, per location of the subtree
+CREATE INDEX publiccatalog_loc_rank_idx ON properties_publiccatalog (location_id_id, rank_score DESC, id);
+"""
+
+DROP_VIEW_SQL = "DROP MATERIALIZED VIEW IF EXISTS properties_publiccatalog"
+
+TRACKED_MODELS = [model_label(model) for model in (Accommodation, LocalizeAccommodation, Location)]
+
+
+def recreate_view(apps=None, schema_editor=None):
+    """
+    Drop the materialized view and create (and populate) it and its indexes
+    from the current definition. Runs from migrations: every change to
+    CREATE_VIEW_SQL ships with a new migration calling it.
+    """
+    db = schema_editor.connection if schema_editor else connection
+    with db.cursor() as cursor:
+        cursor.execute(DROP_VIEW_SQL)
+        cursor.execute(CREATE_VIEW_SQL, [settings.PUBLIC_CATALOG_LANGUAGE])
+
+
+def drop_view(apps=None, schema_editor=None):
+    db = schema_editor.connection if schema_editor else connection
+    with db.cursor() as cursor:
+        cursor.execute(DROP_VIEW_SQL)
+
+
+def changed_location_ids(changes):
+    """
+    Locations whose listings may differ after a refresh: where changed
+    accommodations are now and where the view still lists them. Call it
+    before refreshing.
+    """
+    location_ids, accommodation_ids = set(), set()
+    for object_id, data in changes.filter(model=model_label(Accommodation)).values_list('object_id', 'data').iterator():
+        accommodation_ids.add(object_id)
+        location_ids.add((data or {}).get('location_id'))
+    location_ids.update(Accommodation.objects.filter(pk__in=accommodation_ids).values_list('location_id', flat=True))
+    # A listing that moved is still on its old location's page until the refresh
+    location_ids.update(PublicCatalogEntry.objects.filter(pk__in=accommodation_ids).values_list('location_id', flat=True))
+    location_ids.discard(None)
+    return location_ids
+
+
+def refresh(force=False):
+    """
+    Refresh the view if anything it shows changed since the last refresh (or
+    always with ``force``). Returns whether it was refreshed.
+    """
+    # Every entry up to here committed before the refresh below takes its snapshot
+    covered = changefeed.head()
+    since = cache.get(CURSOR_KEY)
+    if since is None:
+        location_ids = set(Location.objects.values_list('pk', flat=True))
+    else:
+        changes = changefeed.pending(since, TRACKED_MODELS)
+        if not force and not changes.exists():
+            return False
+        location_ids = changed_location_ids(changes)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'REFRESH MATERIALIZED VIEW CONCURRENTLY {VIEW}')
+    cache.set(CURSOR_KEY, covered, None)
+    transaction.on_commit(lambda: page_cache.invalidate(location_ids))
+    return True
@@ -0,0 +1,223 @@
+"""
+Change feed for incremental sync of accommodations and locations.
+
+Every save/delete of a tracked model appends a compact entry to the monthly
+partitioned ``properties_changelog`` table. Consumers page through it with the
+``/api/changes/`` endpoint using an opaque ``(txid, id)`` cursor.
+
+Entries are ordered by the id of the transaction that wrote them, not by
+timestamp, and only entries of transactions older than every transaction
+still in progress (the snapshot's xmin) are served. A transaction that
+commits late can therefore never land behind a cursor a consumer already
+holds, however long it ran.
+"""
+import base64
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.contrib.gis.geos import Point
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.timezone import now
+
+from .models import Accommodation, ChangeLogEntry, LocalizeAccommodation, Location
+
+# Model label in the feed -> model class
+TRACKED_MODELS = {
+    'accommodation': Accommodation,
+    'localizeaccommodation': LocalizeAccommodation,
+    'location': Location,
+}
+
+CREATE_PARENT_SQL = """
+CREATE TABLE IF NOT EXISTS properties_changelog (
+    id BIGSERIAL,
+    changed_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    model VARCHAR(30) NOT NULL,
+    object_id VARCHAR(20) NOT NULL,
+    action CHAR(1) NOT NULL,
+    data JSONB,
+    txid BIGINT NOT NULL DEFAULT txid_current(),
+    PRIMARY KEY (changed_at, id)
+) PARTITION BY RANGE (changed_at);
+
+-- Feed order; created on every partition
+CREATE INDEX IF NOT EXISTS properties_changelog_txid_idx ON properties_changelog (txid, id);
+
+-- Catches rows whose month partition has not been created yet
+CREATE TABLE IF NOT EXISTS properties_changelog_default
+    PARTITION OF properties_changelog DEFAULT;
+"""
+
+
+def _month_start(value):
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(value):
+    return _month_start(_month_start(value) + timedelta(days=32))
+
+
+def partition_name(month, table='properties_changelog'):
+    return f"{table}_{month:%Y_%m}"
+
+
+def create_month_partitions(table, months_ahead=2):
+    """Monthly partitions of a range-partitioned ``table`` from this month up to ``months_ahead``."""
+    month = _month_start(now())
+    with connection.cursor() as cursor:
+        for _ in range(months_ahead + 1):
+            upper = _next_month(month)
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {partition_name(month, table)} "
+                f"PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)",
+                [month, upper],
+            )
+            month = upper
+
+
+def ensure_partitions(months_ahead=2):
+    """Create the partitioned parent table and monthly partitions up to ``months_ahead``."""
+    with connection.cursor() as cursor:
+        cursor.execute(CREATE_PARENT_SQL)
+    create_month_partitions('properties_changelog', months_ahead)
+
+
+def drop_partitions_before(cutoff, table='properties_changelog'):
+    """Drop whole monthly partitions of ``table`` that end before ``cutoff``. Returns their names."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = %s
+              AND child.relname ~ ('^' || %s || '_[0-9]{4}_[0-9]{2}$')
+            """,
+            [table, table],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+        dropped = []
+        for name in sorted(names):
+            month = datetime.strptime(name[-7:], '%Y_%m').replace(tzinfo=cutoff.tzinfo)
+            if _next_month(month) <= cutoff:
+                cursor.execute(f"DROP TABLE {name}")
+                dropped.append(name)
+    return dropped
+
+
+def serialize_value(value):
+    if isinstance(value, Point):
+        return [round(value.x, 6), round(value.y, 6)]
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return getattr(value, 'pk', value)
+
+
+def serialize(instance):
+    """Compact dict of an instance's concrete fields, foreign keys as ids."""
+    data = {
+        field.name: serialize_value(field.value_from_object(instance))
+        for field in instance._meta.concrete_fields
+        if not field.primary_key
+    }
+    if 'amenity_ids' in data:
+        # Consumers keep receiving amenity names, not dictionary ids
+        del data['amenity_ids'], data['legacy_amenities']
+        data['amenities'] = instance.amenities
+    if 'legacy_policy' in data:
+        # ... and full policy documents, not Policy ids
+        del data['policy_id'], data['legacy_policy']
+        data['policy'] = instance.policy
+    return data
+
+
+def model_label(model):
+    return model._meta.model_name
+
+
+def record_save(sender, instance, **kwargs):
+    ChangeLogEntry.objects.create(
+        changed_at=getattr(instance, 'updated_at', None) or now(),
+        model=model_label(sender),
+        object_id=str(instance.pk),
+        action=ChangeLogEntry.UPSERT,
+        data=serialize(instance),
+    )
+
+
+def record_delete(sender, instance, **kwargs):
+    ChangeLogEntry.objects.create(
+        changed_at=now(),
+        model=model_label(sender),
+        object_id=str(instance.pk),
+        action=ChangeLogEntry.DELETE,
+    )
+
+
+def record_bulk_change(sender, keys, changes, **kwargs):
+    """Log only the changed fields for a set-based accommodation update."""
+    delta = {name: serialize_value(value) for name, value in changes.items()}
+    rows = Accommodation.objects.for_keys(keys).values_list('pk', 'updated_at')
+    ChangeLogEntry.objects.bulk_create(
+        [
+            ChangeLogEntry(
+                changed_at=updated_at,
+                model=model_label(sender),
+                object_id=pk,
+                action=ChangeLogEntry.UPSERT,
+                data={**delta, 'updated_at': updated_at.isoformat()},
+            )
+            for pk, updated_at in rows.iterator(chunk_size=5000)
+        ],
+        batch_size=5000,
+    )
+
+
+def encode_cursor(txid, entry_id):
+    raw = f"{txid}|{entry_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return ``(txid, id)`` from an opaque cursor. Raises ValueError if malformed."""
+    padded = cursor + '=' * (-len(cursor) % 4)
+    txid, entry_id = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+    return int(txid), int(entry_id)
+
+
+def committed():
+    """
+    Entries whose transaction ended before every transaction still in progress
+    began, plus the current transaction's own. Anything later may still be
+    joined by entries with smaller transaction ids.
+    """
+    return Q(txid__lt=RawSQL('txid_snapshot_xmin(txid_current_snapshot())', [])) | Q(
+        txid=RawSQL('txid_current_if_assigned()', [])
+    )
+
+
+def pending(cursor=None, models=None):
+    """Committed entries after ``cursor``, as a queryset in ``(txid, id)`` order."""
+    queryset = ChangeLogEntry.objects.filter(committed())
+    if cursor:
+        txid, entry_id = decode_cursor(cursor)
+        queryset = queryset.filter(txid__gte=txid).filter(Q(txid__gt=txid) | Q(txid=txid, id__gt=entry_id))
+    if models:
+        queryset = queryset.filter(model__in=models)
+    return queryset.order_by('txid', 'id')
+
+
+def head():
+    """Cursor of the last committed entry, or ``''`` (the start) if there is none."""
+    entry = pending().last()
+    return encode_cursor(entry.txid, entry.id) if entry else ''
+
+
+def changes_since(cursor=None, models=None, limit=1000):
+    """Committed entries after ``cursor`` in ``(txid, id)`` order."""
+    return list(pending(cursor, models)[:limit])
@@ -0,0 +1,72 @@
+"""
+HTTP validators (ETag/Last-Modified) for responses about accommodations and
+locations. Views compute them from cheap indexed aggregates and version
+tokens before doing any rendering, and answer 304 when nothing changed.
+"""
+import hashlib
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(*parts):
+    return hashlib.md5('|'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def last_updated(queryset):
+    """``max(updated_at)`` and row count of a queryset, in one aggregate."""
+    result = queryset.order_by().aggregate(last_modified=Max('updated_at'), count=Count('pk'))
+    return result['last_modified'], result['count']
+
+
+def latest(*datetimes):
+    datetimes = [dt for dt in datetimes if dt is not None]
+    return max(datetimes) if datetimes else None
+
+
+def set_cache_headers(request, response):
+    """Shared caches may keep anonymous responses briefly; authenticated ones revalidate privately."""
+    if request.user.is_authenticated:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, public=True, max_age=settings.HTTP_CACHE_MAX_AGE)
+    patch_vary_headers(response, ['Cookie'])
+
+
+class ConditionalMixin:
+    """
+    Answers conditional GET/HEAD requests from ``get_validators`` without
+    calling the view, and adds ETag, Last-Modified and Cache-Control headers
+    to full responses.
+    """
+
+    def get_validators(self, request, *args, **kwargs):
+        """Return ``(etag, last_modified)``; either may be None."""
+        return None, None
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+
+        etag, last_modified = self.get_validators(request, *args, **kwargs)
+        etag = quote_etag(etag) if etag else None
+        if last_modified is not None:
+            if timezone.is_naive(last_modified):
+                last_modified = timezone.make_aware(last_modified, dt_timezone.utc)
+            last_modified = int(last_modified.timestamp())
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().dispatch(request, *args, **kwargs)
+            if response.status_code == 200:
+                if etag and not response.has_header('ETag'):
+                    response.headers['ETag'] = etag
+                if last_modified and not response.has_header('Last-Modified'):
+                    response.headers['Last-Modified'] = http_date(last_modified)
+        if response.status_code in (200, 304):
+            set_cache_headers(request, response)
+        return response
@@ -1,6 +1,8 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
+from . import area_search
+from .models import Accommodation, LocalizeAccommodation, SavedAreaSearch
 
 class CustomUserCreationForm(UserCreationForm):
     class Meta:
@@ -40,3 +42,83 @@ class CustomUserCreationForm(UserCreationForm):
         self.fields['email'].label = "Email Address"
         self.fields['password1'].label = "Password"
         self.fields['password2'].label = "Confirm Password"
+
+
+class ReassignOwnerForm(forms.Form):
+    """Intermediate form for the "reassign owner" accommodation admin action."""
+    user = forms.ModelChoiceField(
+        queryset=User.objects.filter(is_active=True).order_by('username'),
+        label="New owner"
+    )
+
+
+class MoveLocationForm(forms.Form):
+    """Intermediate form for the "move to location" accommodation admin action."""
+    location = forms.CharField(max_length=20, label="New location ID")
+
+    def clean_location(self):
+        from .models import Location
+
+        location_id = self.cleaned_data['location']
+        try:
+            return Location.objects.get(pk=location_id)
+        except Location.DoesNotExist:
+            raise forms.ValidationError(f"Location '{location_id}' does not exist.")
+
+
+class AccommodationAdminForm(forms.ModelForm):
+    """Edits the dictionary-encoded amenities as a JSON list of names, as before."""
+    amenities = forms.JSONField(required=False, help_text="JSON array of amenity names.")
+
+    class Meta:
+        model = Accommodation
+        fields = '__all__'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.initial.setdefault('amenities', self.instance.amenities)
+
+    def clean_amenities(self):
+        amenities = self.cleaned_data['amenities'] or []
+        if not isinstance(amenities, list):
+            raise forms.ValidationError("Enter a JSON array of amenity names.")
+        return amenities
+
+    def save(self, commit=True):
+        self.instance.amenities = self.cleaned_data['amenities']
+        return super().save(commit)
+
+
+class LocalizeAccommodationAdminForm(forms.ModelForm):
+    """Edits the policy as a JSON document; saving stores it in the policy store."""
+    policy = forms.JSONField(help_text="JSON object with the property's policies.")
+
+    class Meta:
+        model = LocalizeAccommodation
+        fields = '__all__'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.initial.setdefault('policy', self.instance.policy)
+
+    def clean_policy(self):
+        # Assigned before model validation, which requires a policy
+        self.instance.policy = self.cleaned_data['policy']
+        return self.cleaned_data['policy']
+
+
+class SavedAreaSearchAdminForm(forms.ModelForm):
+    """Validates and simplifies the drawn polygon like /api/area-search/ does."""
+
+    class Meta:
+        model = SavedAreaSearch
+        fields = '__all__'
+
+    def clean_geometry(self):
+        try:
+            geometry, self.instance.original_vertex_count = area_search.prepare(self.cleaned_data['geometry'])
+        except area_search.InvalidArea as e:
+            raise forms.ValidationError(str(e))
+        return geometry
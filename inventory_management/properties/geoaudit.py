@@ -0,0 +1,127 @@
+"""
+Consistency audit of accommodations against their locations.
+
+Each feed partition is streamed through a server-side cursor in large
+chunks; every chunk becomes NumPy columns, and haversine distances, per
+location type thresholds (GEO_AUDIT_MAX_DISTANCE_KM) and country code
+mismatches are computed for the whole chunk at once. Only the flagged rows
+are turned back into Python objects and stored as GeoConsistencyIssue rows
+of a GeoAuditRun.
+"""
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, FloatField, Func, Value
+from django.db.models.functions import Coalesce, Upper
+
+from .models import Accommodation, GeoAuditRun, GeoConsistencyIssue
+from .partitions import map_partitions
+
+EARTH_RADIUS_KM = 6371.0088
+
+COLUMNS = (
+    'pk', 'location_id', 'loc_type', 'acc_country', 'loc_country', 'acc_lon', 'acc_lat', 'loc_lon', 'loc_lat',
+)
+
+
+def coordinate(function, field):
+    return Func(F(field), function=function, output_field=FloatField())
+
+
+def audit_rows(queryset):
+    """The columns of COLUMNS for ``queryset``, computed in SQL so no geometry reaches Python."""
+    return queryset.annotate(
+        loc_type=F('location_id__location_type'),
+        acc_country=Upper('country_code'),
+        loc_country=Coalesce(Upper('location_id__country_code'), Value('')),
+        acc_lon=coordinate('ST_X', 'center'),
+        acc_lat=coordinate('ST_Y', 'center'),
+        loc_lon=coordinate('ST_X', 'location_id__center'),
+        loc_lat=coordinate('ST_Y', 'location_id__center'),
+    ).values_list(*COLUMNS).order_by()
+
+
+def haversine_km(lon1, lat1, lon2, lat2):
+    """Great-circle distances between arrays of points given in degrees."""
+    lon1, lat1, lon2, lat2 = (np.radians(a) for a in (lon1, lat1, lon2, lat2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def check_chunk(rows, thresholds):
+    """
+    Flag the rows of one chunk: returns issue dicts for rows that are farther
+    from their location than its type allows, or in another country.
+    """
+    columns = dict(zip(COLUMNS, zip(*rows)))
+    coordinates = [np.asarray(columns[name], dtype=np.float64) for name in ('acc_lon', 'acc_lat', 'loc_lon', 'loc_lat')]
+    distance = haversine_km(*coordinates)
+
+    types = np.asarray(columns['loc_type'], dtype=object)
+    limit = np.full(len(rows), np.inf)
+    for location_type, max_km in thresholds.items():
+        limit[types == location_type] = max_km
+    too_far = distance > limit
+
+    acc_country = np.asarray(columns['acc_country'], dtype='U2')
+    loc_country = np.asarray(columns['loc_country'], dtype='U2')
+    country_mismatch = (loc_country != '') & (acc_country != loc_country)
+
+    return [
+        {
+            'property_id_id': columns['pk'][i],
+            'location_id_id': columns['location_id'][i],
+            'location_type': types[i],
+            'distance_km': round(float(distance[i]), 3),
+            'max_distance_km': float(limit[i]) if np.isfinite(limit[i]) else None,
+            'too_far': bool(too_far[i]),
+            'country_mismatch': bool(country_mismatch[i]),
+            'accommodation_country': acc_country[i],
+            'location_country': loc_country[i],
+        }
+        for i in np.flatnonzero(too_far | country_mismatch)
+    ]
+
+
+def scan(queryset, thresholds, chunk_size):
+    """``(rows checked, issues)`` for one queryset, streamed ``chunk_size`` rows at a time."""
+    sql, params = audit_rows(queryset).query.sql_with_params()
+    checked, issues = 0, []
+    with connections[queryset.db].chunked_cursor() as cursor:
+        cursor.execute(sql, params)
+        while rows := cursor.fetchmany(chunk_size):
+            checked += len(rows)
+            issues += check_chunk(rows, thresholds)
+    return checked, issues
+
+
+def audit(thresholds=None, chunk_size=100000, workers=None):
+    """Scan every accommodation, partitions concurrently, and store the findings as a new GeoAuditRun."""
+    thresholds = {**settings.GEO_AUDIT_MAX_DISTANCE_KM, **(thresholds or {})}
+    started = time.perf_counter()
+    checked, issues = map_partitions(
+        Accommodation.objects.all(),
+        lambda queryset: scan(queryset, thresholds, chunk_size),
+        merge=lambda a, b: (a[0] + b[0], a[1] + b[1]),
+        workers=workers,
+    )
+    with transaction.atomic():
+        run = GeoAuditRun.objects.create(
+            duration=time.perf_counter() - started,
+            checked_count=checked,
+            issue_count=len(issues),
+            thresholds=thresholds,
+        )
+        GeoConsistencyIssue.objects.bulk_create(
+            [GeoConsistencyIssue(run=run, **issue) for issue in issues], batch_size=5000
+        )
+    return run
+
+
+def prune_runs(keep):
+    """Delete all but the ``keep`` most recent runs (and their issues)."""
+    old = GeoAuditRun.objects.order_by('-started_at').values_list('pk', flat=True)[keep:]
+    _, deleted = GeoAuditRun.objects.filter(pk__in=list(old)).delete()
+    return deleted.get(GeoAuditRun._meta.label, 0)
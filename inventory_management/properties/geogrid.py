@@ -0,0 +1,176 @@
+"""
+Multi-resolution rollups of published accommodations per geohash cell.
+
+GeoGridCell holds count, price and review sums per cell for levels 1 to
+GEOGRID_MAX_LEVEL. Saves and deletes apply their delta in the same
+transaction; bulk (un)publishing applies it after commit. ``rebuild``
+recomputes everything from the accommodation table.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.gis.geos import Polygon
+from django.db import connection, transaction
+from django.db.models import Sum
+
+from .geohash import PRECISION, cell_size
+from .models import Accommodation, GeoGridCell
+
+UPSERT_SQL = """
+INSERT INTO properties_geogridcell AS cell
+    (level, cell, center, accommodation_count, usd_rate_sum, review_score_sum,
+     avg_usd_rate, avg_review_score, updated_at)
+VALUES (%(level)s, %(cell)s, ST_PointFromGeoHash(%(cell)s), %(count)s, %(rate)s, %(review)s,
+        %(rate)s::numeric / NULLIF(%(count)s, 0), %(review)s::numeric / NULLIF(%(count)s, 0), now())
+ON CONFLICT (level, cell) DO UPDATE SET
+    accommodation_count = cell.accommodation_count + EXCLUDED.accommodation_count,
+    usd_rate_sum = cell.usd_rate_sum + EXCLUDED.usd_rate_sum,
+    review_score_sum = cell.review_score_sum + EXCLUDED.review_score_sum,
+    avg_usd_rate = (cell.usd_rate_sum + EXCLUDED.usd_rate_sum)
+        / NULLIF(cell.accommodation_count + EXCLUDED.accommodation_count, 0),
+    avg_review_score = (cell.review_score_sum + EXCLUDED.review_score_sum)
+        / NULLIF(cell.accommodation_count + EXCLUDED.accommodation_count, 0),
+    updated_at = now()
+"""
+
+REBUILD_SQL = """
+INSERT INTO properties_geogridcell
+    (level, cell, center, accommodation_count, usd_rate_sum, review_score_sum,
+     avg_usd_rate, avg_review_score, updated_at)
+SELECT level, cell, ST_PointFromGeoHash(cell), count(*), sum(usd_rate), sum(review_score),
+       avg(usd_rate), avg(review_score), now()
+FROM (
+    SELECT level, left(acc.geohash, level) AS cell, acc.usd_rate, coalesce(acc.review_score, 0) AS review_score
+    FROM properties_accommodation acc
+    CROSS JOIN generate_series(1, %(max_level)s) AS level
+    WHERE acc.published AND acc.geohash <> ''
+) cells
+GROUP BY level, cell
+"""
+
+BACKFILL_SQL = """
+UPDATE properties_accommodation SET geohash = ST_GeoHash(center, %(precision)s)
+WHERE geohash = '' OR geohash IS NULL
+"""
+
+
+def as_decimal(value):
+    """
+    A price or score as a Decimal. Unsaved instances can still hold the float
+    or string they were assigned, and Decimal refuses to add either.
+    """
+    return Decimal(str(value)) if value else Decimal(0)
+
+
+def contribution(rows, sign):
+    """Per ``(level, cell)`` deltas of ``(geohash, usd_rate, review_score)`` rows."""
+    deltas = {}
+    for geohash, usd_rate, review_score in rows:
+        if not geohash:
+            continue
+        usd_rate, review_score = as_decimal(usd_rate), as_decimal(review_score)
+        for level in range(1, settings.GEOGRID_MAX_LEVEL + 1):
+            delta = deltas.setdefault((level, geohash[:level]), [0, Decimal(0), Decimal(0)])
+            delta[0] += sign
+            delta[1] += sign * usd_rate
+            delta[2] += sign * review_score
+    return deltas
+
+
+def apply_deltas(*deltas):
+    """Add deltas to the rollups and drop cells left empty."""
+    combined = {}
+    for delta in deltas:
+        for key, (count, rate, review) in delta.items():
+            total = combined.setdefault(key, [0, Decimal(0), Decimal(0)])
+            total[0] += count
+            total[1] += rate
+            total[2] += review
+    # A fixed order keeps concurrent upserts from deadlocking
+    params = [
+        {'level': level, 'cell': cell, 'count': count, 'rate': rate, 'review': review}
+        for (level, cell), (count, rate, review) in sorted(combined.items())
+        if count or rate or review
+    ]
+    if not params:
+        return
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(UPSERT_SQL, params)
+        GeoGridCell.objects.filter(
+            cell__in={p['cell'] for p in params}, accommodation_count__lte=0
+        ).delete()
+
+
+def rebuild():
+    """Recompute every cell from the accommodation table. Returns the number of cells."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(BACKFILL_SQL, {'precision': PRECISION})
+        GeoGridCell.objects.all().delete()
+        cursor.execute(REBUILD_SQL, {'max_level': settings.GEOGRID_MAX_LEVEL})
+        return cursor.rowcount
+
+
+def remember_previous_contribution(sender, instance, **kwargs):
+    """pre_save: what an existing accommodation contributed before this save."""
+    if not instance._state.adding:
+        instance._previous_geogrid_row = (
+            Accommodation.objects.filter(pk=instance.pk, published=True)
+            .values_list('geohash', 'usd_rate', 'review_score')
+            .first()
+        )
+
+
+def accommodation_saved(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_geogrid_row', None)
+    current = (instance.geohash, instance.usd_rate, instance.review_score)
+    apply_deltas(
+        contribution([previous] if previous else [], -1),
+        contribution([current] if instance.published else [], 1),
+    )
+
+
+def accommodation_deleted(sender, instance, **kwargs):
+    if instance.published:
+        apply_deltas(contribution([(instance.geohash, instance.usd_rate, instance.review_score)], -1))
+
+
+def accommodations_bulk_changed(sender, keys, changes, **kwargs):
+    # bulk.publish/unpublish only touch rows whose flag actually flips
+    if 'published' in changes:
+        rows = Accommodation.objects.for_keys(keys).values_list('geohash', 'usd_rate', 'review_score')
+        apply_deltas(contribution(rows, 1 if changes['published'] else -1))
+
+
+def level_for_bbox(bbox, max_cells=None):
+    """The finest level at which ``bbox`` spans at most ``max_cells`` cells."""
+    max_cells = max_cells or settings.GEOGRID_MAX_CELLS
+    west, south, east, north = bbox
+    level = 1
+    while level < settings.GEOGRID_MAX_LEVEL:
+        width, height = cell_size(level + 1)
+        if ((east - west) / width + 1) * ((north - south) / height + 1) > max_cells:
+            break
+        level += 1
+    return level
+
+
+def cells_in_bbox(bbox, level):
+    """Cells of ``level`` overlapping ``bbox`` (west, south, east, north)."""
+    west, south, east, north = bbox
+    half_width, half_height = (size / 2 for size in cell_size(level))
+    area = Polygon.from_bbox((west - half_width, south - half_height, east + half_width, north + half_height))
+    area.srid = 4326
+    return GeoGridCell.objects.filter(level=level, center__intersects=area)
+
+
+def summarize(cells):
+    """Totals over cells: count and average rate/review, weighted by accommodation counts."""
+    totals = cells.aggregate(
+        count=Sum('accommodation_count'), rate=Sum('usd_rate_sum'), review=Sum('review_score_sum')
+    )
+    count = totals['count'] or 0
+    return {
+        'accommodation_count': count,
+        'avg_usd_rate': float(totals['rate']) / count if count else None,
+        'avg_review_score': float(totals['review']) / count if count else None,
+    }
@@ -0,0 +1,52 @@
+"""
+Geohash encoding (the same cells as PostGIS ST_GeoHash / ST_PointFromGeoHash).
+A hash's prefixes are the cells containing it at coarser levels.
+"""
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# Precision stored on Accommodation.geohash (~5 m cells)
+PRECISION = 9
+
+
+def encode(lon, lat, precision=PRECISION):
+    lon_range, lat_range = [-180.0, 180.0], [-90.0, 90.0]
+    chars, value, bit, even = [], 0, 0, True
+    while len(chars) < precision:
+        interval, coordinate = (lon_range, lon) if even else (lat_range, lat)
+        mid = (interval[0] + interval[1]) / 2
+        if coordinate >= mid:
+            value = value * 2 + 1
+            interval[0] = mid
+        else:
+            value *= 2
+            interval[1] = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(BASE32[value])
+            value, bit = 0, 0
+    return ''.join(chars)
+
+
+def bounds(geohash):
+    """``(west, south, east, north)`` of a cell."""
+    lon_range, lat_range = [-180.0, 180.0], [-90.0, 90.0]
+    even = True
+    for char in geohash:
+        value = BASE32.index(char)
+        for shift in range(4, -1, -1):
+            interval = lon_range if even else lat_range
+            mid = (interval[0] + interval[1]) / 2
+            if value >> shift & 1:
+                interval[0] = mid
+            else:
+                interval[1] = mid
+            even = not even
+    return lon_range[0], lat_range[0], lon_range[1], lat_range[1]
+
+
+def cell_size(level):
+    """Width and height in degrees of the cells of a level."""
+    lon_bits = (5 * level + 1) // 2
+    lat_bits = 5 * level // 2
+    return 360.0 / 2 ** lon_bits, 180.0 / 2 ** lat_bits
@@ -0,0 +1,233 @@
+"""
+Database-backed background job queue.
+
+Jobs are rows in the ``Job`` table. Workers started with ``manage.py run_workers``
+claim runnable rows with ``SELECT ... FOR UPDATE SKIP LOCKED`` so several worker
+processes (or hosts) can share the queue without an external broker.
+"""
+import logging
+import os
+import socket
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils.timezone import now
+
+from .models import Job
+from .routers import use_primary
+
+logger = logging.getLogger(__name__)
+
+# Registered job handlers, keyed by Job.kind
+_handlers = {}
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job once cancellation has been requested."""
+
+
+class JobFailed(Exception):
+    """Raised by a handler to fail a job permanently, without further retries."""
+
+
+def register(kind, read_only=False):
+    """
+    Decorator registering ``func(ctx, **payload)`` as the handler for ``kind``.
+    Handlers that only read may use the read replicas; all others read from the
+    primary so they never act on stale rows.
+    """
+    def decorator(func):
+        func.read_only = read_only
+        _handlers[kind] = func
+        return func
+    return decorator
+
+
+def get_handler(kind):
+    try:
+        return _handlers[kind]
+    except KeyError:
+        raise LookupError(f"No job handler registered for '{kind}'")
+
+
+def enqueue(kind, payload=None, user=None, max_attempts=None, run_after=None):
+    """Create a queued job and return it. The handler must already be registered."""
+    get_handler(kind)
+    return Job.objects.create(
+        kind=kind,
+        payload=payload or {},
+        created_by=user,
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+        run_after=run_after or now(),
+    )
+
+
+def enqueue_unique(kind, payload=None, user=None, run_after=None):
+    """Enqueue a job unless an identical one is already waiting to run."""
+    existing = Job.objects.filter(kind=kind, payload=payload or {}, status=Job.QUEUED).first()
+    return existing or enqueue(kind, payload, user=user, run_after=run_after)
+
+
+def cancel(job):
+    """
+    Cancel a job. Queued jobs are cancelled immediately, running jobs are
+    flagged and stop at their next progress checkpoint.
+    """
+    with transaction.atomic():
+        job = Job.objects.select_for_update().get(pk=job.pk)
+        if job.status == Job.QUEUED:
+            job.status = Job.CANCELLED
+            job.finished_at = now()
+            job.save(update_fields=['status', 'finished_at'])
+        elif job.status == Job.RUNNING:
+            job.cancel_requested = True
+            job.save(update_fields=['cancel_requested'])
+    return job
+
+
+def retry(job):
+    """Put a failed or cancelled job back on the queue."""
+    Job.objects.filter(pk=job.pk, status__in=[Job.FAILED, Job.CANCELLED]).update(
+        status=Job.QUEUED,
+        attempts=0,
+        cancel_requested=False,
+        error='',
+        progress=0,
+        progress_message='',
+        run_after=now(),
+        finished_at=None,
+    )
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_job(worker):
+    """Atomically move the next runnable job to RUNNING and return it, or None."""
+    with transaction.atomic():
+        job = (
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status=Job.QUEUED, run_after__lte=now())
+            .order_by('run_after', 'id')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = Job.RUNNING
+        job.attempts += 1
+        job.locked_by = worker
+        job.started_at = job.heartbeat_at = now()
+        job.save(update_fields=['status', 'attempts', 'locked_by', 'started_at', 'heartbeat_at'])
+        return job
+
+
+def heartbeat(job_ids, worker):
+    """
+    Refresh the heartbeat of jobs this worker is running. Sent by the
+    run_workers parent for every job in flight, so long handlers that rarely
+    report progress are not mistaken for dead ones.
+    """
+    return Job.objects.filter(pk__in=job_ids, status=Job.RUNNING, locked_by=worker).update(heartbeat_at=now())
+
+
+def owned(job):
+    """The job's row while it is still RUNNING under the claim ``job`` was loaded with."""
+    return Job.objects.filter(pk=job.pk, status=Job.RUNNING, locked_by=job.locked_by)
+
+
+def requeue_stale_jobs():
+    """Recover jobs whose worker died without reporting back (no heartbeat)."""
+    cutoff = now() - timedelta(seconds=settings.JOB_STALE_TIMEOUT)
+    stale = Job.objects.filter(status=Job.RUNNING, heartbeat_at__lt=cutoff)
+    count = 0
+    for job in stale:
+        record_failure(job, f"Worker {job.locked_by} stopped responding.")
+        count += 1
+    return count
+
+
+class JobContext:
+    """Handed to job handlers for progress reporting and cancellation checks."""
+
+    def __init__(self, job):
+        self.job = job
+
+    def set_progress(self, progress, message=''):
+        """
+        Record progress (0-100) and refresh the heartbeat. Raises JobCancelled
+        if cancellation was requested from the admin.
+        """
+        progress = max(0, min(100, int(progress)))
+        owned(self.job).update(
+            progress=progress,
+            progress_message=message[:255],
+            heartbeat_at=now(),
+        )
+        self.check_cancelled()
+
+    def check_cancelled(self):
+        if Job.objects.filter(pk=self.job.pk, cancel_requested=True).exists():
+            raise JobCancelled()
+
+
+def record_failure(job, error):
+    """Schedule a retry with exponential backoff, or mark the job failed."""
+    fields = {'error': error, 'locked_by': '', 'heartbeat_at': None}
+    if job.attempts < job.max_attempts and not job.cancel_requested:
+        delay = settings.JOB_RETRY_BACKOFF * 2 ** (job.attempts - 1)
+        fields.update(status=Job.QUEUED, run_after=now() + timedelta(seconds=delay))
+    else:
+        fields.update(status=Job.FAILED, finished_at=now())
+    # A job requeued as stale may already be running elsewhere; leave that claim alone
+    owned(job).update(**fields)
+
+
+def execute_job(job_id, worker=None):
+    """
+    Run a claimed job to completion. This is the entry point executed inside
+    the worker process pool, so it only takes and returns plain values.
+    With ``worker``, the job only runs if that worker still holds the claim.
+    Every final update is conditional on the claim, so a run that outlived
+    its claim cannot overwrite the job's new run.
+    """
+    close_old_connections()
+    job = Job.objects.get(pk=job_id)
+    if job.status != Job.RUNNING or (worker is not None and job.locked_by != worker):
+        return job.status
+    ctx = JobContext(job)
+    try:
+        handler = get_handler(job.kind)
+        ctx.check_cancelled()
+        if handler.read_only:
+            result = handler(ctx, **job.payload)
+        else:
+            with use_primary():
+                result = handler(ctx, **job.payload)
+    except JobCancelled:
+        owned(job).update(
+            status=Job.CANCELLED, finished_at=now(), locked_by='', heartbeat_at=None
+        )
+        return Job.CANCELLED
+    except JobFailed as e:
+        owned(job).update(
+            status=Job.FAILED, error=str(e), finished_at=now(), locked_by='', heartbeat_at=None
+        )
+        return Job.FAILED
+    except Exception:
+        logger.exception("Job %s (%s) failed", job.pk, job.kind)
+        record_failure(job, traceback.format_exc())
+        return Job.FAILED
+
+    owned(job).update(
+        status=Job.SUCCEEDED,
+        progress=100,
+        result=result,
+        error='',
+        finished_at=now(),
+        locked_by='',
+        heartbeat_at=None,
+    )
+    return Job.SUCCEEDED
@@ -0,0 +1,113 @@
+"""
+Queries behind the public listing API (``/api/accommodations``).
+
+Results are ordered by one of SORTS with ``id`` as tiebreaker, both in the
+same direction, and paginated with keyset cursors: a cursor holds the sort
+key of the last row returned and the next page starts strictly after it, so
+deep pages cost the same as the first. The ``acc_pub_*_cover_idx`` indexes
+(partial on published rows; optionally country, then the sort key and id)
+include every column of the response, so public pages are read with
+index-only scans that never visit unpublished rows.
+"""
+import base64
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Accommodation
+
+# name -> (field, descending)
+SORTS = {
+    'price': ('usd_rate', False),
+    '-price': ('usd_rate', True),
+    'rating': ('review_score', True),
+    'recent': ('created_at', True),
+}
+
+DEFAULT_SORT = 'recent'
+
+FIELDS = ('id', 'title', 'country_code', 'location_id', 'usd_rate', 'review_score', 'bedroom_count', 'created_at')
+
+PARSERS = {
+    'usd_rate': Decimal,
+    'review_score': Decimal,
+    'created_at': datetime.fromisoformat,
+}
+
+
+def encode_cursor(sort, row):
+    field, _ = SORTS[sort]
+    raw = json.dumps([sort, str(row[field]) if field != 'created_at' else row[field].isoformat(), row['id']])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    """Return ``(sort key, id)`` from an opaque cursor. Raises ValueError if malformed or for another sort."""
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        cursor_sort, value, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        field, _ = SORTS[sort]
+        value = PARSERS[field](value)
+    except (TypeError, KeyError, ArithmeticError, json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise ValueError('Malformed cursor') from e
+    if cursor_sort != sort:
+        raise ValueError('Cursor belongs to another sort order')
+    return value, str(pk)
+
+
+# A location and everything below it, walked by the database from one bound id
+# (over the parent_id index), so the statement is the same size for a city or
+# a whole country.
+SUBTREE_SQL = """
+WITH RECURSIVE subtree(id) AS (
+    SELECT id FROM properties_location WHERE id = %s
+    UNION ALL
+    SELECT child.id FROM properties_location child JOIN subtree ON child.parent_id_id = subtree.id
+)
+SELECT id FROM subtree
+"""
+
+
+def subtree_ids(location_id):
+    """Subquery of the ids in a location's subtree, for ``__in`` lookups."""
+    return RawSQL(SUBTREE_SQL, [location_id])
+
+
+def subtree_filter(index, location_id):
+    """
+    Filter for accommodations anywhere below a location, countries included:
+    the same Location subtree that page invalidation, ``Last-Modified`` and
+    the ETag follow, whatever the rows' own ``country_code`` says.
+    """
+    if index.find(location_id) is None:
+        return None
+    return Q(location_id__in=subtree_ids(location_id))
+
+
+def after(sort, cursor):
+    """Rows strictly after ``cursor`` in ``sort`` order."""
+    field, descending = SORTS[sort]
+    value, pk = decode_cursor(cursor, sort)
+    op = 'lt' if descending else 'gt'
+    # The plain bound becomes the index condition, the OR only filters its edge
+    return Q(**{f'{field}__{op}e': value}) & (
+        Q(**{f'{field}__{op}': value}) | Q(**{field: value, f'id__{op}': pk})
+    )
+
+
+def page(filters, sort=DEFAULT_SORT, cursor=None, limit=50):
+    """
+    One page of listing rows as dicts (from ``values()``, no model instances)
+    and the cursor of the next page, or None on the last page.
+    """
+    field, descending = SORTS[sort]
+    queryset = Accommodation.objects.filter(filters)
+    if cursor:
+        queryset = queryset.filter(after(sort, cursor))
+    ordering = [f'-{field}', '-id'] if descending else [field, 'id']
+    rows = list(queryset.order_by(*ordering).values(*FIELDS)[:limit + 1])
+    next_cursor = encode_cursor(sort, rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
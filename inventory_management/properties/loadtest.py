@@ -0,0 +1,339 @@
+"""
+End-to-end load generator for ``manage.py loadtest``.
+
+Virtual users run weighted scenarios (anonymous browsing, login, signup,
+admin changelist and search) over keep-alive HTTP connections against the
+app served through ``inventory_management.wsgi`` or ``.asgi`` on a local port,
+or against an external URL. Latencies are collected per endpoint and
+summarized as throughput and p50/p95/p99.
+"""
+import http.client
+import importlib.util
+import json
+import math
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+# Prefix of the users created by the signup scenario (``--cleanup`` deletes them)
+SIGNUP_PREFIX = 'loadtest-'
+
+DEFAULT_MIX = {'browse': 70, 'login': 10, 'signup': 5, 'admin': 15}
+
+
+def serve_wsgi(host, port):
+    """Serve ``inventory_management.wsgi.application`` with Django's threaded server (child process)."""
+    from django.core.servers.basehttp import WSGIRequestHandler, run
+    from inventory_management.wsgi import application
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    run(host, port, application, threading=True, handler=QuietHandler)
+
+
+# Server kind -> module run with ``python -m``
+SERVER_MODULES = {'asgi': 'uvicorn', 'gunicorn': 'gunicorn'}
+
+
+def start_server(kind, host, port, workers=1):
+    """Start the app in a separate process and wait until it accepts connections."""
+    module = SERVER_MODULES.get(kind)
+    if module and importlib.util.find_spec(module) is None:
+        raise RuntimeError(f"--server {kind} needs the '{module}' package (pip install -r requirements.txt)")
+    if kind == 'wsgi':
+        import multiprocessing
+
+        process = multiprocessing.get_context('spawn').Process(
+            target=_serve_wsgi_child, args=(host, port), daemon=True
+        )
+        process.start()
+        stop = process.terminate
+    elif kind == 'asgi':
+        command = [
+            sys.executable, '-m', 'uvicorn', 'inventory_management.asgi:application',
+            '--host', host, '--port', str(port), '--workers', str(workers), '--log-level', 'warning',
+        ]
+        process = subprocess.Popen(command)
+        stop = process.terminate
+    elif kind == 'gunicorn':
+        command = [
+            sys.executable, '-m', 'gunicorn', 'inventory_management.wsgi:application',
+            '--bind', f'{host}:{port}', '--workers', str(workers), '--log-level', 'warning',
+        ]
+        process = subprocess.Popen(command)
+        stop = process.terminate
+    else:
+        raise ValueError(f"Unknown server kind '{kind}'")
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return stop
+        except OSError:
+            time.sleep(0.2)
+    stop()
+    raise RuntimeError(f'The {kind} server did not start on {host}:{port}')
+
+
+def _serve_wsgi_child(host, port):
+    import django
+
+    django.setup()
+    serve_wsgi(host, port)
+
+
+class Client:
+    """Minimal keep-alive HTTP client with a cookie jar and Django CSRF handling."""
+
+    def __init__(self, base_url, stats, timeout=30):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.stats = stats
+        self.timeout = timeout
+        self.cookies = {}
+        self.connection = None
+
+    def request(self, label, method, path, form=None, expect=(200,)):
+        body, headers = None, {}
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{k}={v}' for k, v in self.cookies.items())
+        if form is not None:
+            if 'csrftoken' in self.cookies:
+                form = {'csrfmiddlewaretoken': self.cookies['csrftoken'], **form}
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        start = time.perf_counter()
+        try:
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            content = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            self.close()
+            self.stats.record(label, (time.perf_counter() - start) * 1000, error=type(e).__name__)
+            return None, b''
+        elapsed = (time.perf_counter() - start) * 1000
+
+        for header in response.headers.get_all('Set-Cookie') or []:
+            for name, morsel in SimpleCookie(header).items():
+                self.cookies[name] = morsel.value
+        error = None if response.status in expect else f'HTTP {response.status}'
+        self.stats.record(label, elapsed, error=error)
+        if response.will_close:
+            self.close()
+        return response.status, content
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class Stats:
+    """Thread-safe latency samples per endpoint label."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.started = time.monotonic()
+        self.finished = None
+
+    def record(self, label, elapsed_ms, error=None):
+        with self.lock:
+            self.latencies.setdefault(label, []).append(elapsed_ms)
+            if error:
+                errors = self.errors.setdefault(label, {})
+                errors[error] = errors.get(error, 0) + 1
+
+    def summary(self):
+        elapsed = (self.finished or time.monotonic()) - self.started
+        with self.lock:
+            endpoints = {label: summarize(values, elapsed) for label, values in sorted(self.latencies.items())}
+            for label, errors in self.errors.items():
+                endpoints[label]['errors'] = errors
+            everything = [v for values in self.latencies.values() for v in values]
+        return {'duration': elapsed, 'total': summarize(everything, elapsed), 'endpoints': endpoints}
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(p / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(latencies, elapsed):
+    values = sorted(latencies)
+    return {
+        'requests': len(values),
+        'throughput': len(values) / elapsed if elapsed else 0,
+        'mean': sum(values) / len(values) if values else None,
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+        'max': values[-1] if values else None,
+    }
+
+
+class Scenarios:
+    """The user journeys; each method performs one iteration with a fresh or reused client."""
+
+    def __init__(self, location_paths, search_terms, username=None, password=None):
+        self.location_paths = location_paths or ['']
+        self.search_terms = search_terms or ['a']
+        self.username = username
+        self.password = password
+
+    def browse(self, client):
+        client.request('index', 'GET', '/')
+        path = random.choice(self.location_paths)
+        if path:
+            client.request('location_page', 'GET', f'/{path}')
+            client.request('location_page_2', 'GET', f'/{path}?page=2', expect=(200, 404))
+        client.request('geogrid', 'GET', '/api/geogrid/?bbox=-10,35,30,60')
+
+    def _login(self, client):
+        client.request('login_form', 'GET', '/login/')
+        client.request('login_submit', 'POST', '/login/',
+                       form={'username': self.username, 'password': self.password}, expect=(302,))
+
+    def login(self, client):
+        if not self.username:
+            return self.browse(client)
+        client.cookies.clear()
+        self._login(client)
+
+    def signup(self, client):
+        client.cookies.clear()
+        client.request('signup_form', 'GET', '/signup/')
+        username = f'{SIGNUP_PREFIX}{uuid.uuid4().hex[:12]}'
+        password = uuid.uuid4().hex
+        client.request('signup_submit', 'POST', '/signup/', form={
+            'username': username,
+            'email': f'{username}@example.com',
+            'password1': password,
+            'password2': password,
+        }, expect=(302,))
+
+    def admin(self, client):
+        if not self.username:
+            return self.browse(client)
+        if 'sessionid' not in client.cookies:
+            self._login(client)
+        client.request('admin_changelist', 'GET', '/admin/properties/accommodation/')
+        query = urlencode({'q': random.choice(self.search_terms)})
+        client.request('admin_search', 'GET', f'/admin/properties/accommodation/?{query}')
+
+
+def pick(mix):
+    names = list(mix)
+    return random.choices(names, weights=[mix[name] for name in names])[0]
+
+
+def run_closed_loop(base_url, scenarios, mix, users, duration, stats, think_time=0):
+    """``users`` virtual users, each starting its next iteration as soon as the last one ends."""
+    deadline = time.monotonic() + duration
+
+    def user():
+        client = Client(base_url, stats)
+        while time.monotonic() < deadline:
+            getattr(scenarios, pick(mix))(client)
+            if think_time:
+                time.sleep(random.expovariate(1 / think_time))
+        client.close()
+
+    threads = [threading.Thread(target=user, daemon=True) for _ in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats.finished = time.monotonic()
+
+
+def run_open_loop(base_url, scenarios, mix, rate, duration, stats, max_users=200):
+    """
+    Start scenario iterations at a fixed ``rate`` per second (Poisson arrivals)
+    regardless of response times, so queueing in the server shows up in the
+    latencies. At most ``max_users`` iterations run at once.
+    """
+    deadline = time.monotonic() + duration
+    slots = threading.BoundedSemaphore(max_users)
+    threads = []
+
+    def iteration(name):
+        client = Client(base_url, stats)
+        try:
+            getattr(scenarios, name)(client)
+        finally:
+            client.close()
+            slots.release()
+
+    next_start = time.monotonic()
+    while next_start < deadline:
+        time.sleep(max(next_start - time.monotonic(), 0))
+        if not slots.acquire(timeout=max(deadline - time.monotonic(), 0)):
+            break
+        thread = threading.Thread(target=iteration, args=(pick(mix),), daemon=True)
+        thread.start()
+        threads.append(thread)
+        next_start += random.expovariate(rate)
+    for thread in threads:
+        thread.join()
+    stats.finished = time.monotonic()
+
+
+def parse_mix(value):
+    """``browse=70,admin=30`` -> ``{'browse': 70, 'admin': 30}``."""
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        if name not in DEFAULT_MIX or not re.fullmatch(r'\d+', weight):
+            raise ValueError(f"Invalid scenario weight '{item}'")
+        mix[name] = int(weight)
+    if not any(mix.values()):
+        raise ValueError('At least one scenario needs a positive weight')
+    return mix
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, previous):
+    """Per-endpoint change of throughput and p95 versus an earlier result file."""
+    rows = []
+    for label, stats in current['endpoints'].items():
+        before = previous.get('endpoints', {}).get(label)
+        if not before or not before.get('p95') or not stats.get('p95'):
+            continue
+        rows.append({
+            'endpoint': label,
+            'throughput_change': (stats['throughput'] - before['throughput']) / before['throughput'] * 100
+            if before['throughput'] else None,
+            'p95_change': (stats['p95'] - before['p95']) / before['p95'] * 100,
+        })
+    return rows
+
+
+def save_results(path, config, summary):
+    with open(path, 'w') as f:
+        json.dump({'revision': git_revision(), 'config': config, **summary}, f, indent=2)
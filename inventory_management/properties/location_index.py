@@ -0,0 +1,422 @@
+"""
+Compact, memory-mapped snapshot of the Location tree.
+
+The index is built from a single query and stored as flat arrays: parent
+indices, preorder subtree bounds, type codes, coordinates and references into
+one interned string pool (ids, titles, slugs). Nodes are stored in preorder,
+so the descendants of a node are a contiguous index range, and children are
+kept sorted by slug for binary search.
+
+The arrays are written to ``settings.LOCATION_INDEX_PATH`` and mapped read-only,
+so all gunicorn workers on a host share the same physical pages. The file
+carries the ``(max(updated_at), count)`` of the Location table it was built
+from, for HTTP validators, and the generation it was built at.
+
+A statement-level trigger stamps every write to the Location table into a
+one-row version table, so checking for changes is a primary key lookup.
+Stale files are rebuilt by the ``build_location_index`` job (or command);
+requests keep serving the file they have until then.
+"""
+import fcntl
+import mmap
+import os
+import struct
+import tempfile
+import time
+from array import array
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, Max
+from django.template.defaultfilters import slugify
+
+from . import jobs
+from .models import Location
+
+MAGIC = b'LOCIDX02'
+# magic, node count, version timestamp, version row count, generation
+HEADER = struct.Struct('<8sIdQQ')
+
+TYPE_CODES = [code for code, _ in Location.LOCATION_TYPES]
+
+# Section name -> array typecode, in file order
+SECTIONS = [
+    ('parent', 'i'),         # Parent node index, -1 for roots
+    ('subtree_end', 'i'),    # Descendants of node i are i+1 .. subtree_end[i]-1
+    ('type_code', 'b'),      # Index into TYPE_CODES
+    ('lon', 'd'),
+    ('lat', 'd'),
+    ('id_ref', 'I'),         # String pool references
+    ('title_ref', 'I'),
+    ('slug_ref', 'I'),
+    ('child_offsets', 'I'),  # children[child_offsets[i]:child_offsets[i+1]], sorted by slug
+    ('children', 'i'),
+    ('countries', 'i'),      # Country nodes sorted by slug (first URL segment)
+    ('id_order', 'i'),       # All nodes sorted by id
+    ('str_offsets', 'I'),    # String k is str_blob[str_offsets[k]:str_offsets[k+1]]
+    ('str_blob', 'B'),
+]
+SECTION_TABLE = struct.Struct('<' + 'QQ' * len(SECTIONS))
+
+LOCATIONS_SQL = """
+SELECT id, parent_id_id, location_type, title, ST_X(center), ST_Y(center)
+FROM properties_location
+"""
+
+# Every statement writing to properties_location stores a new number from the sequence,
+# visible once its transaction commits; the sequence is never rolled back, so numbers are not reused
+GENERATION_SQL = """
+CREATE SEQUENCE IF NOT EXISTS properties_locationindex_generation_seq;
+CREATE TABLE IF NOT EXISTS properties_locationindexversion (
+    id SMALLINT PRIMARY KEY CHECK (id = 1),
+    generation BIGINT NOT NULL
+);
+INSERT INTO properties_locationindexversion VALUES (1, 0) ON CONFLICT DO NOTHING;
+
+CREATE OR REPLACE FUNCTION properties_location_changed() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE properties_locationindexversion
+    SET generation = nextval('properties_locationindex_generation_seq') WHERE id = 1;
+    RETURN NULL;
+END
+$$;
+
+DROP TRIGGER IF EXISTS location_index_generation ON properties_location;
+CREATE TRIGGER location_index_generation
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON properties_location
+    FOR EACH STATEMENT EXECUTE FUNCTION properties_location_changed();
+"""
+
+
+def ensure_generation():
+    """Create the version table and the Location trigger that maintains it."""
+    with connection.cursor() as cursor:
+        cursor.execute(GENERATION_SQL)
+
+
+def current_generation():
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT generation FROM properties_locationindexversion WHERE id = 1')
+        row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def current_version():
+    """``(max(updated_at) as a timestamp, row count)`` of the Location table."""
+    result = Location.objects.aggregate(updated=Max('updated_at'), count=Count('id'))
+    updated = result['updated'].timestamp() if result['updated'] else 0.0
+    return updated, result['count']
+
+
+class _StringPool:
+    """Interns strings so repeated titles/slugs are stored once."""
+
+    def __init__(self):
+        self.refs = {}
+        self.offsets = array('I', [0])
+        self.blob = bytearray()
+
+    def add(self, value):
+        ref = self.refs.get(value)
+        if ref is None:
+            ref = self.refs[value] = len(self.offsets) - 1
+            self.blob += value.encode()
+            self.offsets.append(len(self.blob))
+        return ref
+
+
+def build_arrays(rows):
+    """
+    Build the index arrays from ``(id, parent_id, type, title, lon, lat)`` rows.
+    Returns a dict of section name -> array.
+    """
+    count = len(rows)
+    row_by_id = {row[0]: i for i, row in enumerate(rows)}
+    slugs = [slugify(row[3]) for row in rows]
+
+    child_rows = [[] for _ in range(count)]
+    roots = []
+    for i, row in enumerate(rows):
+        parent = row_by_id.get(row[1])
+        if parent is None or parent == i:
+            roots.append(i)
+        else:
+            child_rows[parent].append(i)
+    slug_key = lambda i: slugs[i].encode()  # noqa: E731
+    for children in child_rows:
+        children.sort(key=slug_key)
+
+    # Preorder traversal; nodes caught in parent cycles become extra roots
+    order = []
+    visited = bytearray(count)
+    pending_roots = sorted(roots, key=slug_key) + list(range(count))
+    for root in pending_roots:
+        if visited[root]:
+            continue
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if visited[node]:
+                continue
+            visited[node] = 1
+            order.append(node)
+            stack.extend(reversed(child_rows[node]))
+
+    new_index = array('i', bytes(4 * count))
+    for k, row in enumerate(order):
+        new_index[row] = k
+
+    pool = _StringPool()
+    sections = {name: array(code) for name, code in SECTIONS}
+    for row in order:
+        location_id, parent_id, location_type, title, lon, lat = rows[row]
+        parent = row_by_id.get(parent_id)
+        sections['parent'].append(-1 if parent is None or parent == row or new_index[parent] > new_index[row]
+                                  else new_index[parent])
+        sections['type_code'].append(TYPE_CODES.index(location_type) if location_type in TYPE_CODES else -1)
+        sections['lon'].append(lon if lon is not None else 0.0)
+        sections['lat'].append(lat if lat is not None else 0.0)
+        sections['id_ref'].append(pool.add(location_id))
+        sections['title_ref'].append(pool.add(title))
+        sections['slug_ref'].append(pool.add(slugs[row]))
+
+    # Subtree sizes, accumulated bottom-up over the preorder
+    parent = sections['parent']
+    size = array('i', [1]) * count
+    for k in range(count - 1, -1, -1):
+        if parent[k] >= 0:
+            size[parent[k]] += size[k]
+    sections['subtree_end'] = array('i', (k + size[k] for k in range(count)))
+
+    # Children in CSR form; preorder already visits siblings in slug order
+    child_counts = array('I', bytes(4 * count))
+    for k in range(count):
+        if parent[k] >= 0:
+            child_counts[parent[k]] += 1
+    offsets = sections['child_offsets']
+    offsets.append(0)
+    for k in range(count):
+        offsets.append(offsets[-1] + child_counts[k])
+    children = array('i', bytes(4 * offsets[-1]))
+    fill = array('I', offsets[:-1]) if count else array('I')
+    for k in range(count):
+        if parent[k] >= 0:
+            children[fill[parent[k]]] = k
+            fill[parent[k]] += 1
+    sections['children'] = children
+
+    country_code = TYPE_CODES.index('country')
+    sections['countries'] = array('i', sorted(
+        (k for k in range(count) if sections['type_code'][k] == country_code),
+        key=lambda k: slugs[order[k]].encode(),
+    ))
+    sections['id_order'] = array('i', sorted(range(count), key=lambda k: rows[order[k]][0].encode()))
+    sections['str_offsets'] = pool.offsets
+    sections['str_blob'] = array('B', bytes(pool.blob))
+    return sections
+
+
+def write_index(path, sections, version, generation=0):
+    """Write sections to ``path`` atomically (readers never see a partial file)."""
+    directory = os.path.dirname(os.fspath(path)) or '.'
+    os.makedirs(directory, exist_ok=True)
+    table = []
+    offset = HEADER.size + SECTION_TABLE.size
+    for name, _ in SECTIONS:
+        offset += -offset % 8  # Keep every array 8-byte aligned
+        length = len(sections[name]) * sections[name].itemsize
+        table.extend([offset, length])
+        offset += length
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.location_index.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, len(sections['parent']), version[0], version[1], generation))
+            f.write(SECTION_TABLE.pack(*table))
+            for (name, _), section_offset in zip(SECTIONS, table[::2]):
+                f.write(b'\0' * (section_offset - f.tell()))
+                sections[name].tofile(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def build_index_file(path):
+    """Query all locations once and write a fresh index file. Returns its version."""
+    # Read first: a write committed meanwhile leaves the file marked older than its rows, never newer
+    generation = current_generation()
+    version = current_version()
+    with connection.cursor() as cursor:
+        cursor.execute(LOCATIONS_SQL)
+        rows = cursor.fetchall()
+    write_index(path, build_arrays(rows), version, generation)
+    return version
+
+
+def rebuild(path):
+    """Rebuild the index file unless it is current, one process at a time, and map it."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        # Another process may have rebuilt it while we waited
+        index = _open(path)
+        if index is None or index.generation != current_generation():
+            build_index_file(path)
+            index = LocationIndex.open(path)
+    return index
+
+
+class LocationIndex:
+    """Read-only view over a mapped index file. Nodes are addressed by integer index."""
+
+    def __init__(self, buffer):
+        self._buffer = buffer
+        magic, self.count, updated, row_count, self.generation = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError('Not a location index file')
+        self.version = (updated, row_count)
+        table = SECTION_TABLE.unpack_from(buffer, HEADER.size)
+        view = memoryview(buffer)
+        for i, (name, code) in enumerate(SECTIONS):
+            offset, length = table[2 * i], table[2 * i + 1]
+            setattr(self, '_' + name, view[offset:offset + length].cast(code))
+
+    @classmethod
+    def open(cls, path):
+        with open(path, 'rb') as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def __len__(self):
+        return self.count
+
+    def _string(self, ref):
+        return bytes(self._str_blob[self._str_offsets[ref]:self._str_offsets[ref + 1]])
+
+    def id(self, node):
+        return self._string(self._id_ref[node]).decode()
+
+    def title(self, node):
+        return self._string(self._title_ref[node]).decode()
+
+    def slug(self, node):
+        return self._string(self._slug_ref[node]).decode()
+
+    def location_type(self, node):
+        code = self._type_code[node]
+        return TYPE_CODES[code] if code >= 0 else None
+
+    def center(self, node):
+        return self._lon[node], self._lat[node]
+
+    def parent(self, node):
+        parent = self._parent[node]
+        return parent if parent >= 0 else None
+
+    def children(self, node):
+        return self._children[self._child_offsets[node]:self._child_offsets[node + 1]]
+
+    def descendants(self, node):
+        """Index range of all nodes below ``node``."""
+        return range(node + 1, self._subtree_end[node])
+
+    def ancestors(self, node):
+        """Nodes from the root down to ``node`` (inclusive), i.e. the breadcrumb trail."""
+        trail = []
+        while node is not None:
+            trail.append(node)
+            node = self.parent(node)
+        return trail[::-1]
+
+    def _search(self, nodes, key, ref_section):
+        """Binary search ``nodes`` (sorted by the referenced string) for ``key`` bytes."""
+        low, high = 0, len(nodes)
+        while low < high:
+            mid = (low + high) // 2
+            if self._string(ref_section[nodes[mid]]) < key:
+                low = mid + 1
+            else:
+                high = mid
+        if low < len(nodes) and self._string(ref_section[nodes[low]]) == key:
+            return nodes[low]
+        return None
+
+    def find(self, location_id):
+        """Node index of a Location id, or None."""
+        return self._search(self._id_order, location_id.encode(), self._id_ref)
+
+    def resolve_path(self, path):
+        """
+        Node for a sitemap-style slug path (``country/state/city``), or None.
+        The first segment is matched against countries, the rest against children.
+        """
+        segments = [segment for segment in path.strip('/').split('/') if segment]
+        if not segments:
+            return None
+        node = self._search(self._countries, segments[0].encode(), self._slug_ref)
+        for segment in segments[1:]:
+            if node is None:
+                return None
+            node = self._search(self.children(node), segment.encode(), self._slug_ref)
+        return node
+
+    def path(self, node):
+        """Slug path of ``node`` from its country down, as used in sitemap.json."""
+        trail = self.ancestors(node)
+        types = [self.location_type(n) for n in trail]
+        if 'country' in types:
+            trail = trail[types.index('country'):]
+        return '/'.join(self.slug(n) for n in trail)
+
+    def descendant_ids(self, location_id):
+        """Ids of a location and everything below it (empty if the id is unknown)."""
+        node = self.find(location_id)
+        if node is None:
+            return []
+        return [self.id(n) for n in range(node, self._subtree_end[node])]
+
+
+_current = None
+_current_path = None
+_checked_at = 0.0
+
+
+def get_location_index():
+    """
+    The process-wide LocationIndex. Every LOCATION_INDEX_CHECK_INTERVAL seconds
+    the generation in the version table is compared with the mapped file's,
+    and a file rebuilt since is remapped. A stale file is rebuilt by the
+    ``build_location_index`` job, not on the request; only a process that
+    finds no file at all builds one itself.
+    """
+    global _current, _current_path, _checked_at
+    path = os.fspath(settings.LOCATION_INDEX_PATH)
+    fresh = _current is not None and _current_path == path
+    if fresh and time.monotonic() - _checked_at < settings.LOCATION_INDEX_CHECK_INTERVAL:
+        return _current
+
+    generation = current_generation()
+    _checked_at = time.monotonic()
+    if fresh and _current.generation == generation:
+        return _current
+
+    index = _open(path)
+    if index is None:
+        index = rebuild(path)
+    elif index.generation != generation:
+        jobs.enqueue_unique('build_location_index')
+    _current, _current_path = index, path
+    return _current
+
+
+def _open(path):
+    try:
+        return LocationIndex.open(path)
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+def version_datetime(index):
+    """The Location ``updated_at`` an index was built from."""
+    return datetime.fromtimestamp(index.version[0], tz=timezone.utc)
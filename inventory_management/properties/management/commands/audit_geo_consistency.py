@@ -0,0 +1,32 @@
+# properties/management/commands/audit_geo_consistency.py
+from django.core.management.base import BaseCommand, CommandError
+from properties.geoaudit import audit, prune_runs
+
+
+class Command(BaseCommand):
+    help = 'Flags accommodations far from their location or in another country, and stores the report'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-distance', nargs='+', default=[], metavar='TYPE=KM',
+                            help='Override GEO_AUDIT_MAX_DISTANCE_KM, e.g. city=50 state=500.')
+        parser.add_argument('--chunk-size', type=int, default=100000, help='Rows fetched and checked per batch.')
+        parser.add_argument('--workers', type=int, help='Concurrent partition scans (default: one per partition).')
+        parser.add_argument('--keep', type=int, default=5, help='Reports kept, including this one.')
+
+    def handle(self, *args, **options):
+        thresholds = {}
+        for item in options['max_distance']:
+            location_type, _, km = item.partition('=')
+            try:
+                thresholds[location_type] = float(km)
+            except ValueError:
+                raise CommandError(f"Invalid threshold '{item}', expected TYPE=KM")
+
+        run = audit(thresholds, chunk_size=options['chunk_size'], workers=options['workers'])
+        prune_runs(options['keep'])
+        too_far = run.issues.filter(too_far=True).count()
+        self.stdout.write(f'{too_far} too far from their location, '
+                          f'{run.issue_count - too_far} only in another country')
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {run.checked_count} accommodations in {run.duration:.1f}s; {run.issue_count} issues in report #{run.pk}'
+        ))
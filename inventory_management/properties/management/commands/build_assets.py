@@ -0,0 +1,23 @@
+# properties/management/commands/build_assets.py
+from django.core.management.base import BaseCommand
+from properties.assets import build_assets, precompress_static_root
+
+
+class Command(BaseCommand):
+    help = 'Builds purged, minified, content-hashed and precompressed CSS into STATIC_ROOT'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Also precompress every other file in STATIC_ROOT (run after collectstatic)',
+        )
+
+    def handle(self, *args, **options):
+        manifest = build_assets()
+        for name, built in manifest.items():
+            self.stdout.write(f'{name} -> {built}')
+        if options['all']:
+            count = precompress_static_root()
+            self.stdout.write(f'Precompressed {count} collected static files')
+        self.stdout.write(self.style.SUCCESS('Assets built successfully'))
@@ -0,0 +1,20 @@
+# properties/management/commands/build_location_index.py
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from properties.location_index import LocationIndex, build_index_file, version_datetime
+
+
+class Command(BaseCommand):
+    help = 'Builds the memory-mapped Location index shared by all web workers'
+
+    def handle(self, *args, **options):
+        path = os.fspath(settings.LOCATION_INDEX_PATH)
+        build_index_file(path)
+        index = LocationIndex.open(path)
+        size_mb = os.path.getsize(path) / 1024 / 1024
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {len(index)} locations (updated {version_datetime(index):%Y-%m-%d %H:%M:%S}) '
+            f'in {path} ({size_mb:.1f} MB)'
+        ))
@@ -0,0 +1,69 @@
+# properties/management/commands/bulk_accommodations.py
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from properties import bulk
+from properties.models import Accommodation, Location
+
+
+class Command(BaseCommand):
+    help = 'Publishes, unpublishes, reassigns or moves accommodations with a single set-based UPDATE'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'operation',
+            choices=['publish', 'unpublish', 'reassign-owner', 'move-location'],
+        )
+        # Selection
+        parser.add_argument('--ids', nargs='+', help='Accommodation ids to change.')
+        parser.add_argument('--feed', type=int, help='Only accommodations from this feed.')
+        parser.add_argument('--location', help='Only accommodations in this location id.')
+        parser.add_argument('--owner', help='Only accommodations owned by this username.')
+        parser.add_argument(
+            '--as-user',
+            help='Apply the change as this username; Property Owners are limited to their own accommodations.',
+        )
+        # Targets
+        parser.add_argument('--to-owner', help='Username of the new owner (reassign-owner).')
+        parser.add_argument('--to-location', help='Id of the new location (move-location).')
+
+    def get_user(self, username):
+        try:
+            return User.objects.get(username=username)
+        except User.DoesNotExist:
+            raise CommandError(f"User '{username}' does not exist")
+
+    def handle(self, *args, **options):
+        queryset = Accommodation.objects.all()
+        if options['ids']:
+            queryset = queryset.filter(id__in=options['ids'])
+        if options['feed'] is not None:
+            queryset = queryset.for_feed(options['feed'])
+        if options['location']:
+            queryset = queryset.filter(location_id=options['location'])
+        if options['owner']:
+            queryset = queryset.filter(user_id=self.get_user(options['owner']))
+        if options['as_user']:
+            acting_user = self.get_user(options['as_user'])
+            queryset = bulk.scope_to_user(queryset, acting_user)
+            if options['operation'] == 'reassign-owner' and bulk.is_property_owner(acting_user):
+                raise CommandError('Property Owners cannot reassign accommodations')
+
+        operation = options['operation']
+        if operation == 'publish':
+            count = bulk.publish(queryset)
+        elif operation == 'unpublish':
+            count = bulk.unpublish(queryset)
+        elif operation == 'reassign-owner':
+            if not options['to_owner']:
+                raise CommandError('--to-owner is required for reassign-owner')
+            count = bulk.reassign_owner(queryset, self.get_user(options['to_owner']))
+        else:
+            if not options['to_location']:
+                raise CommandError('--to-location is required for move-location')
+            try:
+                location = Location.objects.get(pk=options['to_location'])
+            except Location.DoesNotExist:
+                raise CommandError(f"Location '{options['to_location']}' does not exist")
+            count = bulk.move_location(queryset, location)
+
+        self.stdout.write(self.style.SUCCESS(f'Updated {count} accommodations'))
@@ -0,0 +1,32 @@
+# properties/management/commands/changelog_maintenance.py
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now
+from properties.changefeed import drop_partitions_before, ensure_partitions
+
+
+class Command(BaseCommand):
+    help = 'Creates upcoming monthly change log partitions and drops expired ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months-ahead',
+            type=int,
+            default=2,
+            help='Number of future monthly partitions to create.',
+        )
+        parser.add_argument(
+            '--retention-days',
+            type=int,
+            default=settings.CHANGEFEED_RETENTION_DAYS,
+            help='Drop partitions whose entries are all older than this.',
+        )
+
+    def handle(self, *args, **options):
+        ensure_partitions(months_ahead=options['months_ahead'])
+        dropped = drop_partitions_before(now() - timedelta(days=options['retention_days']))
+        for name in dropped:
+            self.stdout.write(f'Dropped {name}')
+        self.stdout.write(self.style.SUCCESS('Change log partitions are up to date'))
@@ -0,0 +1,19 @@
+# properties/management/commands/dedupe_policies.py
+from django.core.management.base import BaseCommand
+from properties.policies import dedupe, prune
+
+
+class Command(BaseCommand):
+    help = 'Moves JSON localization policies into the content-addressed policy store'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help='Localizations linked per transaction.')
+        parser.add_argument('--prune', action='store_true',
+                            help='Also delete unreferenced policies (run while no imports are writing).')
+
+    def handle(self, *args, **options):
+        added, linked = dedupe(batch_size=options['batch_size'])
+        self.stdout.write(f'Added {added} distinct policies to the store')
+        if options['prune']:
+            self.stdout.write(f'Deleted {prune()} unreferenced policies')
+        self.stdout.write(self.style.SUCCESS(f'Linked {linked} localizations to stored policies'))
@@ -0,0 +1,16 @@
+# properties/management/commands/encode_amenities.py
+from django.core.management.base import BaseCommand
+from properties.amenities import encode_all
+
+
+class Command(BaseCommand):
+    help = 'Moves JSON amenities into the amenity dictionary and the amenity_ids column'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help='Rows updated per statement.')
+        parser.add_argument('--workers', type=int, help='Concurrent partition scans (default: one per partition).')
+
+    def handle(self, *args, **options):
+        added, encoded = encode_all(batch_size=options['batch_size'], workers=options['workers'])
+        self.stdout.write(f'Added {added} amenities to the dictionary')
+        self.stdout.write(self.style.SUCCESS(f'Encoded amenities of {encoded} accommodations'))
@@ -0,0 +1,118 @@
+# properties/management/commands/loadtest.py
+import json
+import os
+import random
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from properties import loadtest
+from properties.location_index import get_location_index
+from properties.models import Accommodation
+
+
+class Command(BaseCommand):
+    help = 'Load-tests the site with scripted browse/login/signup/admin users and reports latency percentiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', choices=['wsgi', 'asgi', 'gunicorn', 'external'], default='wsgi',
+                            help='Serve the app locally through wsgi.py (threaded), asgi.py (uvicorn), '
+                                 'gunicorn, or test an already running site (--url).')
+        parser.add_argument('--url', help='Base URL of the site when --server=external.')
+        parser.add_argument('--port', type=int, default=8765, help='Local port for the started server.')
+        parser.add_argument('--server-workers', type=int, default=1, help='Worker processes for uvicorn/gunicorn.')
+        parser.add_argument('--users', type=int, default=10, help='Concurrent virtual users (closed loop).')
+        parser.add_argument('--rate', type=float,
+                            help='Scenario starts per second (open loop); overrides --users.')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds to run.')
+        parser.add_argument('--think-time', type=float, default=0,
+                            help='Mean pause between iterations of a closed-loop user, in seconds.')
+        parser.add_argument('--mix', default=','.join(f'{k}={v}' for k, v in loadtest.DEFAULT_MIX.items()),
+                            help='Scenario weights, e.g. browse=70,login=10,signup=5,admin=15.')
+        parser.add_argument('--username', help='Staff user for the login and admin scenarios.')
+        parser.add_argument('--password', help='Password of --username.')
+        parser.add_argument('--output', help='Result file (default: LOADTEST_RESULTS_DIR/<time>-<revision>.json).')
+        parser.add_argument('--compare', metavar='FILE', help='Earlier result file to compare against.')
+        parser.add_argument('--cleanup', action='store_true', help='Delete the users created by the signup scenario.')
+
+    def handle(self, *args, **options):
+        try:
+            mix = loadtest.parse_mix(options['mix'])
+        except ValueError as e:
+            raise CommandError(e)
+        if options['username'] is None and (mix.get('login') or mix.get('admin')):
+            self.stdout.write(self.style.WARNING('No --username given; login and admin iterations browse instead'))
+
+        index = get_location_index()
+        paths = [index.path(node) for node in range(len(index)) if index.location_type(node) != 'continent']
+        titles = Accommodation.objects.filter(published=True).values_list('title', flat=True)[:200]
+        scenarios = loadtest.Scenarios(
+            random.sample(paths, min(len(paths), 100)),
+            [title.split()[0] for title in titles if title.split()],
+            options['username'],
+            options['password'],
+        )
+
+        stop = None
+        if options['server'] == 'external':
+            if not options['url']:
+                raise CommandError('--server=external needs --url')
+            base_url = options['url'].rstrip('/')
+        else:
+            base_url = f"http://127.0.0.1:{options['port']}"
+            try:
+                stop = loadtest.start_server(options['server'], '127.0.0.1', options['port'], options['server_workers'])
+            except RuntimeError as e:
+                raise CommandError(e)
+
+        stats = loadtest.Stats()
+        try:
+            if options['rate']:
+                loadtest.run_open_loop(base_url, scenarios, mix, options['rate'], options['duration'], stats)
+            else:
+                loadtest.run_closed_loop(base_url, scenarios, mix, options['users'], options['duration'], stats,
+                                         think_time=options['think_time'])
+        finally:
+            if stop:
+                stop()
+        summary = stats.summary()
+
+        self.stdout.write(f"{'endpoint':<20} {'requests':>9} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+                          f"{'p99 ms':>8} {'errors':>7}")
+        for label, row in [*summary['endpoints'].items(), ('total', summary['total'])]:
+            errors = sum(row.get('errors', {}).values()) if label != 'total' else sum(
+                sum(r.get('errors', {}).values()) for r in summary['endpoints'].values()
+            )
+            self.stdout.write(
+                f"{label:<20} {row['requests']:>9} {row['throughput']:>8.1f} {row['p50'] or 0:>8.1f} "
+                f"{row['p95'] or 0:>8.1f} {row['p99'] or 0:>8.1f} {errors:>7}"
+            )
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                previous = json.load(f)
+            self.stdout.write(f"Compared with {options['compare']} (revision {previous.get('revision')}):")
+            for row in loadtest.compare(summary, previous):
+                throughput = row['throughput_change']
+                self.stdout.write(
+                    f"{row['endpoint']:<20} req/s {throughput if throughput is not None else 0:+7.1f}%  "
+                    f"p95 {row['p95_change']:+7.1f}%"
+                )
+
+        output = options['output']
+        if not output:
+            os.makedirs(settings.LOADTEST_RESULTS_DIR, exist_ok=True)
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{loadtest.git_revision() or 'unknown'}.json"
+            output = os.path.join(settings.LOADTEST_RESULTS_DIR, name)
+        config = {key: options[key] for key in ('server', 'server_workers', 'users', 'rate', 'duration',
+                                                'think_time')}
+        loadtest.save_results(output, {**config, 'mix': mix}, summary)
+
+        if options['cleanup']:
+            deleted, _ = get_user_model().objects.filter(username__startswith=loadtest.SIGNUP_PREFIX).delete()
+            self.stdout.write(f'Deleted {deleted} objects created by the signup scenario')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {summary['total']['requests']} requests in {summary['duration']:.1f}s; results in {output}"
+        ))
@@ -0,0 +1,46 @@
+# properties/management/commands/price_history_maintenance.py
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils.timezone import localdate, now
+from properties.changefeed import drop_partitions_before
+from properties.prices import TABLE, ensure_price_history, rollup_day, rollup_week, week_start
+
+
+class Command(BaseCommand):
+    help = 'Maintains price history partitions and rolls up daily and weekly price trends'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--day',
+            type=date.fromisoformat,
+            help='Day to roll up (YYYY-MM-DD). Defaults to yesterday.',
+        )
+        parser.add_argument(
+            '--backfill-days',
+            type=int,
+            default=0,
+            help='Also roll up price changes of this many days before --day.',
+        )
+        parser.add_argument(
+            '--retention-days',
+            type=int,
+            default=settings.PRICE_HISTORY_RETENTION_DAYS,
+            help='Drop raw history partitions whose rows are all older than this.',
+        )
+
+    def handle(self, *args, **options):
+        ensure_price_history()
+        for name in drop_partitions_before(now() - timedelta(days=options['retention_days']), table=TABLE):
+            self.stdout.write(f'Dropped {name}')
+
+        yesterday = localdate() - timedelta(days=1)
+        last = options['day'] or yesterday
+        days = [last - timedelta(days=n) for n in range(options['backfill_days'], -1, -1)]
+        for day in days:
+            # The catalog can only be sampled as it is now, i.e. for the day that just ended
+            rollup_day(day, sample=day >= yesterday)
+        for monday in sorted({week_start(day) for day in days}):
+            rollup_week(monday)
+        self.stdout.write(self.style.SUCCESS(f'Rolled up prices for {days[0]} to {days[-1]}'))
@@ -0,0 +1,14 @@
+# properties/management/commands/rank_accommodations.py
+from django.core.management.base import BaseCommand
+from properties.ranking import refresh_all
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the rank score of every accommodation, one feed partition per worker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, help='Concurrent partition updates (default: one per partition).')
+
+    def handle(self, *args, **options):
+        count = refresh_all(workers=options['workers'])
+        self.stdout.write(self.style.SUCCESS(f'Ranked {count} accommodations'))
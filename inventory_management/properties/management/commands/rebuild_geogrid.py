@@ -0,0 +1,11 @@
+# properties/management/commands/rebuild_geogrid.py
+from django.core.management.base import BaseCommand
+from properties.geogrid import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Backfills Accommodation.geohash and recomputes all geo grid rollups'
+
+    def handle(self, *args, **options):
+        cells = rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {cells} geo grid cells'))
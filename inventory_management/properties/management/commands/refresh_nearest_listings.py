@@ -0,0 +1,51 @@
+# properties/management/commands/refresh_nearest_listings.py
+from django.core.management.base import BaseCommand
+from properties import jobs
+from properties.models import Location
+from properties.nearest import process_changes, refresh_country
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the nearest published accommodations of every location, one job per country'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--country',
+            nargs='+',
+            help='Only refresh these country codes (use "none" for locations without a country).',
+        )
+        parser.add_argument(
+            '--changes',
+            action='store_true',
+            help='Only apply queued incremental changes instead of a full rebuild.',
+        )
+        parser.add_argument(
+            '--sync',
+            action='store_true',
+            help='Refresh in this process instead of queueing background jobs.',
+        )
+
+    def handle(self, *args, **options):
+        if options['changes']:
+            if options['sync']:
+                count = process_changes()
+                self.stdout.write(self.style.SUCCESS(f'Applied {count} queued changes'))
+            else:
+                job = jobs.enqueue_unique('nearest_listings_changes')
+                self.stdout.write(self.style.SUCCESS(f'Queued job #{job.pk}'))
+            return
+
+        if options['country']:
+            countries = [None if code.lower() == 'none' else code.upper() for code in options['country']]
+        else:
+            countries = list(Location.objects.values_list('country_code', flat=True).distinct().order_by('country_code'))
+
+        # Countries are independent, so run_workers refreshes them in parallel
+        for country_code in countries:
+            if options['sync']:
+                count = refresh_country(country_code)
+                self.stdout.write(f'Refreshed {count} locations in {country_code or "no country"}')
+            else:
+                jobs.enqueue_unique('nearest_listings_country', {'country_code': country_code})
+
+        self.stdout.write(self.style.SUCCESS(f'Nearest listings refresh covers {len(countries)} countries'))
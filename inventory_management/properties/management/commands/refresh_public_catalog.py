@@ -0,0 +1,32 @@
+# properties/management/commands/refresh_public_catalog.py
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from properties import jobs
+from properties.catalog import refresh
+
+
+class Command(BaseCommand):
+    help = 'Refreshes the public catalog materialized view if the catalog changed since the last refresh'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Refresh even if the change log has no new entries (e.g. after rank_accommodations).',
+        )
+        parser.add_argument(
+            '--schedule',
+            action='store_true',
+            help='Queue a background job that refreshes every PUBLIC_CATALOG_REFRESH_INTERVAL seconds instead.',
+        )
+
+    def handle(self, *args, **options):
+        if options['schedule']:
+            job = jobs.enqueue_unique('refresh_public_catalog', {'interval': settings.PUBLIC_CATALOG_REFRESH_INTERVAL})
+            self.stdout.write(self.style.SUCCESS(f'Queued job #{job.pk}'))
+            return
+
+        if refresh(force=options['force']):
+            self.stdout.write(self.style.SUCCESS('Public catalog refreshed'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Public catalog is up to date'))
@@ -0,0 +1,85 @@
+# properties/management/commands/run_workers.py
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from properties import jobs
+
+
+class Command(BaseCommand):
+    help = 'Runs queued background jobs in a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=settings.JOB_WORKER_PROCESSES,
+            help='Number of jobs to run concurrently.',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=settings.JOB_POLL_INTERVAL,
+            help='Seconds to wait between queue polls when idle.',
+        )
+        parser.add_argument(
+            '--burst',
+            action='store_true',
+            help='Exit once the queue is empty instead of polling forever.',
+        )
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        poll_interval = options['poll_interval']
+        worker = jobs.worker_id()
+        running = {}
+
+        # Children are spawned (not forked) so they never share our DB socket
+        connections.close_all()
+        pool = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup,
+        )
+        self.stdout.write(f'Worker {worker} started with {processes} processes')
+
+        try:
+            while True:
+                # Heartbeats come from here: handlers may go minutes between progress reports
+                jobs.heartbeat([job.pk for job in running.values()], worker)
+                stale = jobs.requeue_stale_jobs()
+                if stale:
+                    self.stdout.write(self.style.WARNING(f'Recovered {stale} stale jobs'))
+
+                # Fill free slots in the pool
+                while len(running) < processes:
+                    job = jobs.claim_job(worker)
+                    if job is None:
+                        break
+                    self.stdout.write(f'Starting {job}')
+                    running[pool.submit(jobs.execute_job, job.pk, worker)] = job
+
+                if not running:
+                    if options['burst']:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+
+                done, _ = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = running.pop(future)
+                    try:
+                        status = future.result()
+                    except BrokenProcessPool:
+                        jobs.record_failure(job, 'Worker process terminated abruptly.')
+                        raise CommandError(f'Worker pool broke while running {job}')
+                    self.stdout.write(f'Finished {job.kind} #{job.pk}: {status}')
+        except KeyboardInterrupt:
+            self.stdout.write('Shutting down, waiting for running jobs to finish...')
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
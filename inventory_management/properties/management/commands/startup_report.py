@@ -0,0 +1,52 @@
+# properties/management/commands/startup_report.py
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from inventory_management import startup
+
+
+class Command(BaseCommand):
+    help = 'Measures Django startup and import times for the full and lean startup profiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=3, help='Fresh interpreters per profile; the fastest counts.')
+        parser.add_argument('--top', type=int, default=15, help='Slowest top-level packages listed per profile.')
+        parser.add_argument('--save', metavar='FILE', help='Write the measurements to this JSON file.')
+        parser.add_argument('--compare', metavar='FILE', help='Earlier --save output to compare against.')
+        parser.add_argument('--max-regression', type=float, metavar='PERCENT',
+                            help='With --compare, fail if a profile starts this much slower.')
+
+    def handle(self, *args, **options):
+        reports = {profile: startup.measure(profile, options['runs']) for profile in ('full', 'lean')}
+        for profile, report in reports.items():
+            self.stdout.write(
+                f"{profile}: django.setup() {report['setup_seconds'] * 1000:.0f} ms, "
+                f"interpreter total {report['wall_seconds'] * 1000:.0f} ms, {len(report['modules'])} modules"
+            )
+            for package, microseconds in startup.top_packages(report['modules'], options['top']):
+                self.stdout.write(f"    {package:<30} {microseconds / 1000:>8.1f} ms")
+
+        if options['save']:
+            with open(options['save'], 'w') as f:
+                json.dump(reports, f, indent=2)
+
+        regressions = []
+        if options['compare']:
+            with open(options['compare']) as f:
+                previous = json.load(f)
+            for profile, report in reports.items():
+                if profile not in previous:
+                    continue
+                before = previous[profile]['wall_seconds']
+                change = (report['wall_seconds'] - before) / before * 100
+                new_modules = sorted(set(report['modules']) - set(previous[profile]['modules']))
+                self.stdout.write(f"{profile}: {change:+.1f}% vs {options['compare']}, {len(new_modules)} new modules")
+                for name in new_modules[:options['top']]:
+                    self.stdout.write(f"    + {name}")
+                if options['max_regression'] is not None and change > options['max_regression']:
+                    regressions.append(f"{profile} {change:+.1f}%")
+        if regressions:
+            raise CommandError(f"Startup regressed: {', '.join(regressions)}")
+
+        saved = reports['full']['wall_seconds'] - reports['lean']['wall_seconds']
+        self.stdout.write(self.style.SUCCESS(f'The lean profile starts {saved * 1000:.0f} ms faster'))
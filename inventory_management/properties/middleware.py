@@ -0,0 +1,48 @@
+from django.conf import settings
+
+from . import profiler, routers
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+
+class PrimaryPinningMiddleware:
+    """
+    Route a request's reads to the primary database when it is a write request
+    (signup, admin saves, ...) or when the same client wrote within the last
+    PRIMARY_PIN_SECONDS, so users always see their own changes.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pinned = request.method not in SAFE_METHODS or settings.PRIMARY_PIN_COOKIE in request.COOKIES
+        token = routers.start_request(pinned)
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = routers.end_request(token)
+        if wrote:
+            response.set_cookie(
+                settings.PRIMARY_PIN_COOKIE,
+                '1',
+                max_age=settings.PRIMARY_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+
+class ProfilerMiddleware:
+    """
+    Profile requests from staff users who ask for it (see properties/profiler.py).
+    Must come after AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if profiler.wants_profile(request):
+            return profiler.profile_request(request, self.get_response)
+        return self.get_response(request)
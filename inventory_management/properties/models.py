@@ -1,8 +1,21 @@
+from collections import OrderedDict
+import copy
+import json
+import threading
+import time
+from uuid import uuid4
+
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import models
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection, models, transaction
 from django.contrib.gis.db import models as gis_models
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import BrinIndex, GinIndex, GistIndex
 from django.utils.timezone import now
-import json
+
+from .geohash import encode as encode_geohash
 
 
 class Location(models.Model):
@@ -69,6 +82,7 @@ class Location(models.Model):
     )
     updated_at = models.DateTimeField(
         auto_now=True,
+        db_index=True,  # max(updated_at) versions the in-process location index
         help_text="Timestamp when the location was last updated."
     )
 
@@ -81,6 +95,106 @@ class Location(models.Model):
         ordering = ["title"]
 
 
+# Amenity id -> name, filled from the Amenity table on demand (ids are never reused).
+# Renames store a new token under AMENITY_NAMES_VERSION_KEY; every process compares it
+# at most every AMENITY_NAMES_CHECK_INTERVAL seconds and starts over when it moved.
+_amenity_names = {}
+_amenity_names_checked = {'version': None, 'at': 0.0}
+
+AMENITY_NAMES_VERSION_KEY = 'amenity-names-version'
+
+
+def forget_amenity_names():
+    """Drop the id -> name cache here now, and in every other process after commit."""
+    _amenity_names.clear()
+    transaction.on_commit(lambda: cache.set(AMENITY_NAMES_VERSION_KEY, uuid4().hex, None))
+
+
+class Amenity(models.Model):
+    """Dictionary of amenity names; accommodations store the ids (``Accommodation.amenity_ids``)."""
+    id = models.SmallAutoField(primary_key=True)
+    name = models.CharField(max_length=100, unique=True)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name_plural = "Amenities"
+
+    @classmethod
+    def ids_for(cls, names, create=False):
+        """Ids of ``names`` in the same order, adding unknown names when ``create`` is set."""
+        names = list(dict.fromkeys(names))
+        ids = dict(cls.objects.filter(name__in=names).values_list('name', 'id'))
+        missing = [name for name in names if name not in ids]
+        if create and missing:
+            # Only insert what is missing: every conflicting row would still use up one of the 32767 ids
+            cls.objects.bulk_create([cls(name=name) for name in missing], ignore_conflicts=True)
+            ids.update(cls.objects.filter(name__in=missing).values_list('name', 'id'))
+        return [ids[name] for name in names if name in ids]
+
+    @classmethod
+    def names_for(cls, ids):
+        if time.monotonic() - _amenity_names_checked['at'] >= settings.AMENITY_NAMES_CHECK_INTERVAL:
+            version = cache.get(AMENITY_NAMES_VERSION_KEY)
+            if version != _amenity_names_checked['version']:
+                _amenity_names.clear()
+                _amenity_names_checked['version'] = version
+            _amenity_names_checked['at'] = time.monotonic()
+        if any(pk not in _amenity_names for pk in ids):
+            _amenity_names.update(cls.objects.values_list('id', 'name'))
+        return [_amenity_names[pk] for pk in ids if pk in _amenity_names]
+
+
+class AccommodationQuerySet(models.QuerySet):
+    """
+    Filters on the ``feed`` partition key. Feeds are cast to int so they reach
+    PostgreSQL as constants, which lets the planner prune partitions up front.
+    """
+
+    def for_feed(self, feed):
+        return self.filter(feed=int(feed))
+
+    def for_feeds(self, feeds):
+        feeds = sorted({int(feed) for feed in feeds})
+        if not feeds:
+            return self.none()
+        return self.filter(feed__in=feeds)
+
+    def for_keys(self, keys):
+        """Rows given as ``(id, feed)`` pairs; ids are only unique within a feed."""
+        by_feed = {}
+        for pk, feed in keys:
+            by_feed.setdefault(int(feed), []).append(pk)
+        if not by_feed:
+            return self.none()
+        condition = models.Q()
+        for feed, pks in sorted(by_feed.items()):
+            condition |= models.Q(feed=feed, pk__in=pks)
+        return self.filter(condition)
+
+    def in_partition(self, partition):
+        """Only rows of one ``partitions.FeedPartition``."""
+        return self.filter(partition.q())
+
+    def with_amenities(self, names):
+        """Accommodations having all of the amenities (a GIN-indexed containment check)."""
+        names = set(names)
+        ids = Amenity.ids_for(names)
+        if len(ids) < len(names):
+            return self.none()
+        return self.filter(amenity_ids__contains=ids)
+
+
+# Columns of the listing API responses, carried by its covering indexes
+LISTING_COLUMNS = ["title", "country_code", "location_id", "bedroom_count", "usd_rate", "review_score", "created_at"]
+
+
+def listing_columns(*key_columns):
+    """LISTING_COLUMNS an index has to include besides its key columns."""
+    return [column for column in LISTING_COLUMNS if column not in key_columns]
+
+
 class Accommodation(models.Model):
     id = models.CharField(max_length=20, primary_key=True)
     feed = models.PositiveSmallIntegerField(default=0)
@@ -92,15 +206,172 @@ class Accommodation(models.Model):
     center = gis_models.PointField()
     images = models.JSONField(null=True, blank=True)  # JSON array of image URLs
     location_id = models.ForeignKey(Location, on_delete=models.CASCADE)
-    amenities = models.JSONField(null=True, blank=True)  # JSONB array of amenities
+    amenity_ids = ArrayField(models.SmallIntegerField(), default=list, blank=True, editable=False)
+    # JSONB array of amenity names, only kept for rows not yet encoded by `manage.py encode_amenities`
+    legacy_amenities = models.JSONField(db_column="amenities", null=True, blank=True, editable=False)
     user_id = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     published = models.BooleanField(default=False)
+    # Geohash of center, kept in sync on save (see properties/geogrid.py for the rollups)
+    geohash = models.CharField(max_length=12, blank=True, editable=False)
+    # Default ordering of public listings, maintained by properties/ranking.py
+    rank_score = models.FloatField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = AccommodationQuerySet.as_manager()
+
+    # Names assigned through the amenities property, encoded on save
+    _pending_amenities = None
+
     def __str__(self):
         return self.title
 
+    @property
+    def amenities(self):
+        """Amenity names, the list this model used to store as JSON."""
+        if self._pending_amenities is not None:
+            return list(self._pending_amenities)
+        if self.amenity_ids:
+            return Amenity.names_for(self.amenity_ids)
+        return self.legacy_amenities if self.legacy_amenities is not None else []
+
+    @amenities.setter
+    def amenities(self, names):
+        self._pending_amenities = list(dict.fromkeys(str(name) for name in names or []))
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if self._pending_amenities is not None:
+            self.amenity_ids = Amenity.ids_for(self._pending_amenities, create=True)
+            self.legacy_amenities = None
+            if update_fields is not None and 'amenities' in update_fields:
+                update_fields = {*update_fields, 'amenity_ids', 'legacy_amenities'} - {'amenities'}
+                kwargs['update_fields'] = update_fields
+        if self.center is not None:
+            self.geohash = encode_geohash(self.center.x, self.center.y)
+            if update_fields is not None and 'center' in update_fields:
+                kwargs['update_fields'] = {*update_fields, 'geohash'}
+        super().save(*args, **kwargs)
+
+    class Meta:
+        indexes = [
+            # Nearest-neighbour (KNN) searches only consider published accommodations
+            GistIndex(fields=["center"], condition=models.Q(published=True), name="accommodation_pub_center_gist"),
+            # Prefix (cell) lookups on geohash
+            models.Index(fields=["geohash"], name="accommodation_geohash_idx", opclasses=["varchar_pattern_ops"]),
+            # max(updated_at) per location for HTTP validators
+            models.Index(fields=["location_id", "updated_at"], name="accommodation_loc_updated_idx"),
+            # Multi-amenity filters (amenity_ids @> ARRAY[...])
+            GinIndex(fields=["amenity_ids"], name="accommodation_amenity_ids_gin"),
+            # Public reads only ever ask for published rows: the indexes below leave unpublished feed rows out
+            # Top-N listings by rank_score per location and per country
+            models.Index(
+                fields=["location_id", "-rank_score", "id"], condition=models.Q(published=True), name="acc_pub_loc_rank_idx"
+            ),
+            models.Index(
+                fields=["country_code", "-rank_score", "id"], condition=models.Q(published=True), name="acc_pub_cc_rank_idx"
+            ),
+            # Keyset pages of /api/accommodations, all listing columns included for index-only scans
+            # (see properties/listings.py); descending sorts scan them backwards
+            models.Index(
+                fields=["usd_rate", "id"], include=listing_columns("usd_rate"), condition=models.Q(published=True),
+                name="acc_pub_price_cover_idx",
+            ),
+            models.Index(
+                fields=["country_code", "usd_rate", "id"], include=listing_columns("country_code", "usd_rate"),
+                condition=models.Q(published=True), name="acc_pub_cc_price_cover_idx",
+            ),
+            models.Index(
+                fields=["review_score", "id"], include=listing_columns("review_score"), condition=models.Q(published=True),
+                name="acc_pub_rating_cover_idx",
+            ),
+            models.Index(
+                fields=["country_code", "review_score", "id"], include=listing_columns("country_code", "review_score"),
+                condition=models.Q(published=True), name="acc_pub_cc_rating_cover_idx",
+            ),
+            models.Index(
+                fields=["created_at", "id"], include=listing_columns("created_at"), condition=models.Q(published=True),
+                name="acc_pub_recent_cover_idx",
+            ),
+            models.Index(
+                fields=["country_code", "created_at", "id"], include=listing_columns("country_code", "created_at"),
+                condition=models.Q(published=True), name="acc_pub_cc_recent_cover_idx",
+            ),
+        ]
+
+
+# Policy id -> document, least recently used first (documents never change once stored)
+_policy_documents = OrderedDict()
+_policy_documents_lock = threading.Lock()
+
+# Digests are taken over PostgreSQL's canonical jsonb text, so equal documents match
+# however their keys were ordered or spaced on input
+POLICY_STORE_SQL = """
+INSERT INTO properties_policy (digest, document)
+SELECT DISTINCT encode(sha256(convert_to(document::text, 'UTF8')), 'hex'), document
+FROM jsonb_array_elements(%s::jsonb) AS document
+ON CONFLICT (digest) DO NOTHING
+"""
+
+POLICY_IDS_SQL = """
+SELECT item.position, policy.id
+FROM jsonb_array_elements(%s::jsonb) WITH ORDINALITY AS item(document, position)
+JOIN properties_policy policy ON policy.digest = encode(sha256(convert_to(item.document::text, 'UTF8')), 'hex')
+"""
+
+
+class Policy(models.Model):
+    """
+    Content-addressed store of policy documents: each distinct document is
+    kept once and localizations reference it (``LocalizeAccommodation.policy_id``).
+    """
+    digest = models.CharField(max_length=64, unique=True)  # SHA-256 of the jsonb text
+    document = models.JSONField()
+
+    def __str__(self):
+        return self.digest[:12]
+
+    class Meta:
+        verbose_name_plural = "Policies"
+
+    @classmethod
+    def ids_for(cls, documents):
+        """Ids of ``documents`` in the same order, storing the new ones (two statements for any number)."""
+        keys = [json.dumps(document, sort_keys=True) for document in documents]
+        distinct = list(dict.fromkeys(keys))
+        if not distinct:
+            return []
+        payload = '[' + ','.join(distinct) + ']'
+        with connection.cursor() as cursor:
+            cursor.execute(POLICY_STORE_SQL, [payload])
+            cursor.execute(POLICY_IDS_SQL, [payload])
+            ids = dict(cursor.fetchall())
+        by_key = {key: ids[position] for position, key in enumerate(distinct, 1)}
+        return [by_key[key] for key in keys]
+
+    @classmethod
+    def documents_for(cls, ids):
+        """
+        ``{id: document}``, served from the in-process LRU cache where possible
+        and from one query for the rest. The documents are shared; don't modify them.
+        """
+        found, missing = {}, []
+        with _policy_documents_lock:
+            for pk in ids:
+                if pk in _policy_documents:
+                    _policy_documents.move_to_end(pk)
+                    found[pk] = _policy_documents[pk]
+                else:
+                    missing.append(pk)
+        if missing:
+            fetched = dict(cls.objects.filter(pk__in=missing).values_list('id', 'document'))
+            with _policy_documents_lock:
+                _policy_documents.update(fetched)
+                while len(_policy_documents) > settings.POLICY_CACHE_SIZE:
+                    _policy_documents.popitem(last=False)
+            found.update(fetched)
+        return found
+
 
 class LocalizeAccommodation(models.Model):
     LANGUAGES = [
@@ -119,12 +390,432 @@ class LocalizeAccommodation(models.Model):
     property_id = models.ForeignKey(Accommodation, on_delete=models.CASCADE)
     language = models.CharField(max_length=2, choices=LANGUAGES)
     description = models.TextField()
-    policy = models.JSONField()  # JSONB dictionary for policies
+    policy_id = models.ForeignKey(Policy, on_delete=models.PROTECT, null=True, blank=True, editable=False)
+    # JSONB policy document, only kept for rows not yet moved to the Policy store by `manage.py dedupe_policies`
+    legacy_policy = models.JSONField(db_column="policy", null=True, blank=True, editable=False)
+
+    # Document assigned through the policy property (or read for editing), stored on save
+    _pending_policy = None
 
     def __str__(self):
         return f"Localized {self.property_id.title} in {self.language}"
 
+    @property
+    def policy(self):
+        """The policy document. Reading keeps a private copy, so in-place changes are saved."""
+        if self._pending_policy is None and self.policy_id_id is not None:
+            document = Policy.documents_for([self.policy_id_id]).get(self.policy_id_id)
+            self._pending_policy = copy.deepcopy(document)
+        if self._pending_policy is not None:
+            return self._pending_policy
+        return self.legacy_policy
+
+    @policy.setter
+    def policy(self, document):
+        self._pending_policy = document
+
+    def clean(self):
+        if self.policy is None:
+            raise ValidationError({'policy': 'This field cannot be null.'})
+
+    def save(self, *args, **kwargs):
+        if self._pending_policy is not None:
+            self.policy_id_id = Policy.ids_for([self._pending_policy])[0]
+            self.legacy_policy = None
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'policy' in update_fields:
+                kwargs['update_fields'] = {*update_fields, 'policy_id', 'legacy_policy'} - {'policy'}
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = "Localized Accommodation"
         verbose_name_plural = "Localized Accommodations"
 
+
+
+class PublicCatalogEntry(models.Model):
+    """
+    A published accommodation with its Location breadcrumb and primary-language
+    description: a row of the ``properties_publiccatalog`` materialized view,
+    which properties/catalog.py creates and refreshes. Read-only.
+    """
+    id = models.CharField(max_length=20, primary_key=True)
+    feed = models.PositiveSmallIntegerField()
+    title = models.CharField(max_length=100)
+    country_code = models.CharField(max_length=2)
+    location_id = models.ForeignKey(Location, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+")
+    bedroom_count = models.PositiveIntegerField(null=True)
+    review_score = models.DecimalField(max_digits=3, decimal_places=1)
+    usd_rate = models.DecimalField(max_digits=10, decimal_places=2)
+    center = gis_models.PointField()
+    images = models.JSONField(null=True)
+    rank_score = models.FloatField()
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    # Ids and titles of the location's ancestors, root first, ending with the location itself
+    breadcrumb_ids = ArrayField(models.CharField(max_length=20))
+    breadcrumb = ArrayField(models.CharField(max_length=100))
+    language = models.CharField(max_length=2, null=True)
+    description = models.TextField(null=True)
+
+    def __str__(self):
+        return self.title
+
+    class Meta:
+        managed = False
+        db_table = 'properties_publiccatalog'
+        verbose_name = "Public Catalog Entry"
+        verbose_name_plural = "Public Catalog"
+
+
+class NearestAccommodation(models.Model):
+    """
+    Precomputed nearest published accommodations for a Location center,
+    maintained by properties/nearest.py.
+    """
+    location_id = models.ForeignKey(Location, on_delete=models.CASCADE, related_name="nearest_accommodations")
+    # No database constraint: the partitioned accommodation table's key includes feed
+    property_id = models.ForeignKey(Accommodation, on_delete=models.CASCADE, db_constraint=False, related_name="+")
+    rank = models.PositiveSmallIntegerField()
+    distance = models.FloatField(help_text="Distance from the location center in meters.")
+
+    def __str__(self):
+        return f"#{self.rank} near {self.location_id_id}: {self.property_id_id}"
+
+    class Meta:
+        verbose_name = "Nearest Accommodation"
+        verbose_name_plural = "Nearest Accommodations"
+        ordering = ["location_id", "rank"]
+        constraints = [
+            models.UniqueConstraint(fields=["location_id", "rank"], name="nearest_location_rank_uniq"),
+        ]
+        indexes = [
+            models.Index(fields=["property_id"], name="nearest_property_idx"),
+        ]
+
+
+class NearestListingsCoverage(models.Model):
+    """Per-location search radius of the nearest listings, used to find locations a change affects."""
+    location_id = models.OneToOneField(Location, on_delete=models.CASCADE, primary_key=True, related_name="+")
+    radius = models.FloatField(null=True, help_text="Distance of the farthest listed accommodation in meters.")
+    extent = gis_models.PolygonField(
+        null=True, help_text="Box around the location center containing its radius, for the spatial index."
+    )
+    is_full = models.BooleanField(default=False, help_text="Whether the location has the full number of listings.")
+    refreshed_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["is_full"], condition=models.Q(is_full=False), name="nearest_coverage_partial_idx"),
+        ]
+
+
+class NearestListingsChange(models.Model):
+    """Queue of accommodations/locations whose nearest listings need recomputing."""
+    accommodation = models.CharField(max_length=20, null=True, blank=True)
+    location = models.CharField(max_length=20, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class GeoGridCell(models.Model):
+    """
+    Published accommodation statistics for one geohash cell at one level
+    (the cell is the geohash prefix of that length), maintained by properties/geogrid.py.
+    """
+    level = models.PositiveSmallIntegerField()
+    cell = models.CharField(max_length=12)
+    center = gis_models.PointField()
+    accommodation_count = models.IntegerField(default=0)
+    usd_rate_sum = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    review_score_sum = models.DecimalField(max_digits=14, decimal_places=1, default=0)
+    avg_usd_rate = models.FloatField(null=True)
+    avg_review_score = models.FloatField(null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.cell} (level {self.level}): {self.accommodation_count}"
+
+    class Meta:
+        verbose_name = "Geo Grid Cell"
+        verbose_name_plural = "Geo Grid Cells"
+        constraints = [
+            models.UniqueConstraint(fields=["level", "cell"], name="geogrid_level_cell_uniq"),
+        ]
+
+
+class Job(models.Model):
+    # Lifecycle states for a background job
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+    STATUSES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+        (CANCELLED, 'Cancelled'),
+    ]
+
+    kind = models.CharField(
+        max_length=50,
+        help_text="Name of the registered job handler to run."
+    )
+    payload = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="JSON arguments passed to the job handler."
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=STATUSES,
+        default=QUEUED,
+        db_index=True
+    )
+    progress = models.PositiveSmallIntegerField(
+        default=0,
+        help_text="Completion percentage (0-100)."
+    )
+    progress_message = models.CharField(max_length=255, blank=True, default='')
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    cancel_requested = models.BooleanField(default=False)
+    run_after = models.DateTimeField(
+        default=now,
+        help_text="The job is not picked up by a worker before this time."
+    )
+    locked_by = models.CharField(max_length=100, blank=True, default='')
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.SUCCEEDED, self.FAILED, self.CANCELLED)
+
+    class Meta:
+        verbose_name = "Background Job"
+        verbose_name_plural = "Background Jobs"
+        ordering = ["-created_at"]
+        indexes = [
+            # Workers poll for the oldest runnable job
+            models.Index(fields=["status", "run_after"], name="job_status_run_after_idx"),
+        ]
+
+
+class ChangeLogEntry(models.Model):
+    """
+    Append-only log of changes to Accommodation, LocalizeAccommodation and Location.
+
+    The table is range-partitioned by month on ``changed_at``, which Django cannot
+    create, so it is unmanaged and maintained by properties/changefeed.py.
+    """
+    UPSERT = 'u'
+    DELETE = 'd'
+    ACTIONS = [
+        (UPSERT, 'Upsert'),
+        (DELETE, 'Delete'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    changed_at = models.DateTimeField(default=now)
+    model = models.CharField(max_length=30)
+    object_id = models.CharField(max_length=20)
+    action = models.CharField(max_length=1, choices=ACTIONS)
+    data = models.JSONField(null=True, blank=True)  # Compact field delta, null for deletes
+    # Id of the writing transaction: the feed's order (see properties/changefeed.py)
+    txid = models.BigIntegerField(
+        db_default=models.Func(function='txid_current', output_field=models.BigIntegerField()), editable=False
+    )
+
+    def __str__(self):
+        return f"{self.model} {self.object_id} {self.get_action_display()} at {self.changed_at}"
+
+    class Meta:
+        managed = False
+        db_table = 'properties_changelog'
+        verbose_name = "Change Log Entry"
+        verbose_name_plural = "Change Log Entries"
+        ordering = ["changed_at", "id"]
+
+
+class PriceHistory(models.Model):
+    """
+    Append-only record of accommodation price changes (the first row of an
+    accommodation has no old price). Rows are written by database triggers on
+    the accommodation table, so every write path is covered. Like the change
+    log, the table is range-partitioned by month and maintained by
+    properties/prices.py, with BRIN indexes instead of B-trees.
+    """
+    id = models.BigAutoField(primary_key=True)
+    changed_at = models.DateTimeField(default=now)
+    # No database constraints: history outlives deleted accommodations
+    property_id = models.ForeignKey(
+        Accommodation, on_delete=models.DO_NOTHING, db_constraint=False, db_column="accommodation_id", related_name="+"
+    )
+    location_id = models.ForeignKey(
+        Location, on_delete=models.DO_NOTHING, db_constraint=False, db_column="location_id", related_name="+"
+    )
+    country_code = models.CharField(max_length=2)
+    old_usd_rate = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    usd_rate = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def __str__(self):
+        return f"{self.property_id_id}: {self.old_usd_rate} -> {self.usd_rate} at {self.changed_at}"
+
+    class Meta:
+        managed = False
+        db_table = 'properties_pricehistory'
+        verbose_name = "Price History"
+        verbose_name_plural = "Price History"
+        ordering = ["changed_at", "id"]
+
+
+class PriceRollup(models.Model):
+    """
+    Daily and weekly price summaries for price trend charts (see properties/prices.py).
+
+    Accommodation rows summarize the price changes of the period (open, close,
+    min, max, and count/sum of the new prices). Location and country rows
+    summarize the published catalog's prices, sampled once per day; weekly
+    rows combine the daily ones. The average is always ``price_sum / sample_count``.
+    """
+    ACCOMMODATION = 'accommodation'
+    LOCATION = 'location'
+    COUNTRY = 'country'
+    SCOPES = [
+        (ACCOMMODATION, 'Accommodation'),
+        (LOCATION, 'Location'),
+        (COUNTRY, 'Country'),
+    ]
+    DAY = 'day'
+    WEEK = 'week'
+    PERIODS = [
+        (DAY, 'Day'),
+        (WEEK, 'Week'),
+    ]
+
+    scope = models.CharField(max_length=13, choices=SCOPES)
+    key = models.CharField(max_length=20, help_text="Accommodation id, location id or country code.")
+    period = models.CharField(max_length=4, choices=PERIODS)
+    bucket = models.DateField(help_text="The day, or the Monday of the week.")
+    sample_count = models.PositiveIntegerField()
+    price_sum = models.DecimalField(max_digits=18, decimal_places=2)
+    min_usd_rate = models.DecimalField(max_digits=10, decimal_places=2)
+    max_usd_rate = models.DecimalField(max_digits=10, decimal_places=2)
+    open_usd_rate = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    close_usd_rate = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.scope} {self.key} {self.period} {self.bucket}"
+
+    class Meta:
+        verbose_name = "Price Rollup"
+        verbose_name_plural = "Price Rollups"
+        constraints = [
+            # Also serves the trend queries: one key's buckets in date order
+            models.UniqueConstraint(fields=["scope", "key", "period", "bucket"], name="pricerollup_bucket_uniq"),
+        ]
+        indexes = [
+            # Rollups are written in bucket order, so a BRIN index stays tiny
+            BrinIndex(fields=["bucket"], name="pricerollup_bucket_brin"),
+        ]
+
+
+class GeoAuditRun(models.Model):
+    """One run of ``manage.py audit_geo_consistency`` (see properties/geoaudit.py)."""
+    started_at = models.DateTimeField(auto_now_add=True)
+    duration = models.FloatField(help_text="Scan time in seconds.")
+    checked_count = models.PositiveIntegerField(default=0)
+    issue_count = models.PositiveIntegerField(default=0)
+    thresholds = models.JSONField(default=dict, help_text="Maximum distance in km per location type.")
+
+    def __str__(self):
+        return f"Geo audit {self.started_at:%Y-%m-%d %H:%M} ({self.issue_count} issues)"
+
+    class Meta:
+        verbose_name = "Geo Audit Run"
+        verbose_name_plural = "Geo Audit Runs"
+        ordering = ["-started_at"]
+
+
+class GeoConsistencyIssue(models.Model):
+    """An accommodation too far from its location's center, or in another country than the location."""
+    run = models.ForeignKey(GeoAuditRun, on_delete=models.CASCADE, related_name="issues")
+    # No database constraint: the partitioned accommodation table's key includes feed
+    property_id = models.ForeignKey(Accommodation, on_delete=models.CASCADE, db_constraint=False, related_name="+")
+    location_id = models.ForeignKey(Location, on_delete=models.CASCADE, related_name="+")
+    location_type = models.CharField(max_length=20)
+    distance_km = models.FloatField(help_text="Great-circle distance between the two centers.")
+    max_distance_km = models.FloatField(null=True, help_text="Threshold for the location type, if any.")
+    too_far = models.BooleanField(default=False)
+    country_mismatch = models.BooleanField(default=False)
+    accommodation_country = models.CharField(max_length=2)
+    location_country = models.CharField(max_length=2, blank=True)
+
+    def __str__(self):
+        return f"{self.property_id_id} vs {self.location_id_id}"
+
+    class Meta:
+        verbose_name = "Geo Consistency Issue"
+        verbose_name_plural = "Geo Consistency Issues"
+        ordering = ["run", "-distance_km"]
+        indexes = [
+            models.Index(fields=["run", "-distance_km"], name="geoissue_run_distance_idx"),
+        ]
+
+
+class SavedAreaSearch(models.Model):
+    """
+    A polygon area search kept for later (see properties/area_search.py). The
+    polygon is stored simplified; the result count is cached and recounted
+    by a job after AREA_SEARCH_COUNT_TTL seconds.
+    """
+    name = models.CharField(max_length=100)
+    geometry = gis_models.MultiPolygonField(srid=4326)
+    original_vertex_count = models.PositiveIntegerField(default=0, editable=False)
+    vertex_count = models.PositiveIntegerField(default=0, editable=False)
+    result_count = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    counted_at = models.DateTimeField(null=True, blank=True, editable=False)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name = "Saved Area Search"
+        verbose_name_plural = "Saved Area Searches"
+        ordering = ["-created_at"]
+
+
+class RequestProfile(models.Model):
+    """A profiled request: sampled Python stacks and SQL timeline (see properties/profiler.py)."""
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=2000)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    duration = models.FloatField(help_text="Wall time in milliseconds.")
+    sample_interval = models.FloatField(help_text="Milliseconds between stack samples.")
+    samples = models.JSONField(default=dict, help_text="Sample counts per collapsed stack (frames joined by ';').")
+    queries = models.JSONField(default=list, help_text="SQL timeline: start and duration in ms, alias, statement.")
+    query_count = models.PositiveIntegerField(default=0)
+    query_time = models.FloatField(default=0, help_text="Total SQL time in milliseconds.")
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration:.0f} ms)"
+
+    class Meta:
+        verbose_name = "Request Profile"
+        verbose_name_plural = "Request Profiles"
+        ordering = ["-created_at"]
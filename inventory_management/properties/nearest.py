@@ -0,0 +1,231 @@
+"""
+Precomputed "nearest published accommodations" per Location center.
+
+Full refreshes run per country (one background job each) with a KNN lateral
+join. Saves, moves and deletes of accommodations are queued in
+NearestListingsChange and applied incrementally by recomputing only the
+locations whose lists they can affect.
+"""
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.timezone import now
+
+from . import jobs, page_cache
+from .models import (
+    Accommodation,
+    Location,
+    NearestAccommodation,
+    NearestListingsChange,
+    NearestListingsCoverage,
+)
+
+# Rank by true (geodesic) distance among a few more KNN candidates than needed,
+# since the index orders by planar distance in degrees.
+REFRESH_SQL = """
+WITH ranked AS (
+    SELECT loc.id AS location_id,
+           knn.property_id,
+           knn.distance,
+           row_number() OVER (PARTITION BY loc.id ORDER BY knn.distance, knn.property_id) AS rank
+    FROM properties_location loc
+    CROSS JOIN LATERAL (
+        SELECT acc.id AS property_id,
+               ST_Distance(acc.center::geography, loc.center::geography) AS distance
+        FROM properties_accommodation acc
+        WHERE acc.published
+        ORDER BY acc.center <-> loc.center
+        LIMIT %(candidates)s
+    ) knn
+    WHERE loc.id = ANY(%(location_ids)s)
+)
+INSERT INTO properties_nearestaccommodation (location_id_id, property_id_id, rank, distance)
+SELECT location_id, property_id, rank, distance FROM ranked WHERE rank <= %(limit)s
+"""
+
+# The extent is a lon/lat box around the center containing the radius circle.
+# 110000 m is less than a degree of latitude anywhere, so the box errs on the large side.
+COVERAGE_SQL = """
+WITH coverage AS (
+    SELECT loc.id, loc.center, max(near.distance) / 110000.0 AS dy,
+           max(near.distance) AS radius, count(near.id) AS listed
+    FROM properties_location loc
+    LEFT JOIN properties_nearestaccommodation near ON near.location_id_id = loc.id
+    WHERE loc.id = ANY(%(location_ids)s)
+    GROUP BY loc.id
+)
+INSERT INTO properties_nearestlistingscoverage (location_id_id, radius, extent, is_full, refreshed_at)
+SELECT id,
+       radius,
+       ST_Expand(center, least(dy / greatest(cos(radians(least(abs(ST_Y(center)) + dy, 89.9))), 1e-6), 180.0), dy),
+       listed >= %(limit)s,
+       %(refreshed_at)s
+FROM coverage
+ON CONFLICT (location_id_id) DO UPDATE
+SET radius = EXCLUDED.radius, extent = EXCLUDED.extent,
+    is_full = EXCLUDED.is_full, refreshed_at = EXCLUDED.refreshed_at
+"""
+
+# Serializes refreshes of the same location: concurrent full and incremental refreshes
+# would otherwise both insert its ranks and collide on (location_id, rank).
+# Taken in sorted id order (unnest keeps array order) so two refreshes cannot deadlock.
+LOCK_SQL = """
+SELECT pg_advisory_xact_lock(%(namespace)s, hashtext(location_id))
+FROM unnest(%(location_ids)s::varchar[]) AS location_id
+"""
+
+# First key of the advisory locks, keeping them apart from other users of advisory locks
+LOCK_NAMESPACE = 0x6e656172  # "near"
+
+# Locations whose list a published accommodation at one of the (lon, lat) points would
+# enter: the GiST index on each location's own extent finds those whose box holds the
+# point, then the exact geodesic distance is checked against that location's radius.
+CANDIDATES_SQL = """
+SELECT DISTINCT cov.location_id_id
+FROM unnest(%(lons)s::float8[], %(lats)s::float8[]) AS p(lon, lat)
+JOIN properties_nearestlistingscoverage cov
+  ON cov.extent && ST_SetSRID(ST_MakePoint(p.lon, p.lat), 4326)
+JOIN properties_location loc ON loc.id = cov.location_id_id
+WHERE ST_DWithin(loc.center::geography, ST_SetSRID(ST_MakePoint(p.lon, p.lat), 4326)::geography, cov.radius)
+"""
+
+
+def refresh_locations(location_ids, limit=None):
+    """Recompute the nearest listings of the given locations in one transaction."""
+    limit = limit or settings.NEAREST_LISTINGS_LIMIT
+    location_ids = list(location_ids)
+    if not location_ids:
+        return
+    params = {
+        'location_ids': location_ids,
+        'limit': limit,
+        'candidates': limit * 2,
+        'refreshed_at': now(),
+    }
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(LOCK_SQL, {'namespace': LOCK_NAMESPACE, 'location_ids': sorted(location_ids)})
+        NearestAccommodation.objects.filter(location_id__in=location_ids).delete()
+        cursor.execute(REFRESH_SQL, params)
+        cursor.execute(COVERAGE_SQL, params)
+        # Only the "nearby" fragment of these pages changes, not their ancestors'
+        transaction.on_commit(lambda: page_cache.invalidate(location_ids, ancestors=False))
+
+
+def refresh_country(country_code, limit=None, batch_size=500, progress=None):
+    """
+    Recompute every location of a country in batches of ``batch_size``. Each
+    batch commits on its own, so an interrupted refresh can simply be rerun.
+    """
+    locations = Location.objects.filter(country_code=country_code).order_by('id')
+    location_ids = list(locations.values_list('id', flat=True))
+    for start in range(0, len(location_ids), batch_size):
+        refresh_locations(location_ids[start:start + batch_size], limit=limit)
+        if progress:
+            progress(min(start + batch_size, len(location_ids)), len(location_ids))
+    return len(location_ids)
+
+
+def affected_locations(accommodation_ids, points):
+    """
+    Locations whose nearest listings may change because of these accommodations:
+    those currently listing them, those not yet full, and those whose radius
+    contains one of the new ``(lon, lat)`` points.
+    """
+    affected = set(
+        NearestAccommodation.objects.filter(property_id__in=accommodation_ids)
+        .values_list('location_id', flat=True)
+    )
+    if not points:
+        return affected
+    affected.update(
+        NearestListingsCoverage.objects.filter(is_full=False).values_list('location_id', flat=True)
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(CANDIDATES_SQL, {'lons': [lon for lon, _ in points], 'lats': [lat for _, lat in points]})
+        affected.update(row[0] for row in cursor.fetchall())
+    return affected
+
+
+def process_changes(batch_size=1000, progress=None):
+    """
+    Apply queued NearestListingsChange rows until the queue is empty. Returns
+    the count. ``progress(applied, pending)`` is called after every batch;
+    changes queued meanwhile are counted as pending.
+    """
+    processed = 0
+    while True:
+        with transaction.atomic():
+            changes = list(
+                NearestListingsChange.objects.select_for_update(skip_locked=True).order_by('id')[:batch_size]
+            )
+            if not changes:
+                return processed
+            accommodation_ids = {c.accommodation for c in changes if c.accommodation}
+            points = [
+                (center.x, center.y)
+                for center in Accommodation.objects.filter(pk__in=accommodation_ids, published=True)
+                .values_list('center', flat=True)
+            ]
+            location_ids = affected_locations(accommodation_ids, points)
+            location_ids.update(c.location for c in changes if c.location)
+            refresh_locations(location_ids)
+            NearestListingsChange.objects.filter(pk__in=[c.pk for c in changes]).delete()
+        processed += len(changes)
+        if progress:
+            progress(processed, NearestListingsChange.objects.count())
+
+
+def queue_changes(accommodation_ids=(), location_ids=()):
+    """Record changed accommodations/locations and make sure a worker will apply them."""
+    NearestListingsChange.objects.bulk_create(
+        [NearestListingsChange(accommodation=pk) for pk in accommodation_ids]
+        + [NearestListingsChange(location=pk) for pk in location_ids],
+        batch_size=5000,
+    )
+    transaction.on_commit(lambda: jobs.enqueue_unique('nearest_listings_changes'))
+
+
+def remember_previous_placement(sender, instance, **kwargs):
+    """pre_save: whether an existing accommodation was published, and where."""
+    if not instance._state.adding:
+        instance._previous_nearest_placement = (
+            Accommodation.objects.filter(pk=instance.pk).values_list('published', 'center').first()
+        )
+
+
+def accommodation_saved(sender, instance, created, **kwargs):
+    # Only publishing, unpublishing and moving a published listing change any ranking;
+    # saves of unpublished listings and edits of price, title etc. are not queued.
+    previous = None if created else getattr(instance, '_previous_nearest_placement', None)
+    if previous is None:
+        changed = instance.published
+    else:
+        was_published, previous_center = previous
+        changed = instance.published != was_published or (instance.published and instance.center != previous_center)
+    if changed:
+        queue_changes(accommodation_ids=[instance.pk])
+
+
+def accommodation_deleted(sender, instance, **kwargs):
+    # Unpublished listings are never ranked
+    if instance.published:
+        queue_changes(accommodation_ids=[instance.pk])
+
+
+def accommodations_bulk_changed(sender, keys, changes, **kwargs):
+    if 'published' in changes:
+        queue_changes(accommodation_ids=[pk for pk, _ in keys])
+
+
+def location_saved(sender, instance, **kwargs):
+    # New locations and moved centers need their own list recomputed
+    queue_changes(location_ids=[instance.pk])
+
+
+def nearest_accommodations(location, limit=None):
+    """The precomputed nearest published accommodations of ``location``, closest first."""
+    queryset = (
+        NearestAccommodation.objects.filter(location_id=location)
+        .select_related('property_id')
+        .order_by('rank')
+    )
+    return [near.property_id for near in queryset[:limit or settings.NEAREST_LISTINGS_LIMIT]]
@@ -0,0 +1,83 @@
+"""
+Versioned fragment caching for location landing pages.
+
+Each location has a version token in the cache. Fragment cache keys include
+it, so changing a listing only needs new tokens for its location and the
+location's ancestors (whose subtrees contain it); stale fragments expire.
+"""
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+
+from . import listings
+from .location_index import get_location_index
+from .models import Accommodation
+
+_missing = object()
+
+
+def version_key(location_id):
+    return f'location-page-version:{location_id}'
+
+
+def location_version(location_id):
+    key = version_key(location_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def listings_last_modified(index, location_id):
+    """
+    ``max(updated_at)`` of the accommodations in a location's subtree. Memoized
+    per version token, so it is only recomputed after the subtree changed.
+    """
+    key = f'location-page-modified:{location_id}:{location_version(location_id)}'
+    last_modified = cache.get(key, _missing)
+    if last_modified is _missing:
+        last_modified = (
+            Accommodation.objects.filter(location_id__in=listings.subtree_ids(location_id))
+            .aggregate(last_modified=Max('updated_at'))['last_modified']
+        )
+        cache.set(key, last_modified, settings.LOCATION_PAGE_CACHE_TIMEOUT)
+    return last_modified
+
+
+def invalidate(location_ids, ancestors=True):
+    """Give the locations (and by default their ancestors) new version tokens."""
+    index = get_location_index()
+    affected = set()
+    for location_id in location_ids:
+        if location_id is None:
+            continue
+        affected.add(location_id)
+        node = index.find(location_id) if ancestors else None
+        if node is not None:
+            affected.update(index.id(n) for n in index.ancestors(node))
+    if affected:
+        token = uuid4().hex
+        cache.set_many({version_key(location_id): token for location_id in affected}, None)
+
+
+def remember_previous_location(sender, instance, **kwargs):
+    """pre_save: note where an existing accommodation was, in case it moves."""
+    if not instance._state.adding:
+        instance._previous_location_id = (
+            Accommodation.objects.filter(pk=instance.pk).values_list('location_id', flat=True).first()
+        )
+
+
+def accommodation_changed(sender, instance, **kwargs):
+    # After commit, so a concurrent request cannot re-cache the old rows under the new version
+    location_ids = {instance.location_id_id, getattr(instance, '_previous_location_id', None)}
+    transaction.on_commit(lambda: invalidate(location_ids))
+
+
+def accommodations_bulk_changed(sender, keys, changes, location_ids=(), **kwargs):
+    moved_to = changes.get('location_id')
+    invalidate(set(location_ids) | ({moved_to.pk} if moved_to is not None else set()))
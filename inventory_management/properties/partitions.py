@@ -0,0 +1,215 @@
+"""
+Feed partitions of the accommodation table (see migration 0008) and helpers
+that scan them concurrently.
+
+``map_partitions`` runs a function on one queryset per partition in a thread
+pool (database-bound work: each thread has its own connection, so PostgreSQL
+scans the partitions on separate cores) or a process pool (Python-bound work
+such as serializing exports), and merges the results.
+"""
+import multiprocessing
+import operator
+import pickle
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial, reduce
+
+import django
+from django.apps import apps
+from django.db import connections
+from django.db.models import Avg, Count, Max, Min, Q, Sum
+
+# Upper bound (exclusive) of the smallint feed column
+FEED_LIMIT = 32768
+
+PARTITIONS_SQL = """
+SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+FROM pg_inherits
+JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+WHERE parent.relname = %s
+ORDER BY child.relname
+"""
+
+RANGE_BOUND = re.compile(r"FOR VALUES FROM \((\d+)\) TO \((\d+)\)")
+
+# alias -> partitions, read once per process
+_partitions = {}
+
+
+class FeedPartition:
+    """
+    A range partition ``[lower, upper)`` of the feed column. The default
+    partition holds the gaps between the ranges of its siblings.
+    """
+
+    def __init__(self, name, ranges):
+        self.name = name
+        self.ranges = ranges
+
+    def __repr__(self):
+        return f"<FeedPartition {self.name} {self.ranges}>"
+
+    def q(self):
+        """Filter selecting exactly this partition's rows, in a form the planner prunes on."""
+        if not self.ranges:
+            return Q(pk__in=[])
+        return reduce(operator.or_, (Q(feed__gte=lower, feed__lt=upper) for lower, upper in self.ranges))
+
+
+def parse_partitions(rows, limit=FEED_LIMIT):
+    """FeedPartitions from ``(name, bound expression)`` catalog rows."""
+    partitions, default = [], None
+    for name, bound in rows:
+        match = RANGE_BOUND.fullmatch(bound)
+        if match:
+            partitions.append(FeedPartition(name, [(int(match[1]), int(match[2]))]))
+        elif bound == 'DEFAULT':
+            default = name
+        else:
+            raise ValueError(f"Unsupported partition bound for {name}: {bound}")
+    partitions.sort(key=lambda p: p.ranges[0])
+    if default:
+        gaps, start = [], 0
+        for partition in partitions:
+            lower, upper = partition.ranges[0]
+            if lower > start:
+                gaps.append((start, lower))
+            start = max(start, upper)
+        if start < limit:
+            gaps.append((start, limit))
+        partitions.append(FeedPartition(default, gaps))
+    return partitions
+
+
+def feed_partitions(using='default'):
+    """
+    Partitions of the accommodation table. An unpartitioned table (e.g. before
+    migration 0008 or in tests) is reported as a single partition.
+    """
+    if using not in _partitions:
+        from .models import Accommodation
+
+        table = Accommodation._meta.db_table
+        with connections[using].cursor() as cursor:
+            cursor.execute(PARTITIONS_SQL, [table])
+            partitions = parse_partitions(cursor.fetchall())
+        _partitions[using] = partitions or [FeedPartition(table, [(0, FEED_LIMIT)])]
+    return _partitions[using]
+
+
+def _run_in_thread(func, queryset):
+    try:
+        return func(queryset)
+    finally:
+        # Each pool thread opened its own connections
+        connections.close_all()
+
+
+def _run_in_process(func, model_label, query, using):
+    queryset = apps.get_model(model_label)._default_manager.using(using).all()
+    queryset.query = pickle.loads(query)
+    try:
+        return func(queryset)
+    finally:
+        connections.close_all()
+
+
+def map_partitions(queryset, func, merge=None, workers=None, processes=False):
+    """
+    Call ``func(queryset.in_partition(p))`` for every feed partition concurrently
+    and return the results in partition order, reduced with ``merge`` if given.
+
+    With ``processes=True`` the querysets are pickled to spawned workers, so
+    ``func`` must be a module-level function. Inside a transaction partitions
+    are scanned one by one on the current connection, since other connections
+    would not see its uncommitted writes.
+    """
+    partitions = feed_partitions(queryset.db)
+    querysets = [queryset.in_partition(p) for p in partitions]
+    workers = min(workers or len(partitions), len(partitions))
+
+    if workers == 1 or connections[queryset.db].in_atomic_block:
+        results = [func(qs) for qs in querysets]
+    elif processes:
+        label = queryset.model._meta.label
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup,
+        ) as pool:
+            results = list(pool.map(
+                partial(_run_in_process, func, label),
+                [pickle.dumps(qs.query) for qs in querysets],
+                [qs.db for qs in querysets],
+            ))
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(partial(_run_in_thread, func), querysets))
+
+    return reduce(merge, results) if merge else results
+
+
+# How per-partition values of each aggregate combine
+_MERGERS = {
+    Count: lambda a, b: a + b,
+    Sum: lambda a, b: a + b,
+    Min: min,
+    Max: max,
+}
+
+
+def parallel_aggregate(queryset, workers=None, **aggregates):
+    """
+    ``queryset.aggregate(**aggregates)`` computed per partition concurrently.
+    Supports Count, Sum, Min, Max and Avg (merged from a per-partition sum and count).
+    """
+    partials = {}
+    for name, aggregate in aggregates.items():
+        if isinstance(aggregate, Avg):
+            expression = aggregate.get_source_expressions()[0]
+            partials[f'{name}__sum'] = Sum(expression)
+            partials[f'{name}__count'] = Count(expression)
+        elif type(aggregate) in _MERGERS and not getattr(aggregate, 'distinct', False):
+            partials[name] = aggregate
+        else:
+            raise ValueError(f"Cannot merge {type(aggregate).__name__} across partitions")
+
+    merged = {}
+    for result in map_partitions(queryset, lambda qs: qs.aggregate(**partials), workers=workers):
+        for key, value in result.items():
+            if value is None:
+                continue
+            aggregate_type = type(partials[key])
+            merged[key] = value if key not in merged else _MERGERS[aggregate_type](merged[key], value)
+
+    values = {}
+    for name, aggregate in aggregates.items():
+        if isinstance(aggregate, Avg):
+            count = merged.get(f'{name}__count')
+            values[name] = merged[f'{name}__sum'] / count if count else None
+        elif isinstance(aggregate, Count):
+            values[name] = merged.get(name, 0)
+        else:
+            values[name] = merged.get(name)
+    return values
+
+
+def export_dataset(resource_class, queryset):
+    return resource_class().export(queryset=queryset)
+
+
+def parallel_export(queryset, resource_class, workers=None):
+    """
+    Export ``queryset`` with an import-export resource, one spawned process per
+    partition, and return the combined tablib Dataset (rows in partition order).
+    """
+    import tablib
+
+    datasets = map_partitions(
+        queryset, partial(export_dataset, resource_class), workers=workers, processes=True
+    )
+    merged = tablib.Dataset(headers=datasets[0].headers)
+    for dataset in datasets:
+        merged.extend(dataset)
+    return merged
@@ -0,0 +1,87 @@
+"""
+Bulk helpers for the content-addressed Policy store: moving the legacy
+``policy`` JSON column of LocalizeAccommodation into it, creating many
+localizations with one policy lookup per batch, and warming the LRU cache
+before rendering a list of localizations. Single saves store their own policy.
+"""
+from django.db import connection, transaction
+
+from .changefeed import model_label, serialize
+from .models import Accommodation, ChangeLogEntry, LocalizeAccommodation, Policy
+from .ranking import refresh
+
+DIGEST_SQL = "encode(sha256(convert_to(properties_localizeaccommodation.policy::text, 'UTF8')), 'hex')"
+
+STORE_SQL = f"""
+INSERT INTO properties_policy (digest, document)
+SELECT DISTINCT {DIGEST_SQL}, policy
+FROM properties_localizeaccommodation
+WHERE policy IS NOT NULL AND id = ANY(%s)
+ON CONFLICT (digest) DO NOTHING
+"""
+
+LINK_SQL = f"""
+UPDATE properties_localizeaccommodation
+SET policy_id_id = policy.id, policy = NULL
+FROM properties_policy policy
+WHERE properties_localizeaccommodation.id = ANY(%s)
+  AND properties_localizeaccommodation.policy IS NOT NULL
+  AND policy.digest = {DIGEST_SQL}
+"""
+
+
+def dedupe(batch_size=10000):
+    """
+    Move legacy policies into the store, ``batch_size`` rows per transaction.
+    Returns ``(policies added, localizations linked)``.
+    """
+    pending = LocalizeAccommodation.objects.filter(legacy_policy__isnull=False).order_by('pk')
+    added = linked = 0
+    while True:
+        pks = list(pending.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return added, linked
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(STORE_SQL, [pks])
+            added += cursor.rowcount
+            cursor.execute(LINK_SQL, [pks])
+            linked += cursor.rowcount
+
+
+def prune():
+    """Delete policies no localization refers to. Run while nothing else writes localizations."""
+    deleted, _ = Policy.objects.filter(localizeaccommodation__isnull=True).delete()
+    return deleted
+
+
+def bulk_create(localizations, batch_size=1000):
+    """
+    Create many LocalizeAccommodation rows, resolving the policies of each
+    batch with one Policy.ids_for call. Like QuerySet.bulk_create this skips
+    save() and signals, so the change log and rank scores are updated here.
+    """
+    for start in range(0, len(localizations), batch_size):
+        batch = localizations[start:start + batch_size]
+        pending = [loc for loc in batch if loc._pending_policy is not None]
+        for loc, pk in zip(pending, Policy.ids_for([loc._pending_policy for loc in pending])):
+            loc.policy_id_id = pk
+            loc.legacy_policy = None
+        with transaction.atomic():
+            LocalizeAccommodation.objects.bulk_create(batch)
+            ChangeLogEntry.objects.bulk_create([
+                ChangeLogEntry(
+                    model=model_label(LocalizeAccommodation),
+                    object_id=str(loc.pk),
+                    action=ChangeLogEntry.UPSERT,
+                    data=serialize(loc),
+                )
+                for loc in batch
+            ])
+            refresh(Accommodation.objects.filter(pk__in={loc.property_id_id for loc in batch}))
+    return localizations
+
+
+def load(localizations):
+    """Fetch the policies of ``localizations`` missing from the cache in one query."""
+    Policy.documents_for({loc.policy_id_id for loc in localizations if loc.policy_id_id is not None})
+    return localizations
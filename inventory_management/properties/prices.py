@@ -0,0 +1,196 @@
+"""
+Price history and price trend rollups.
+
+Triggers on the accommodation table append to the monthly partitioned
+``properties_pricehistory`` table inside the writing statement: bulk inserts
+are copied from the statement's transition table with one INSERT, and
+updates join the statement's old and new rows on ``(id, feed)`` and record
+only those whose ``usd_rate`` actually changed, also with one INSERT however
+many rows the UPDATE touched. Ingestion needs no extra round trips.
+
+``rollup_day`` and ``rollup_week`` maintain PriceRollup rows: price changes
+per accommodation from the history, and the published catalog's prices per
+location and country sampled from the accommodation table. Trend charts only
+read rollups.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db import connection, transaction
+from django.db.models import Max, Min, Sum
+from django.utils import timezone
+
+from .changefeed import create_month_partitions
+from .models import PriceRollup
+
+TABLE = 'properties_pricehistory'
+
+CREATE_PARENT_SQL = """
+CREATE TABLE IF NOT EXISTS properties_pricehistory (
+    id BIGSERIAL,
+    changed_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    accommodation_id VARCHAR(20) NOT NULL,
+    location_id VARCHAR(20) NOT NULL,
+    country_code VARCHAR(2) NOT NULL,
+    old_usd_rate NUMERIC(10, 2),
+    usd_rate NUMERIC(10, 2) NOT NULL
+) PARTITION BY RANGE (changed_at);
+
+-- Catches rows whose month partition has not been created yet
+CREATE TABLE IF NOT EXISTS properties_pricehistory_default
+    PARTITION OF properties_pricehistory DEFAULT;
+
+-- Rows arrive in changed_at order, so block ranges are tight; created on every partition
+CREATE INDEX IF NOT EXISTS properties_pricehistory_changed_brin
+    ON properties_pricehistory USING brin (changed_at);
+"""
+
+TRIGGERS_SQL = """
+CREATE OR REPLACE FUNCTION properties_pricehistory_inserted() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO properties_pricehistory (changed_at, accommodation_id, location_id, country_code, usd_rate)
+    SELECT now(), id, location_id_id, country_code, usd_rate FROM new_rows;
+    RETURN NULL;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION properties_pricehistory_updated() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO properties_pricehistory
+        (changed_at, accommodation_id, location_id, country_code, old_usd_rate, usd_rate)
+    SELECT now(), n.id, n.location_id_id, n.country_code, o.usd_rate, n.usd_rate
+    FROM new_rows n
+    JOIN old_rows o USING (id, feed)
+    WHERE o.usd_rate IS DISTINCT FROM n.usd_rate;
+    RETURN NULL;
+END
+$$;
+
+DROP TRIGGER IF EXISTS pricehistory_insert ON properties_accommodation;
+CREATE TRIGGER pricehistory_insert
+    AFTER INSERT ON properties_accommodation
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION properties_pricehistory_inserted();
+
+DROP TRIGGER IF EXISTS pricehistory_update ON properties_accommodation;
+-- Transition tables rule out a column list (UPDATE OF usd_rate); the join filters unchanged prices
+CREATE TRIGGER pricehistory_update
+    AFTER UPDATE ON properties_accommodation
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION properties_pricehistory_updated();
+"""
+
+ROLLUP_COLUMNS = """
+(scope, key, period, bucket, sample_count, price_sum, min_usd_rate, max_usd_rate,
+ open_usd_rate, close_usd_rate, updated_at)
+"""
+
+ON_CONFLICT = """
+ON CONFLICT (scope, key, period, bucket) DO UPDATE SET
+    sample_count = EXCLUDED.sample_count,
+    price_sum = EXCLUDED.price_sum,
+    min_usd_rate = EXCLUDED.min_usd_rate,
+    max_usd_rate = EXCLUDED.max_usd_rate,
+    open_usd_rate = EXCLUDED.open_usd_rate,
+    close_usd_rate = EXCLUDED.close_usd_rate,
+    updated_at = EXCLUDED.updated_at
+"""
+
+DAY_CHANGES_SQL = f"""
+INSERT INTO properties_pricerollup {ROLLUP_COLUMNS}
+SELECT 'accommodation', accommodation_id, 'day', %(day)s, count(*), sum(usd_rate), min(usd_rate), max(usd_rate),
+       (array_agg(coalesce(old_usd_rate, usd_rate) ORDER BY changed_at, id))[1],
+       (array_agg(usd_rate ORDER BY changed_at DESC, id DESC))[1],
+       now()
+FROM properties_pricehistory
+WHERE changed_at >= %(start)s AND changed_at < %(end)s
+GROUP BY accommodation_id
+{ON_CONFLICT}
+"""
+
+# {key} is location_id_id or country_code
+DAY_SAMPLE_SQL = f"""
+INSERT INTO properties_pricerollup {ROLLUP_COLUMNS}
+SELECT %(scope)s, {{key}}, 'day', %(day)s, count(*), sum(usd_rate), min(usd_rate), max(usd_rate), NULL, NULL, now()
+FROM properties_accommodation
+WHERE published
+GROUP BY {{key}}
+{ON_CONFLICT}
+"""
+
+WEEK_SQL = f"""
+INSERT INTO properties_pricerollup {ROLLUP_COLUMNS}
+SELECT scope, key, 'week', %(week)s, sum(sample_count), sum(price_sum), min(min_usd_rate), max(max_usd_rate),
+       (array_agg(open_usd_rate ORDER BY bucket))[1],
+       (array_agg(close_usd_rate ORDER BY bucket DESC))[1],
+       now()
+FROM properties_pricerollup
+WHERE period = 'day' AND bucket >= %(week)s AND bucket < %(week)s::date + 7
+GROUP BY scope, key
+{ON_CONFLICT}
+"""
+
+
+def ensure_price_history(months_ahead=2):
+    """Create the partitioned history table, its monthly partitions and the accommodation triggers."""
+    with connection.cursor() as cursor:
+        cursor.execute(CREATE_PARENT_SQL)
+        cursor.execute(TRIGGERS_SQL)
+    create_month_partitions(TABLE, months_ahead)
+
+
+def week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+def rollup_day(day, sample=True):
+    """
+    Roll up ``day``'s price changes per accommodation. With ``sample``, also
+    record the current published prices as the day's location and country
+    rows (so run it shortly after midnight for the day that just ended).
+    """
+    start = timezone.make_aware(datetime.combine(day, time()))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(DAY_CHANGES_SQL, {'day': day, 'start': start, 'end': start + timedelta(days=1)})
+        if sample:
+            cursor.execute(DAY_SAMPLE_SQL.format(key='location_id_id'), {'scope': PriceRollup.LOCATION, 'day': day})
+            cursor.execute(DAY_SAMPLE_SQL.format(key='country_code'), {'scope': PriceRollup.COUNTRY, 'day': day})
+
+
+def rollup_week(day):
+    """(Re)compute the weekly rows of the week containing ``day`` from its daily rows."""
+    with connection.cursor() as cursor:
+        cursor.execute(WEEK_SQL, {'week': week_start(day)})
+
+
+def trend_rollups(scope, keys, period, start, end):
+    """The rollups behind ``trend``, for HTTP validators."""
+    return PriceRollup.objects.filter(scope=scope, key__in=keys, period=period, bucket__gte=start, bucket__lte=end)
+
+
+def trend(scope, keys, period, start, end):
+    """
+    Points ``{'date', 'avg', 'min', 'max', 'samples'}`` (plus ``open``/``close``
+    for a single accommodation) between two dates, summed over ``keys``.
+    """
+    rows = (
+        trend_rollups(scope, keys, period, start, end).values('bucket')
+        .annotate(
+            samples=Sum('sample_count'), total=Sum('price_sum'),
+            low=Min('min_usd_rate'), high=Max('max_usd_rate'),
+            first=Min('open_usd_rate'), last=Max('close_usd_rate'),
+        )
+        .order_by('bucket')
+    )
+    points = []
+    for row in rows:
+        point = {
+            'date': row['bucket'],
+            'avg': round(row['total'] / row['samples'], 2) if row['samples'] else None,
+            'min': row['low'],
+            'max': row['high'],
+            'samples': row['samples'],
+        }
+        if scope == PriceRollup.ACCOMMODATION:
+            point.update(open=row['first'], close=row['last'])
+        points.append(point)
+    return points
@@ -0,0 +1,165 @@
+"""
+Opt-in request profiling for staff.
+
+A staff user adds ``?_profile=1`` (PROFILER_QUERY_PARAM) or an ``X-Profile: 1``
+header (PROFILER_HEADER) to a request. A background thread then samples the
+request thread's Python stack every PROFILER_INTERVAL seconds while every
+SQL statement is timed, and the result is stored as a RequestProfile, shown
+as a flamegraph in the admin. Other requests only pay for the opt-in check.
+
+Only the work done until the view returns its response is profiled. The body
+of a streaming response (e.g. area search results) is generated afterwards,
+while the server sends it, and is missing from the profile.
+"""
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from .models import RequestProfile
+
+# Deeper stacks are cut at the root end
+MAX_STACK_DEPTH = 200
+
+
+def frame_label(frame):
+    code = frame.f_code
+    module = frame.f_globals.get('__name__', '?')
+    return f"{module}.{getattr(code, 'co_qualname', code.co_name)}"
+
+
+class StackSampler:
+    """Counts the collapsed stacks of one thread, sampled from a daemon thread."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                stack.append(frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+
+class QueryTimeline:
+    """``execute_wrapper`` recording each statement's start offset and duration."""
+
+    def __init__(self, alias, started):
+        self.alias = alias
+        self.started = started
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if len(self.queries) < settings.PROFILER_MAX_QUERIES:
+                self.queries.append({
+                    'start': (start - self.started) * 1000,
+                    'duration': (time.perf_counter() - start) * 1000,
+                    'alias': self.alias,
+                    'sql': sql,
+                    'many': many,
+                })
+
+
+def wants_profile(request):
+    if not settings.PROFILER_ENABLED:
+        return False
+    requested = (
+        request.GET.get(settings.PROFILER_QUERY_PARAM)
+        or request.headers.get(settings.PROFILER_HEADER)
+    )
+    return bool(requested) and request.user.is_staff
+
+
+def profile_request(request, get_response):
+    """Run ``get_response(request)`` under the sampler and query timeline, then store the profile."""
+    # Views must not see the opt-in as a parameter of their own (the admin changelist
+    # would take it for a field lookup); the stored path keeps it
+    if settings.PROFILER_QUERY_PARAM in request.GET:
+        request.GET = request.GET.copy()
+        del request.GET[settings.PROFILER_QUERY_PARAM]
+    started = time.perf_counter()
+    sampler = StackSampler(threading.get_ident(), settings.PROFILER_INTERVAL)
+    timelines = [QueryTimeline(alias, started) for alias in connections]
+    with ExitStack() as stack:
+        for timeline in timelines:
+            stack.enter_context(connections[timeline.alias].execute_wrapper(timeline))
+        sampler.start()
+        try:
+            response = get_response(request)
+        finally:
+            sampler.stop()
+    duration = (time.perf_counter() - started) * 1000
+
+    queries = sorted((q for t in timelines for q in t.queries), key=lambda q: q['start'])
+    profile = RequestProfile.objects.create(
+        method=request.method,
+        path=request.get_full_path()[:2000],
+        status_code=response.status_code,
+        duration=duration,
+        sample_interval=settings.PROFILER_INTERVAL * 1000,
+        samples=dict(sampler.samples),
+        queries=queries,
+        query_count=len(queries),
+        query_time=sum(q['duration'] for q in queries),
+        created_by=request.user,
+    )
+    response['X-Profile-Id'] = str(profile.pk)
+    return response
+
+
+def flame_rows(samples, min_fraction=0.001):
+    """
+    Layout of a flamegraph (root at the top) from collapsed stacks: a list of
+    ``{'depth', 'left', 'width', 'name', 'count'}`` with left/width in percent.
+    Frames narrower than ``min_fraction`` of all samples are dropped.
+    """
+    total = sum(samples.values())
+    if not total:
+        return []
+    root = {'children': {}, 'count': total}
+    for stack, count in samples.items():
+        node = root
+        for name in stack.split(';'):
+            node = node['children'].setdefault(name, {'children': {}, 'count': 0})
+            node['count'] += count
+
+    rows = []
+
+    def layout(node, depth, left):
+        for name, child in sorted(node['children'].items()):
+            if child['count'] / total >= min_fraction:
+                rows.append({
+                    'depth': depth,
+                    'left': left * 100 / total,
+                    'width': child['count'] * 100 / total,
+                    'name': name,
+                    'count': child['count'],
+                })
+                layout(child, depth + 1, left)
+            left += child['count']
+
+    layout(root, 0, 0)
+    return rows
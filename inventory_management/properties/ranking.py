@@ -0,0 +1,66 @@
+"""
+Stored ranking score for the default ordering of public listings.
+
+``Accommodation.rank_score`` combines the review score, completeness (localized
+languages, images, amenities) and recency, each scaled to 0..1 and weighted
+by RANKING_WEIGHTS. It is recomputed for a row whenever it or its
+localizations change, and for all rows by ``manage.py rank_accommodations``
+(recency decays, so run it daily).
+"""
+from django.conf import settings
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+
+from .models import Accommodation
+from .partitions import map_partitions
+
+SCORE_SQL = """
+round((
+    %s * coalesce(properties_accommodation.review_score, 0) / 10
+    + %s * (
+        least((
+            SELECT count(DISTINCT loc.language) FROM properties_localizeaccommodation loc
+            WHERE loc.property_id_id = properties_accommodation.id
+        ), %s)::float / %s
+        + least(CASE WHEN jsonb_typeof(properties_accommodation.images) = 'array'
+                     THEN jsonb_array_length(properties_accommodation.images) ELSE 0 END, %s)::float / %s
+        + least(cardinality(properties_accommodation.amenity_ids)
+                + CASE WHEN jsonb_typeof(properties_accommodation.amenities) = 'array'
+                       THEN jsonb_array_length(properties_accommodation.amenities) ELSE 0 END, %s)::float / %s
+    ) / 3
+    + %s * exp(-ln(2) * extract(epoch FROM now() - properties_accommodation.created_at) / 86400 / %s)
+)::numeric, 4)::float
+"""
+
+
+def score_expression():
+    weights, targets = settings.RANKING_WEIGHTS, settings.RANKING_TARGETS
+    params = [
+        weights['review'],
+        weights['completeness'],
+        targets['languages'], targets['languages'],
+        targets['images'], targets['images'],
+        targets['amenities'], targets['amenities'],
+        weights['recency'],
+        settings.RANKING_RECENCY_HALF_LIFE_DAYS,
+    ]
+    return RawSQL(SCORE_SQL, params, output_field=FloatField())
+
+
+def refresh(queryset):
+    """Recompute the score of every accommodation in ``queryset`` with one UPDATE."""
+    return queryset.update(rank_score=score_expression())
+
+
+def refresh_all(workers=None):
+    """Recompute all scores, one UPDATE per feed partition, concurrently."""
+    return sum(map_partitions(Accommodation.objects.all(), refresh, workers=workers))
+
+
+def accommodation_saved(sender, instance, **kwargs):
+    refresh(Accommodation.objects.for_feed(instance.feed).filter(pk=instance.pk))
+
+
+def localization_changed(sender, instance, **kwargs):
+    # Handles post_save and post_delete of LocalizeAccommodation
+    refresh(Accommodation.objects.filter(pk=instance.property_id_id))
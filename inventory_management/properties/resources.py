@@ -1,5 +1,5 @@
 from import_export import resources
-from .models import Location
+from .models import Accommodation, Location
 
 
 class LocationResource(resources.ModelResource):
@@ -18,3 +18,24 @@ class LocationResource(resources.ModelResource):
             'updated_at'
         )
         export_order = fields  # Optional: Maintain order of fields in export
+
+
+class AccommodationResource(resources.ModelResource):
+    class Meta:
+        model = Accommodation
+        fields = (
+            'id',
+            'feed',
+            'title',
+            'country_code',
+            'bedroom_count',
+            'review_score',
+            'usd_rate',
+            'center',
+            'location_id',
+            'user_id',
+            'published',
+            'created_at',
+            'updated_at'
+        )
+        export_order = fields
@@ -0,0 +1,126 @@
+"""
+Primary/replica database routing.
+
+Reads go to a replica from ``settings.DATABASE_REPLICAS`` unless the current
+request or process has written recently, is inside a transaction on the
+primary, or the replica lags more than ``REPLICA_MAX_LAG`` seconds. Writes
+always go to ``default``. See PrimaryPinningMiddleware for the per-request side.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+# Seconds the replica is behind the primary; 0 when it has replayed everything it received.
+# NULL (unhealthy) when it is not streaming: a replica that lost its upstream has replayed
+# everything it received too. Reading the receiver's status needs pg_read_all_stats.
+LAG_SQL = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN NULL
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+END
+"""
+
+# Routing state of the current request (or process, outside requests).
+# A dict is stored so changes made in sync_to_async threads stay visible.
+_state = ContextVar('db_routing_state', default=None)
+_process_state = {'pinned': False, 'last_write': None}
+
+# alias -> (monotonic time of the check, healthy)
+_replica_health = {}
+
+
+def replica_aliases():
+    return [alias for alias in connections if alias != DEFAULT_DB_ALIAS]
+
+
+def current_state():
+    return _state.get() or _process_state
+
+
+def start_request(pinned):
+    """Begin routing for a request. Returns a token for ``end_request``."""
+    return _state.set({'pinned': pinned, 'last_write': None})
+
+
+def end_request(token):
+    """Finish routing for a request. Returns True if the request wrote to the primary."""
+    wrote = current_state()['last_write'] is not None
+    _state.reset(token)
+    return wrote
+
+
+@contextmanager
+def use_primary():
+    """Send all reads in the block to the primary (read-after-write flows)."""
+    state = current_state()
+    previous = state['pinned']
+    state['pinned'] = True
+    try:
+        yield
+    finally:
+        state['pinned'] = previous
+
+
+def replica_lag(alias):
+    with connections[alias].cursor() as cursor:
+        cursor.execute(LAG_SQL)
+        return cursor.fetchone()[0]
+
+
+def replica_is_healthy(alias):
+    """Whether ``alias`` is reachable and within REPLICA_MAX_LAG, cached for REPLICA_LAG_CHECK_INTERVAL."""
+    checked = _replica_health.get(alias)
+    if checked and time.monotonic() - checked[0] < settings.REPLICA_LAG_CHECK_INTERVAL:
+        return checked[1]
+    try:
+        lag = replica_lag(alias)
+        healthy = lag is not None and lag <= settings.REPLICA_MAX_LAG
+    except DatabaseError:
+        healthy = False
+    _replica_health[alias] = (time.monotonic(), healthy)
+    return healthy
+
+
+class PrimaryReplicaRouter:
+    def _primary_only(self, model):
+        # DatabaseCache's CacheEntry has a stub _meta with no ``label``; app_label and model_name exist on both
+        label = f'{model._meta.app_label}.{model._meta.model_name}'
+        return label in {name.lower() for name in settings.DATABASE_PRIMARY_ONLY_MODELS}
+
+    def _recently_wrote(self, state):
+        last_write = state['last_write']
+        return last_write is not None and time.monotonic() - last_write < settings.PRIMARY_PIN_SECONDS
+
+    def db_for_read(self, model, **hints):
+        replicas = replica_aliases()
+        if not replicas:
+            return DEFAULT_DB_ALIAS
+        state = current_state()
+        if (
+            state['pinned']
+            or self._recently_wrote(state)
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+            or self._primary_only(model)
+        ):
+            return DEFAULT_DB_ALIAS
+        healthy = [alias for alias in replicas if replica_is_healthy(alias)]
+        return random.choice(healthy) if healthy else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        if not self._primary_only(model):
+            # Bookkeeping writes (e.g. job progress) must not pin reads to the primary
+            current_state()['last_write'] = time.monotonic()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,8 @@
+from django.dispatch import Signal
+
+# Sent on commit of each batch of a set-based change to many accommodations
+# (see properties/bulk.py), in place of per-object post_save signals.
+# Arguments: keys (list of (id, feed) of the changed rows; ids are only unique per feed),
+# changes (dict of field -> new value),
+# location_ids (ids of the locations the accommodations belonged to before the change)
+accommodations_bulk_changed = Signal()
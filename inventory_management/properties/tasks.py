@@ -0,0 +1,169 @@
+"""
+Background job handlers. Imported from PropertiesConfig.ready() so every
+process (web and worker) has the same registry. import_export is only
+imported by the jobs that use it, to keep worker and command startup lean.
+"""
+import base64
+import os
+import pickle
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.utils.module_loading import import_string
+from django.utils.timezone import now
+
+from . import jobs
+from .models import Location, SavedAreaSearch
+from .sitemap import write_sitemap
+
+# Rows imported per transaction; also the granularity of progress updates
+IMPORT_CHUNK_SIZE = 1000
+
+
+@jobs.register('generate_sitemap', read_only=True)
+def generate_sitemap(ctx):
+    output_file = write_sitemap(
+        progress=lambda done, total: ctx.set_progress(done * 100 / total, f"{done}/{total} countries")
+    )
+    return {'file': output_file}
+
+
+@jobs.register('location_import')
+def location_import(ctx, import_file_name, original_file_name, input_format,
+                    tmp_storage_class, encoding=None, user_id=None):
+    """
+    Import a file previously uploaded through LocationAdmin's import form.
+    Each chunk of IMPORT_CHUNK_SIZE rows commits on its own: an import that
+    fails partway keeps the chunks before the failing one. The uploaded file
+    is removed either way, so the job is queued with a single attempt.
+    """
+    import tablib
+    from import_export.signals import post_import
+
+    from .resources import LocationResource
+
+    file_format = import_string(input_format)(encoding=encoding)
+    tmp_storage = import_string(tmp_storage_class)(
+        name=import_file_name,
+        encoding=encoding,
+        read_mode=file_format.get_read_mode(),
+    )
+    try:
+        dataset = file_format.create_dataset(tmp_storage.read())
+        user = User.objects.filter(pk=user_id).first()
+        resource = LocationResource()
+
+        totals = {}
+        for start in range(0, len(dataset), IMPORT_CHUNK_SIZE):
+            chunk = tablib.Dataset(*dataset[start:start + IMPORT_CHUNK_SIZE], headers=dataset.headers)
+            result = resource.import_data(
+                chunk,
+                dry_run=False,
+                use_transactions=True,
+                file_name=original_file_name,
+                user=user,
+            )
+            if result.has_errors() or result.has_validation_errors():
+                raise jobs.JobFailed(
+                    f"Import stopped at rows {start + 1}-{start + len(chunk)} ({start} earlier rows were imported): "
+                    f"{len(result.row_errors())} row errors, {len(result.invalid_rows)} invalid rows."
+                )
+            for import_type, count in result.totals.items():
+                totals[import_type] = totals.get(import_type, 0) + count
+            done = start + len(chunk)
+            ctx.set_progress(done * 100 / len(dataset), f"{done}/{len(dataset)} rows")
+    finally:
+        tmp_storage.remove()
+
+    post_import.send(sender=None, model=Location)
+    return {'file': original_file_name, 'totals': totals}
+
+
+@jobs.register('location_export', read_only=True)
+def location_export(ctx, query, file_format, filename, encoding=None):
+    """
+    Export Locations matching a pickled ``QuerySet.query`` (see LocationAdmin)
+    into JOB_OUTPUT_DIR. The file is downloadable from the job's admin page.
+    """
+    from .resources import LocationResource
+
+    queryset = Location.objects.all()
+    queryset.query = pickle.loads(base64.b64decode(query))
+    file_format = import_string(file_format)()
+
+    ctx.set_progress(10, "Exporting rows")
+    data = LocationResource().export(queryset=queryset)
+    export_data = file_format.export_data(data)
+    if not file_format.is_binary() and encoding:
+        export_data = export_data.encode(encoding)
+
+    os.makedirs(settings.JOB_OUTPUT_DIR, exist_ok=True)
+    path = os.path.join(settings.JOB_OUTPUT_DIR, f"job-{ctx.job.pk}-{filename}")
+    with open(path, 'wb' if isinstance(export_data, bytes) else 'w') as f:
+        f.write(export_data)
+
+    return {
+        'file': path,
+        'filename': filename,
+        'content_type': file_format.get_content_type(),
+        'rows': len(data),
+    }
+
+
+def serialize_query(queryset):
+    """Encode a queryset's query so a worker can rebuild it (the documented pickling route)."""
+    return base64.b64encode(pickle.dumps(queryset.query)).decode('ascii')
+
+
+@jobs.register('nearest_listings_country')
+def nearest_listings_country(ctx, country_code):
+    from .nearest import refresh_country
+
+    count = refresh_country(
+        country_code,
+        progress=lambda done, total: ctx.set_progress(done * 100 / total, f"{done}/{total} locations"),
+    )
+    return {'country_code': country_code, 'locations': count}
+
+
+@jobs.register('nearest_listings_changes')
+def nearest_listings_changes(ctx):
+    from .nearest import process_changes
+
+    count = process_changes(
+        progress=lambda done, pending: ctx.set_progress(
+            done * 100 / (done + pending), f"{done} changes applied, {pending} pending"
+        ),
+    )
+    return {'changes': count}
+
+
+@jobs.register('refresh_public_catalog')
+def refresh_public_catalog(ctx, force=False, interval=None):
+    """Refresh the public catalog view; with ``interval`` (seconds), queue the next run."""
+    from .catalog import refresh
+
+    refreshed = refresh(force=force)
+    if interval:
+        # A --schedule issued while this run was in flight has already queued the next one
+        jobs.enqueue_unique('refresh_public_catalog', {'interval': interval}, run_after=now() + timedelta(seconds=interval))
+    return {'refreshed': refreshed}
+
+
+@jobs.register('count_area_search')
+def count_area_search(ctx, search_id):
+    """Recount a saved area search's results (see properties/area_search.py)."""
+    from .area_search import recount
+
+    search = SavedAreaSearch.objects.filter(pk=search_id).first()
+    return {'result_count': recount(search) if search else None}
+
+
+@jobs.register('build_location_index')
+def build_location_index(ctx):
+    """Rebuild the Location index file if locations changed since it was built (see properties/location_index.py)."""
+    from .location_index import rebuild
+
+    index = rebuild(os.fspath(settings.LOCATION_INDEX_PATH))
+    return {'locations': len(index), 'generation': index.generation}
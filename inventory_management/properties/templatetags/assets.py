@@ -0,0 +1,20 @@
+from django import template
+from django.conf import settings
+from django.templatetags.static import static
+
+from properties.assets import load_manifest
+
+register = template.Library()
+
+
+@register.simple_tag
+def asset_url(name):
+    """
+    URL of the built, content-hashed version of an ASSET_SOURCES entry. Falls
+    back to the unprocessed source in DEBUG or before ``build_assets`` has run.
+    """
+    if not settings.DEBUG:
+        built = load_manifest().get(name)
+        if built:
+            return static(built)
+    return static(settings.ASSET_SOURCES[name])
@@ -1,13 +1,29 @@
-from django.test import TestCase, Client
+from django.test import TestCase, SimpleTestCase, Client
+from unittest import mock
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.db import DatabaseCache
 from django.core.exceptions import ValidationError
-from django.contrib.gis.geos import Point
+from django.contrib.gis.geos import Point, Polygon
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.contrib.auth.models import Group, User
 from django.contrib.messages import get_messages
+from django.utils.timezone import localdate
 from django.contrib import messages
+from django.db.models import Avg, Count, Max
 from .views import SignupView
-from .models import Location, Accommodation, LocalizeAccommodation
+from .models import Location, Accommodation, LocalizeAccommodation, Job, ChangeLogEntry, GeoGridCell, Amenity, Policy, RequestProfile, GeoAuditRun, PriceHistory, PriceRollup, PublicCatalogEntry, SavedAreaSearch, NearestListingsChange
+from . import amenities, area_search, assets, bulk, catalog, changefeed, geoaudit, geogrid, geohash, jobs, listings, loadtest, nearest, page_cache, partitions, policies, prices, profiler, ranking, routers
+from .location_index import LocationIndex, build_index_file, get_location_index
+from inventory_management import startup
+import json
+import math
+from decimal import Decimal
+import os
+import tempfile
+import numpy as np
+from .signals import accommodations_bulk_changed
 
 
 class LocationModelTest(TestCase):
@@ -439,3 +455,1012 @@ class SignupViewTestCase(TestCase):
         """
         response = self.client.get(self.signup_url)
         self.assertEqual(response.status_code, 200)
+
+
+@jobs.register('test_echo')
+def echo_job(ctx, value):
+    ctx.set_progress(50, 'halfway')
+    return {'value': value}
+
+
+@jobs.register('test_broken')
+def broken_job(ctx):
+    raise RuntimeError('boom')
+
+
+class JobQueueTest(TestCase):
+    def test_enqueue_unknown_kind(self):
+        with self.assertRaises(LookupError):
+            jobs.enqueue('does-not-exist')
+
+    def test_claim_and_execute(self):
+        """A claimed job runs its handler and stores the result."""
+        job = jobs.enqueue('test_echo', {'value': 42})
+        claimed = jobs.claim_job('test-worker')
+        self.assertEqual(claimed.pk, job.pk)
+        self.assertEqual(claimed.status, Job.RUNNING)
+        self.assertIsNone(jobs.claim_job('test-worker'))
+
+        self.assertEqual(jobs.execute_job(job.pk), Job.SUCCEEDED)
+        job.refresh_from_db()
+        self.assertEqual(job.progress, 100)
+        self.assertEqual(job.result, {'value': 42})
+
+    def test_failed_job_is_retried_then_fails(self):
+        job = jobs.enqueue('test_broken', max_attempts=2)
+        jobs.claim_job('test-worker')
+        jobs.execute_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertIn('boom', job.error)
+
+        # Make the retry runnable now instead of after the backoff
+        Job.objects.filter(pk=job.pk).update(run_after=job.created_at)
+        jobs.claim_job('test-worker')
+        jobs.execute_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_cancel(self):
+        """Queued jobs are cancelled at once, running jobs at their next checkpoint."""
+        queued = jobs.enqueue('test_echo', {'value': 1})
+        self.assertEqual(jobs.cancel(queued).status, Job.CANCELLED)
+
+        running = jobs.enqueue('test_echo', {'value': 2})
+        jobs.claim_job('test-worker')
+        jobs.cancel(running)
+        self.assertEqual(jobs.execute_job(running.pk), Job.CANCELLED)
+
+    def test_reclaimed_job_is_left_to_its_new_worker(self):
+        job = jobs.enqueue('test_echo', {'value': 3})
+        jobs.claim_job('worker-a')
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=job.created_at)
+        self.assertEqual(jobs.heartbeat([job.pk], 'worker-b'), 0)
+
+        # worker-a looks dead: its job is requeued and claimed by worker-b
+        with self.settings(JOB_STALE_TIMEOUT=0):
+            self.assertEqual(jobs.requeue_stale_jobs(), 1)
+        Job.objects.filter(pk=job.pk).update(run_after=job.created_at)
+        jobs.claim_job('worker-b')
+        self.assertEqual(jobs.execute_job(job.pk, 'worker-a'), Job.RUNNING)
+        self.assertEqual(jobs.heartbeat([job.pk], 'worker-b'), 1)
+        self.assertEqual(jobs.execute_job(job.pk, 'worker-b'), Job.SUCCEEDED)
+
+
+class BulkAccommodationUpdateTest(TestCase):
+    def setUp(self):
+        self.location = Location.objects.create(
+            id="location-01",
+            title="Paris",
+            center=Point(2.3522, 48.8566),
+            location_type="city",
+            country_code="FR"
+        )
+        self.owner = User.objects.create_user(username="owner", password="password123")
+        self.owner.groups.add(Group.objects.create(name='Property Owners'))
+        self.other = User.objects.create_user(username="other", password="password123")
+        for i, user in enumerate([self.owner, self.owner, self.other]):
+            Accommodation.objects.create(
+                id=f"accommodation-{i}",
+                title=f"Apartment {i}",
+                country_code="FR",
+                usd_rate=100.00,
+                center=Point(2.3522, 48.8566),
+                location_id=self.location,
+                user_id=user
+            )
+
+    def test_publish_respects_owner_scope(self):
+        queryset = bulk.scope_to_user(Accommodation.objects.all(), self.owner)
+        self.assertEqual(bulk.publish(queryset), 2)
+        self.assertFalse(Accommodation.objects.get(id="accommodation-2").published)
+
+    def test_single_batched_signal(self):
+        received = []
+
+        def receiver(sender, keys, changes, **kwargs):
+            received.append((sorted(keys), changes))
+
+        accommodations_bulk_changed.connect(receiver)
+        try:
+            with self.captureOnCommitCallbacks(execute=True):
+                bulk.publish(Accommodation.objects.all())
+        finally:
+            accommodations_bulk_changed.disconnect(receiver)
+        self.assertEqual(
+            received, [([("accommodation-0", 0), ("accommodation-1", 0), ("accommodation-2", 0)], {'published': True})]
+        )
+
+    def test_batches_stay_within_feed(self):
+        Accommodation.objects.create(
+            id="accommodation-0", feed=1, title="Same id, other feed", country_code="FR", usd_rate=100.00,
+            center=Point(2.3522, 48.8566), location_id=self.location,
+        )
+        self.assertEqual(bulk.publish(Accommodation.objects.for_feed(0), batch_size=2), 3)
+        self.assertFalse(Accommodation.objects.get(id="accommodation-0", feed=1).published)
+        self.assertEqual(bulk.reassign_owner(Accommodation.objects.all(), self.other, batch_size=1), 4)
+
+    def test_batches_follow_code_point_order(self):
+        # "Zeta" sorts before "alpha" in Python but after it in most database collations
+        for pk in ("Zeta", "alpha", "Beta"):
+            Accommodation.objects.create(
+                id=pk, title=pk, country_code="FR", usd_rate=100.00, center=Point(2.3522, 48.8566), location_id=self.location,
+            )
+        self.assertEqual(bulk.publish(Accommodation.objects.all(), batch_size=2), 6)
+        self.assertFalse(Accommodation.objects.filter(published=False).exists())
+
+    def test_updated_at_is_bumped(self):
+        before = Accommodation.objects.get(id="accommodation-0").updated_at
+        bulk.move_location(Accommodation.objects.filter(id="accommodation-0"), self.location)
+        self.assertGreater(Accommodation.objects.get(id="accommodation-0").updated_at, before)
+
+
+class ChangeFeedTest(TestCase):
+    def setUp(self):
+        self.location = Location.objects.create(
+            id="location-01",
+            title="Paris",
+            center=Point(2.3522, 48.8566),
+            location_type="city",
+            country_code="FR"
+        )
+        self.staff = User.objects.create_user(username="staff", password="password123", is_staff=True)
+
+    def test_save_and_delete_are_logged(self):
+        self.location.delete()
+        entries = list(ChangeLogEntry.objects.filter(object_id="location-01"))
+        self.assertEqual([e.action for e in entries], [ChangeLogEntry.UPSERT, ChangeLogEntry.DELETE])
+        self.assertEqual(entries[0].data['title'], "Paris")
+        self.assertEqual(entries[0].data['center'], [2.3522, 48.8566])
+
+    def test_cursor_round_trip(self):
+        entry = ChangeLogEntry.objects.get(object_id="location-01")
+        cursor = changefeed.encode_cursor(entry.txid, entry.id)
+        self.assertEqual(changefeed.decode_cursor(cursor), (entry.txid, entry.id))
+        self.assertEqual(changefeed.changes_since(cursor=cursor), [])
+
+    def test_entries_wait_for_older_transactions(self):
+        entry = ChangeLogEntry.objects.get(object_id="location-01")
+        self.assertEqual(changefeed.changes_since(), [entry])
+        # An entry of a transaction that began before the oldest one still running is served,
+        # one of a transaction that may still be open (or a newer one) is not
+        ChangeLogEntry.objects.filter(pk=entry.pk).update(txid=entry.txid + 1)
+        self.assertEqual(changefeed.changes_since(), [])
+
+    def test_api_requires_staff(self):
+        response = self.client.get(reverse('changes'))
+        self.assertEqual(response.status_code, 401)
+
+    def test_api_returns_ndjson(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('changes'), {'models': 'location'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = response.content.decode().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertIn('"id":"location-01"', lines[0])
+        self.assertTrue(response['X-Next-Cursor'])
+
+
+@mock.patch('properties.routers.replica_aliases', return_value=['replica1', 'replica2'])
+class PrimaryReplicaRouterTest(SimpleTestCase):
+    def setUp(self):
+        self.router = routers.PrimaryReplicaRouter()
+        routers._replica_health.clear()
+        self.token = routers.start_request(pinned=False)
+
+    def tearDown(self):
+        routers.end_request(self.token)
+
+    def test_reads_go_to_replica(self, aliases):
+        with mock.patch('properties.routers.replica_lag', return_value=0):
+            self.assertIn(self.router.db_for_read(Location), ['replica1', 'replica2'])
+
+    def test_lagging_replica_is_dropped(self, aliases):
+        lag = {'replica1': 60, 'replica2': 0}
+        with mock.patch('properties.routers.replica_lag', side_effect=lag.get):
+            for _ in range(10):
+                self.assertEqual(self.router.db_for_read(Location), 'replica2')
+
+    def test_read_after_write_uses_primary(self, aliases):
+        self.assertEqual(self.router.db_for_write(Accommodation), 'default')
+        self.assertEqual(self.router.db_for_read(Accommodation), 'default')
+        self.assertTrue(routers.end_request(self.token))
+        self.token = routers.start_request(pinned=False)
+
+    def test_primary_only_models(self, aliases):
+        with mock.patch('properties.routers.replica_lag', return_value=0):
+            self.assertEqual(self.router.db_for_read(Job), 'default')
+            self.router.db_for_write(Job)
+            self.assertIn(self.router.db_for_read(Location), ['replica1', 'replica2'])
+
+    def test_cache_and_session_writes_do_not_pin(self, aliases):
+        from django.contrib.sessions.models import Session
+        from django.core.cache.backends.db import DatabaseCache
+
+        cache_entry = DatabaseCache('django_cache', {}).cache_model_class
+        with mock.patch('properties.routers.replica_lag', return_value=0):
+            for model in (cache_entry, Session):
+                self.assertEqual(self.router.db_for_write(model), 'default')
+                self.assertEqual(self.router.db_for_read(model), 'default')
+            self.assertIn(self.router.db_for_read(Location), ['replica1', 'replica2'])
+        self.assertFalse(routers.end_request(self.token))
+        self.token = routers.start_request(pinned=False)
+
+    def test_use_primary(self, aliases):
+        with routers.use_primary():
+            self.assertEqual(self.router.db_for_read(Location), 'default')
+
+
+class NearestListingsTest(TestCase):
+    def setUp(self):
+        self.paris = Location.objects.create(
+            id="location-01",
+            title="Paris",
+            center=Point(2.3522, 48.8566),
+            location_type="city",
+            country_code="FR"
+        )
+        for i, (x, y) in enumerate([(2.36, 48.86), (2.5, 48.9), (4.8, 45.7)]):
+            Accommodation.objects.create(
+                id=f"accommodation-{i}",
+                title=f"Apartment {i}",
+                country_code="FR",
+                usd_rate=100.00,
+                center=Point(x, y),
+                location_id=self.paris,
+                published=True
+            )
+
+    def test_refresh_orders_by_distance(self):
+        nearest.refresh_country("FR", limit=2)
+        ids = [acc.id for acc in nearest.nearest_accommodations(self.paris)]
+        self.assertEqual(ids, ["accommodation-0", "accommodation-1"])
+
+    def test_unpublish_is_applied_incrementally(self):
+        nearest.refresh_country("FR", limit=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk.unpublish(Accommodation.objects.filter(id="accommodation-0"))
+        nearest.process_changes()
+        ids = [acc.id for acc in nearest.nearest_accommodations(self.paris)]
+        self.assertNotIn("accommodation-0", ids)
+
+    def test_candidates_use_each_locations_own_radius(self):
+        nearest.refresh_country("FR", limit=2)
+        self.assertEqual(nearest.affected_locations({"new"}, [(2.353, 48.857)]), {"location-01"})
+        self.assertEqual(nearest.affected_locations({"new"}, [(4.8, 45.7)]), set())
+
+    def test_only_ranking_changes_are_queued(self):
+        accommodation = Accommodation.objects.get(id="accommodation-2")
+        NearestListingsChange.objects.all().delete()
+        accommodation.usd_rate = 150
+        accommodation.save()
+        self.assertFalse(NearestListingsChange.objects.exists())
+        accommodation.center = Point(2.353, 48.857)
+        accommodation.save()
+        self.assertTrue(NearestListingsChange.objects.filter(accommodation="accommodation-2").exists())
+
+
+class LocationIndexTest(TestCase):
+    def setUp(self):
+        europe = Location.objects.create(id="eu", title="Europe", center=Point(10.0, 50.0), location_type="continent")
+        france = Location.objects.create(
+            id="fr", title="France", center=Point(2.0, 46.0), parent_id=europe, location_type="country", country_code="FR"
+        )
+        idf = Location.objects.create(
+            id="fr-idf", title="Ile de France", center=Point(2.3, 48.8), parent_id=france, location_type="state"
+        )
+        Location.objects.create(id="fr-paris", title="Paris", center=Point(2.35, 48.85), parent_id=idf)
+        Location.objects.create(id="fr-lyon", title="Lyon", center=Point(4.8, 45.7), parent_id=france)
+        self.path = os.path.join(tempfile.mkdtemp(), "location_index.bin")
+        build_index_file(self.path)
+        self.index = LocationIndex.open(self.path)
+
+    def test_resolve_sitemap_paths(self):
+        self.assertEqual(self.index.id(self.index.resolve_path("france/ile-de-france/paris")), "fr-paris")
+        self.assertEqual(self.index.id(self.index.resolve_path("france/lyon")), "fr-lyon")
+        self.assertIsNone(self.index.resolve_path("france/unknown"))
+        self.assertEqual(self.index.path(self.index.find("fr-paris")), "france/ile-de-france/paris")
+
+    def test_breadcrumbs_and_descendants(self):
+        paris = self.index.find("fr-paris")
+        self.assertEqual([self.index.title(n) for n in self.index.ancestors(paris)],
+                         ["Europe", "France", "Ile de France", "Paris"])
+        self.assertEqual(sorted(self.index.descendant_ids("fr")), ["fr", "fr-idf", "fr-lyon", "fr-paris"])
+        self.assertEqual(self.index.center(paris), (2.35, 48.85))
+
+    def test_subtree_filter_binds_only_the_root_id(self):
+        queryset = Location.objects.filter(id__in=listings.subtree_ids("fr"))
+        self.assertEqual(sorted(queryset.values_list("id", flat=True)), ["fr", "fr-idf", "fr-lyon", "fr-paris"])
+        self.assertEqual(queryset.query.sql_with_params()[1], ("fr",))
+        self.assertIsNone(listings.subtree_filter(self.index, "atlantis"))
+
+    def test_reloads_when_locations_change(self):
+        with self.settings(LOCATION_INDEX_PATH=self.path, LOCATION_INDEX_CHECK_INTERVAL=0):
+            self.assertEqual(len(get_location_index()), 5)
+            Location.objects.create(id="de", title="Germany", center=Point(10.0, 51.0), location_type="country")
+            # Requests keep the stale file and leave the rebuild to a job
+            self.assertIsNone(get_location_index().resolve_path("germany"))
+            job = Job.objects.get(kind="build_location_index", status=Job.QUEUED)
+            jobs.claim_job("test-worker")
+            self.assertEqual(jobs.execute_job(job.pk), Job.SUCCEEDED)
+            self.assertIsNotNone(get_location_index().resolve_path("germany"))
+
+
+class LocationPageViewTest(TestCase):
+    def setUp(self):
+        france = Location.objects.create(
+            id="fr", title="France", center=Point(2.0, 46.0), location_type="country", country_code="FR"
+        )
+        paris = Location.objects.create(id="fr-paris", title="Paris", center=Point(2.35, 48.85), parent_id=france)
+        Accommodation.objects.create(
+            id="accommodation-01",
+            title="Cozy Apartment in Paris",
+            country_code="FR",
+            usd_rate=150.00,
+            center=Point(2.35, 48.85),
+            location_id=paris,
+            published=True
+        )
+        catalog.recreate_view()
+        catalog.refresh(force=True)
+        path = os.path.join(tempfile.mkdtemp(), "location_index.bin")
+        self.override = self.settings(LOCATION_INDEX_PATH=path, LOCATION_INDEX_CHECK_INTERVAL=0)
+        self.override.enable()
+
+    def tearDown(self):
+        self.override.disable()
+
+    def test_subtree_listings_on_country_page(self):
+        response = self.client.get('/france')
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'location.html')
+        self.assertContains(response, "Cozy Apartment in Paris")
+        self.assertContains(response, 'href="/france/paris"')
+
+    def test_unknown_path_is_404(self):
+        self.assertEqual(self.client.get('/france/atlantis').status_code, 404)
+
+    def test_other_routes_still_get_their_slash(self):
+        for path in ('/admin', '/login', '/signup', '/api/changes'):
+            self.assertRedirects(self.client.get(path), path + '/', status_code=301, fetch_redirect_response=False)
+        self.assertEqual(self.client.get('/france/paris').status_code, 200)
+
+    def test_listing_change_invalidates_fragment(self):
+        self.client.get('/france/paris')
+        with self.captureOnCommitCallbacks(execute=True):
+            Accommodation.objects.filter(id="accommodation-01").update(title="Renamed")
+            Accommodation.objects.get(id="accommodation-01").save()
+            catalog.refresh()
+        self.assertContains(self.client.get('/france/paris'), "Renamed")
+
+    def test_page_cache_through_project_router_and_database_cache(self):
+        # No overrides: the primary/replica router sees every cache write
+        self.assertEqual(settings.DATABASE_ROUTERS, ['properties.routers.PrimaryReplicaRouter'])
+        self.assertIsInstance(caches['default'], DatabaseCache)
+
+        response = self.client.get('/france/paris')
+        self.assertContains(response, "Cozy Apartment in Paris")
+        self.assertNotIn(settings.PRIMARY_PIN_COOKIE, response.cookies)
+        self.assertTrue(caches['default'].has_key(page_cache.version_key("fr-paris")))
+
+        accommodation = Accommodation.objects.get(id="accommodation-01")
+        accommodation.title = "Renamed Apartment"
+        with self.captureOnCommitCallbacks(execute=True):
+            accommodation.save()
+            catalog.refresh()
+        renamed = self.client.get('/france/paris', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(renamed.status_code, 200)
+        self.assertContains(renamed, "Renamed Apartment")
+
+    def test_conditional_get(self):
+        response = self.client.get('/france')
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+        self.assertIn('public', response['Cache-Control'])
+
+        cached = self.client.get('/france', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.content, b'')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Accommodation.objects.get(id="accommodation-01").delete()
+        self.assertEqual(self.client.get('/france', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+
+class StaticAssetPipelineTest(SimpleTestCase):
+    CSS = """
+    /* comment */
+    .p-4 { padding: 1rem; }
+    .unused-class { color: red; }
+    .hover\\:bg-blue-700:hover { background-color: #1d4ed8; }
+    @media (min-width: 768px) {
+        .md\\:grid-cols-3 { grid-template-columns: repeat(3, minmax(0, 1fr)); }
+        .md\\:unused { display: none; }
+    }
+    """
+
+    def test_purge_and_minify(self):
+        used = {"p-4", "hover:bg-blue-700", "md:grid-cols-3"}
+        css = assets.serialize(assets.purge(assets.parse_css(self.CSS), used))
+        self.assertEqual(
+            css,
+            ".p-4{padding:1rem}.hover\\:bg-blue-700:hover{background-color:#1d4ed8}"
+            "@media (min-width: 768px){.md\\:grid-cols-3{grid-template-columns:repeat(3,minmax(0,1fr))}}",
+        )
+
+    def test_serves_precompressed_variant_with_cache_headers(self):
+        root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(root, "assets"))
+        path = os.path.join(root, "assets", "app.0123456789ab.css")
+        with open(path, "w") as f:
+            f.write(".p-4{padding:1rem}")
+        assets.precompress(path)
+
+        with self.settings(STATIC_ROOT=root):
+            response = self.client.get("/static/assets/app.0123456789ab.css", HTTP_ACCEPT_ENCODING="gzip")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["Content-Encoding"], "gzip")
+            self.assertEqual(response["Cache-Control"], "public, max-age=31536000, immutable")
+            self.assertEqual(response["Vary"], "Accept-Encoding")
+
+            plain = self.client.get("/static/assets/app.0123456789ab.css")
+            self.assertNotIn("Content-Encoding", plain)
+            self.assertEqual(b"".join(plain.streaming_content), b".p-4{padding:1rem}")
+
+            self.assertEqual(self.client.get("/static/../settings.py").status_code, 404)
+
+
+class FeedPartitionTest(TestCase):
+    def setUp(self):
+        location = Location.objects.create(id="loc-01", title="Paris", center=Point(2.35, 48.85))
+        for pk, feed, rate in [("acc-1", 1, 100), ("acc-2", 1, 200), ("acc-3", 2000, 300), ("acc-4", 6000, 400)]:
+            Accommodation.objects.create(
+                id=pk, feed=feed, title=pk, country_code="FR", usd_rate=rate,
+                center=Point(2.35, 48.85), location_id=location,
+            )
+
+    def test_parse_partitions_gives_default_the_gaps(self):
+        parsed = partitions.parse_partitions([
+            ("feed_0_1000", "FOR VALUES FROM (0) TO (1000)"),
+            ("feed_1001_5000", "FOR VALUES FROM (1001) TO (5000)"),
+            ("feed_default", "DEFAULT"),
+        ])
+        self.assertEqual([p.name for p in parsed], ["feed_0_1000", "feed_1001_5000", "feed_default"])
+        self.assertEqual(parsed[-1].ranges, [(1000, 1001), (5000, partitions.FEED_LIMIT)])
+
+    def test_for_feeds(self):
+        self.assertEqual(Accommodation.objects.for_feed("1").count(), 2)
+        self.assertEqual(Accommodation.objects.for_feeds([1, 6000]).count(), 3)
+        self.assertFalse(Accommodation.objects.for_feeds([]).exists())
+
+    def test_parallel_aggregate_merges_partitions(self):
+        parsed = partitions.parse_partitions([
+            ("feed_0_1000", "FOR VALUES FROM (0) TO (1000)"),
+            ("feed_1001_5000", "FOR VALUES FROM (1001) TO (5000)"),
+            ("feed_default", "DEFAULT"),
+        ])
+        with mock.patch.object(partitions, "feed_partitions", return_value=parsed):
+            result = partitions.parallel_aggregate(
+                Accommodation.objects.all(), total=Count("id"), avg_rate=Avg("usd_rate"), max_rate=Max("usd_rate")
+            )
+            per_partition = partitions.map_partitions(Accommodation.objects.all(), lambda qs: qs.count())
+        self.assertEqual(result, {"total": 4, "avg_rate": 250, "max_rate": 400})
+        self.assertEqual(per_partition, [2, 1, 1])
+
+
+class AccommodationListApiTest(TestCase):
+    def setUp(self):
+        self.location = Location.objects.create(id="loc-01", title="Paris", center=Point(2.35, 48.85), country_code="FR")
+        for i in range(5):
+            Accommodation.objects.create(
+                id=f"acc-{i}", title=f"Flat {i}", country_code="FR", usd_rate=100 + 10 * (i % 3), review_score=i,
+                bedroom_count=i, center=Point(2.35, 48.85), location_id=self.location, published=i != 4,
+            )
+        path = os.path.join(tempfile.mkdtemp(), "location_index.bin")
+        self.override = self.settings(LOCATION_INDEX_PATH=path, LOCATION_INDEX_CHECK_INTERVAL=0)
+        self.override.enable()
+
+    def tearDown(self):
+        self.override.disable()
+
+    def fetch_all(self, **params):
+        ids, cursor = [], None
+        while True:
+            query = {**params, **({"cursor": cursor} if cursor else {})}
+            data = self.client.get("/api/accommodations", query).json()
+            ids += [row["id"] for row in data["results"]]
+            cursor = data["next"]
+            if not cursor:
+                return ids
+
+    def test_keyset_pages(self):
+        self.assertEqual(self.fetch_all(sort="price", limit=2), ["acc-0", "acc-3", "acc-1", "acc-2"])
+        self.assertEqual(self.fetch_all(sort="-price", limit=1), ["acc-2", "acc-1", "acc-3", "acc-0"])
+        self.assertEqual(self.fetch_all(sort="rating", limit=3), ["acc-3", "acc-2", "acc-1", "acc-0"])
+
+    def test_filters(self):
+        self.assertEqual(self.fetch_all(sort="price", min_price=110, min_bedrooms=2), ["acc-2"])
+        self.assertEqual(self.fetch_all(location="loc-01", min_review_score=3), ["acc-3"])
+
+        row = self.client.get("/api/accommodations/", {"country_code": "fr", "sort": "price", "limit": 1}).json()["results"][0]
+        self.assertEqual(row, {
+            "id": "acc-0", "title": "Flat 0", "country_code": "FR", "location_id": "loc-01", "usd_rate": "100.00",
+            "review_score": "0.0", "bedroom_count": 0, "created_at": row["created_at"],
+        })
+
+    def test_unpublished_only_for_staff(self):
+        self.assertNotIn("acc-4", self.fetch_all(published="any"))
+        self.client.force_login(User.objects.create_superuser(username="admin", password="secret"))
+        self.assertEqual(self.fetch_all(published="false"), ["acc-4"])
+
+    def test_invalid_requests(self):
+        for params in ({"sort": "name"}, {"cursor": "garbage"}, {"min_price": "cheap"}, {"location": "nowhere"}):
+            self.assertEqual(self.client.get("/api/accommodations", params).status_code, 400, params)
+        cursor = self.client.get("/api/accommodations", {"sort": "price", "limit": 1}).json()["next"]
+        self.assertEqual(self.client.get("/api/accommodations", {"sort": "rating", "cursor": cursor}).status_code, 400)
+
+
+class GeoGridTest(TestCase):
+    def setUp(self):
+        self.location = Location.objects.create(id="loc-01", title="Paris", center=Point(2.35, 48.85))
+        for pk, rate, score in [("acc-1", 100, 4), ("acc-2", 200, 5)]:
+            Accommodation.objects.create(
+                id=pk, title=pk, country_code="FR", usd_rate=rate, review_score=score,
+                center=Point(2.35, 48.85), location_id=self.location, published=True,
+            )
+
+    def test_geohash(self):
+        self.assertEqual(geohash.encode(-5.6, 42.6, 5), "ezs42")
+        west, south, east, north = geohash.bounds("ezs42")
+        self.assertTrue(west <= -5.6 <= east and south <= 42.6 <= north)
+        self.assertEqual(Accommodation.objects.get(id="acc-1").geohash, geohash.encode(2.35, 48.85))
+
+    def test_contribution_accepts_unsaved_values(self):
+        deltas = geogrid.contribution([("u09", 99.9, "4.5"), ("u09", Decimal("0.1"), None)], 1)
+        self.assertEqual(deltas[(3, "u09")], [2, Decimal("100.0"), Decimal("4.5")])
+
+    def test_rollups_follow_changes(self):
+        cell = GeoGridCell.objects.get(level=3, cell=geohash.encode(2.35, 48.85, 3))
+        self.assertEqual(cell.accommodation_count, 2)
+        self.assertEqual(cell.avg_usd_rate, 150)
+        self.assertEqual(cell.avg_review_score, 4.5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk.unpublish(Accommodation.objects.filter(id="acc-1"))
+        cell.refresh_from_db()
+        self.assertEqual(cell.accommodation_count, 1)
+        self.assertEqual(cell.avg_usd_rate, 200)
+
+        Accommodation.objects.get(id="acc-2").delete()
+        self.assertFalse(GeoGridCell.objects.exists())
+
+        self.assertEqual(geogrid.rebuild(), 0)
+
+    def test_api_by_bbox(self):
+        response = self.client.get("/api/geogrid/", {"bbox": "2,48,3,49", "level": 5})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["summary"]["accommodation_count"], 2)
+        self.assertEqual([c["cell"] for c in data["cells"]], [geohash.encode(2.35, 48.85, 5)])
+
+        self.assertEqual(self.client.get("/api/geogrid/", {"bbox": "3,48,2,49"}).status_code, 400)
+
+        cached = self.client.get(
+            "/api/geogrid/", {"bbox": "2,48,3,49", "level": 5}, HTTP_IF_NONE_MATCH=response["ETag"]
+        )
+        self.assertEqual(cached.status_code, 304)
+
+
+class RankScoreTest(TestCase):
+    def setUp(self):
+        location = Location.objects.create(id="loc-01", title="Paris", center=Point(2.35, 48.85))
+        self.plain = Accommodation.objects.create(
+            id="plain", title="Plain", country_code="FR", usd_rate=100, review_score=8,
+            center=Point(2.35, 48.85), location_id=location, published=True,
+        )
+        self.complete = Accommodation.objects.create(
+            id="complete", title="Complete", country_code="FR", usd_rate=100, review_score=8,
+            center=Point(2.35, 48.85), location_id=location, published=True,
+            images=[f"https://example.com/{i}.jpg" for i in range(10)], amenities=["WiFi", "Pool"],
+        )
+
+    def score(self, pk):
+        return Accommodation.objects.get(pk=pk).rank_score
+
+    def test_score_maintained_on_change(self):
+        self.assertGreater(self.score("complete"), self.score("plain"))
+
+        before = self.score("plain")
+        LocalizeAccommodation.objects.create(property_id=self.plain, language="fr", description="Simple", policy={})
+        self.assertGreater(self.score("plain"), before)
+
+        Accommodation.objects.update(rank_score=0)
+        self.assertEqual(ranking.refresh_all(), 2)
+        self.assertGreater(self.score("complete"), 0)
+
+    def test_ordering(self):
+        ordered = Accommodation.objects.filter(published=True).order_by("-rank_score", "id")
+        self.assertEqual([a.id for a in ordered], ["complete", "plain"])
+
+
+class AmenityDictionaryTest(TestCase):
+    def setUp(self):
+        self.location = Location.objects.create(id="loc-01", title="Paris", center=Point(2.35, 48.85))
+
+    def create(self, pk, names):
+        return Accommodation.objects.create(
+            id=pk, title=pk, country_code="FR", usd_rate=100, center=Point(2.35, 48.85),
+            location_id=self.location, amenities=names,
+        )
+
+    def test_encoded_on_save(self):
+        self.create("acc-1", ["WiFi", "Pool", "WiFi"])
+        self.create("acc-2", ["Pool"])
+        accommodation = Accommodation.objects.get(id="acc-1")
+        self.assertEqual(accommodation.amenities, ["WiFi", "Pool"])
+        self.assertEqual(accommodation.amenity_ids, Amenity.ids_for(["WiFi", "Pool"]))
+        self.assertIsNone(accommodation.legacy_amenities)
+        self.assertEqual(Amenity.objects.count(), 2)
+
+        self.assertEqual([a.id for a in Accommodation.objects.with_amenities(["Pool", "WiFi"])], ["acc-1"])
+        self.assertEqual(Accommodation.objects.with_amenities(["Pool"]).count(), 2)
+        self.assertFalse(Accommodation.objects.with_amenities(["Sauna"]).exists())
+
+    def test_known_names_are_not_inserted_again(self):
+        ids = Amenity.ids_for(["WiFi", "Pool"], create=True)
+        with self.assertNumQueries(1):
+            self.assertEqual(Amenity.ids_for(["Pool", "WiFi"], create=True), ids[::-1])
+
+    def test_renamed_amenity(self):
+        self.create("acc-1", ["WiFi"])
+        self.assertEqual(Accommodation.objects.get(id="acc-1").amenities, ["WiFi"])
+        with self.captureOnCommitCallbacks(execute=True):
+            amenity = Amenity.objects.get(name="WiFi")
+            amenity.name = "Wi-Fi"
+            amenity.save()
+        self.assertEqual(Accommodation.objects.get(id="acc-1").amenities, ["Wi-Fi"])
+
+    def test_bulk_encoding_of_legacy_json(self):
+        self.create("acc-1", [])
+        Accommodation.objects.update(legacy_amenities=["Parking", "WiFi"])
+        self.assertEqual(Accommodation.objects.get(id="acc-1").amenities, ["Parking", "WiFi"])
+
+        added, encoded = amenities.encode_all()
+        self.assertEqual((added, encoded), (2, 1))
+        accommodation = Accommodation.objects.get(id="acc-1")
+        self.assertIsNone(accommodation.legacy_amenities)
+        self.assertEqual(accommodation.amenities, ["Parking", "WiFi"])
+
+
+class PolicyStoreTest(TestCase):
+    def setUp(self):
+        location = Location.objects.create(id="loc-01", title="Paris", center=Point(2.35, 48.85))
+        self.accommodation = Accommodation.objects.create(
+            id="acc-1", title="Flat", country_code="FR", usd_rate=100, center=Point(2.35, 48.85), location_id=location,
+        )
+
+    def localize(self, language, policy):
+        return LocalizeAccommodation(property_id=self.accommodation, language=language, description="-", policy=policy)
+
+    def test_identical_policies_stored_once(self):
+        self.localize("en", {"check_in": "3 PM", "check_out": "11 AM"}).save()
+        self.localize("fr", {"check_out": "11 AM", "check_in": "3 PM"}).save()
+        self.localize("de", {"check_in": "2 PM"}).save()
+        self.assertEqual(Policy.objects.count(), 2)
+
+        en, fr = (LocalizeAccommodation.objects.get(language=lang) for lang in ("en", "fr"))
+        self.assertEqual(en.policy_id_id, fr.policy_id_id)
+        self.assertIsNone(en.legacy_policy)
+        self.assertEqual(fr.policy, {"check_in": "3 PM", "check_out": "11 AM"})
+
+        # In-place edits are saved, without touching the shared document
+        fr.policy["check_in"] = "4 PM"
+        fr.save()
+        self.assertEqual(LocalizeAccommodation.objects.get(language="en").policy["check_in"], "3 PM")
+        self.assertEqual(LocalizeAccommodation.objects.get(language="fr").policy["check_in"], "4 PM")
+
+    def test_bulk_create_and_cached_reads(self):
+        boilerplate = {"pets": False}
+        policies.bulk_create([self.localize(lang, boilerplate) for lang in ("en", "es", "fr", "de")])
+        self.assertEqual(Policy.objects.count(), 1)
+        self.assertEqual(ChangeLogEntry.objects.filter(model="localizeaccommodation").count(), 4)
+
+        localizations = policies.load(list(LocalizeAccommodation.objects.all()))
+        with self.assertNumQueries(0):
+            self.assertEqual([loc.policy for loc in localizations], [boilerplate] * 4)
+
+    def test_dedupe_legacy_json(self):
+        self.localize("en", {}).save()
+        LocalizeAccommodation.objects.update(policy_id=None, legacy_policy={"smoking": "no"})
+        Policy.objects.all().delete()
+        self.localize("es", {"smoking": "no"}).save()
+
+        self.assertEqual(policies.dedupe(), (0, 1))
+        self.assertEqual(Policy.objects.count(), 1)
+        self.assertEqual(LocalizeAccommodation.objects.get(language="en").policy, {"smoking": "no"})
+        self.assertEqual(policies.prune(), 0)
+
+
+class RequestProfilerTest(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_superuser(username="admin", password="secret", email="admin@example.com")
+        self.client.force_login(self.staff)
+
+    def test_staff_opt_in(self):
+        self.assertNotIn("X-Profile-Id", self.client.get("/admin/properties/accommodation/"))
+        self.assertFalse(RequestProfile.objects.exists())
+
+        response = self.client.get("/admin/properties/accommodation/", {"_profile": "1"})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("_profile", response.wsgi_request.GET)
+        profile = RequestProfile.objects.get(pk=response["X-Profile-Id"])
+        self.assertEqual(profile.path, "/admin/properties/accommodation/?_profile=1")
+        self.assertGreater(profile.query_count, 0)
+        self.assertEqual(profile.created_by, self.staff)
+
+        detail = self.client.get(f"/admin/properties/requestprofile/{profile.pk}/change/")
+        self.assertContains(detail, "SQL timeline")
+
+    def test_ignored_for_non_staff(self):
+        user = User.objects.create_user(username="guest", password="secret")
+        self.client.force_login(user)
+        response = self.client.get("/", HTTP_X_PROFILE="1")
+        self.assertNotIn("X-Profile-Id", response)
+
+    def test_flame_rows(self):
+        rows = profiler.flame_rows({"a;b;c": 3, "a;b": 1, "a;d": 4})
+        self.assertEqual(
+            [(r["depth"], r["name"], r["left"], r["width"]) for r in rows],
+            [(0, "a", 0, 100), (1, "b", 0, 50), (2, "c", 0, 37.5), (1, "d", 50, 50)],
+        )
+
+
+class LoadTestStatsTest(SimpleTestCase):
+    def test_percentiles(self):
+        values = list(range(1, 101))
+        self.assertEqual(loadtest.percentile(values, 50), 50)
+        self.assertEqual(loadtest.percentile(values, 95), 95)
+        self.assertEqual(loadtest.percentile(values, 99), 99)
+        self.assertIsNone(loadtest.percentile([], 50))
+
+    def test_summary_and_compare(self):
+        stats = loadtest.Stats()
+        for ms in (10, 20, 30, 40):
+            stats.record("index", ms)
+        stats.record("index", 50, error="HTTP 500")
+        stats.finished = stats.started + 5
+        summary = stats.summary()
+        self.assertEqual(summary["endpoints"]["index"]["requests"], 5)
+        self.assertEqual(summary["endpoints"]["index"]["throughput"], 1)
+        self.assertEqual(summary["endpoints"]["index"]["errors"], {"HTTP 500": 1})
+
+        previous = {"endpoints": {"index": {"throughput": 2, "p95": 25}}}
+        [row] = loadtest.compare(summary, previous)
+        self.assertEqual((row["throughput_change"], row["p95_change"]), (-50, 100))
+
+    def test_parse_mix(self):
+        self.assertEqual(loadtest.parse_mix("browse=3,admin=1"), {"browse": 3, "admin": 1})
+        with self.assertRaises(ValueError):
+            loadtest.parse_mix("browse=x")
+
+
+class GeoConsistencyAuditTest(TestCase):
+    def setUp(self):
+        self.paris = Location.objects.create(
+            id="paris", title="Paris", center=Point(2.3522, 48.8566), location_type="city", country_code="fr"
+        )
+
+    def create(self, pk, center, country_code="FR"):
+        return Accommodation.objects.create(
+            id=pk, title=pk, country_code=country_code, usd_rate=100, center=center, location_id=self.paris,
+        )
+
+    def test_haversine(self):
+        # Paris - London is about 344 km
+        distance = geoaudit.haversine_km(np.array([2.3522]), np.array([48.8566]), np.array([-0.1276]), np.array([51.5072]))
+        self.assertAlmostEqual(distance[0], 343.5, delta=1)
+
+    def test_audit_flags_distance_and_country(self):
+        self.create("near", Point(2.35, 48.86))
+        self.create("london", Point(-0.1276, 51.5072))
+        self.create("wrong-country", Point(2.34, 48.85), country_code="BE")
+
+        run = geoaudit.audit(chunk_size=2)
+        self.assertEqual((run.checked_count, run.issue_count), (3, 2))
+        issues = {issue.property_id_id: issue for issue in run.issues.all()}
+        self.assertTrue(issues["london"].too_far)
+        self.assertFalse(issues["london"].country_mismatch)
+        self.assertEqual(issues["london"].max_distance_km, 100)
+        self.assertTrue(issues["wrong-country"].country_mismatch)
+        self.assertEqual(issues["wrong-country"].location_country, "FR")
+
+        # A looser threshold for cities clears the distance issue
+        self.assertEqual(geoaudit.audit({"city": 500}).issue_count, 1)
+        self.assertEqual(geoaudit.prune_runs(keep=1), 1)
+        self.assertEqual(GeoAuditRun.objects.count(), 1)
+
+
+class StartupProfileTest(SimpleTestCase):
+    def test_lean_apps(self):
+        apps = startup.lean_apps(["django.contrib.admin", "django.contrib.gis", "leaflet", "properties", "import_export"])
+        self.assertEqual(apps, ["django.contrib.admin.apps.SimpleAdminConfig", "django.contrib.gis", "properties"])
+
+    def test_select_profile(self):
+        with mock.patch.dict(os.environ, clear=False) as environ:
+            environ.pop(startup.PROFILE_ENV, None)
+            argv = startup.select_profile(["manage.py", "generate_sitemap", "--sync"])
+            self.assertEqual(argv, ["manage.py", "generate_sitemap", "--sync", "--skip-checks"])
+            self.assertEqual(environ[startup.PROFILE_ENV], "lean")
+
+            environ.pop(startup.PROFILE_ENV)
+            self.assertEqual(startup.select_profile(["manage.py", "migrate"]), ["manage.py", "migrate"])
+            self.assertEqual(environ[startup.PROFILE_ENV], "full")
+
+    def test_parse_import_times(self):
+        modules = startup.parse_import_times(
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |     tablib.core\n"
+            "import time:       300 |        420 |   tablib\n"
+            "import time:        50 |       1000 | import_export.resources\n"
+        )
+        self.assertEqual(modules["tablib"], (300, 420, 1))
+        self.assertEqual(startup.top_packages(modules), [("import_export", 1000)])
+
+
+class PriceHistoryTest(TestCase):
+    def setUp(self):
+        self.location = Location.objects.create(id="loc-01", title="France", center=Point(2.35, 48.85), location_type="country", country_code="FR")
+        self.accommodation = Accommodation.objects.create(
+            id="acc-01", title="Flat", country_code="FR", usd_rate=100, center=Point(2.35, 48.85),
+            location_id=self.location, published=True,
+        )
+        path = os.path.join(tempfile.mkdtemp(), "location_index.bin")
+        self.override = self.settings(LOCATION_INDEX_PATH=path, LOCATION_INDEX_CHECK_INTERVAL=0)
+        self.override.enable()
+
+    def tearDown(self):
+        self.override.disable()
+
+    def test_triggers_record_price_changes_only(self):
+        self.accommodation.usd_rate = 120
+        self.accommodation.save()
+        self.accommodation.title = "Renamed flat"
+        self.accommodation.save()
+        Accommodation.objects.filter(pk="acc-01").update(usd_rate=90)
+
+        history = PriceHistory.objects.filter(property_id="acc-01")
+        self.assertEqual([(h.old_usd_rate, h.usd_rate) for h in history], [(None, 100), (100, 120), (120, 90)])
+        self.assertEqual(history[0].location_id_id, "loc-01")
+
+    def test_rollups_and_trend_api(self):
+        Accommodation.objects.filter(pk="acc-01").update(usd_rate=80)
+        today = localdate()
+        prices.rollup_day(today)
+        prices.rollup_week(today)
+
+        day = PriceRollup.objects.get(scope=PriceRollup.ACCOMMODATION, key="acc-01", period=PriceRollup.DAY)
+        self.assertEqual((day.sample_count, day.open_usd_rate, day.close_usd_rate), (2, 100, 80))
+        self.assertEqual((day.min_usd_rate, day.max_usd_rate), (80, 100))
+        week = PriceRollup.objects.get(scope=PriceRollup.COUNTRY, key="FR", period=PriceRollup.WEEK)
+        self.assertEqual((week.bucket, week.sample_count, week.price_sum), (prices.week_start(today), 1, 80))
+
+        data = self.client.get(reverse("price_trends"), {"location": "loc-01", "period": "day"}).json()
+        self.assertEqual(data["scope"], PriceRollup.LOCATION)
+        self.assertEqual(data["points"], [{"date": str(today), "avg": "80.00", "min": "80.00", "max": "80.00", "samples": 1}])
+        self.assertEqual(self.client.get(reverse("price_trends"), {"country_code": "FR", "period": "month"}).status_code, 400)
+
+
+class PublicCatalogTest(TestCase):
+    def setUp(self):
+        catalog.recreate_view()
+        france = Location.objects.create(id="fr", title="France", center=Point(2.0, 46.0), location_type="country", country_code="FR")
+        paris = Location.objects.create(id="fr-paris", title="Paris", center=Point(2.35, 48.85), parent_id=france)
+        for pk, published in (("acc-pub", True), ("acc-draft", False)):
+            Accommodation.objects.create(
+                id=pk, title=pk, country_code="FR", usd_rate=100, center=Point(2.35, 48.85), location_id=paris, published=published,
+            )
+        for language in ("fr", "en"):
+            LocalizeAccommodation.objects.create(property_id_id="acc-pub", language=language, description=f"In {language}", policy={})
+
+    def test_only_published_rows_with_breadcrumb_and_description(self):
+        self.assertTrue(catalog.refresh(force=True))
+        entry = PublicCatalogEntry.objects.get()
+        self.assertEqual(entry.pk, "acc-pub")
+        self.assertEqual((entry.breadcrumb_ids, entry.breadcrumb), (["fr", "fr-paris"], ["France", "Paris"]))
+        self.assertEqual((entry.language, entry.description), ("en", "In en"))
+
+    def test_refresh_only_after_changes(self):
+        catalog.refresh(force=True)
+        self.assertFalse(catalog.refresh())
+        Accommodation.objects.filter(pk="acc-draft").update(published=True)
+        self.assertEqual(PublicCatalogEntry.objects.count(), 1)
+        Accommodation.objects.get(pk="acc-draft").save()
+        self.assertTrue(catalog.refresh())
+        self.assertEqual(PublicCatalogEntry.objects.count(), 2)
+
+    def test_moved_listing_invalidates_old_location(self):
+        lyon = Location.objects.create(id="fr-lyon", title="Lyon", center=Point(4.83, 45.76), parent_id_id="fr")
+        catalog.refresh(force=True)
+        accommodation = Accommodation.objects.get(pk="acc-pub")
+        accommodation.location_id = lyon
+        accommodation.save()
+        changes = changefeed.pending(cache.get(catalog.CURSOR_KEY), catalog.TRACKED_MODELS)
+        self.assertEqual(catalog.changed_location_ids(changes), {"fr-paris", "fr-lyon"})
+
+
+class AreaSearchTest(TestCase):
+    def setUp(self):
+        location = Location.objects.create(id="loc-01", title="Paris", center=Point(2.35, 48.85), country_code="FR")
+        for pk, lon, published in (("acc-in", 2.35, True), ("acc-out", 3.5, True), ("acc-draft", 2.36, False)):
+            Accommodation.objects.create(
+                id=pk, title=pk, country_code="FR", usd_rate=100, center=Point(lon, 48.85), location_id=location, published=published,
+            )
+        self.square = {"type": "Polygon", "coordinates": [[[2, 48], [3, 48], [3, 49], [2, 49], [2, 48]]]}
+
+    def search(self, geometry, **params):
+        response = self.client.post(
+            reverse("area_search") + ("?" + "&".join(f"{k}={v}" for k, v in params.items()) if params else ""),
+            data=json.dumps(geometry), content_type="application/geo+json",
+        )
+        return response, json.loads(b"".join(response.streaming_content)) if response.streaming else None
+
+    def test_prepare_simplifies_and_repairs(self):
+        ring = [(2 + 0.5 * math.cos(i * math.pi / 2000), 48.5 + 0.5 * math.sin(i * math.pi / 2000)) for i in range(4000)]
+        area, vertices = area_search.prepare(Polygon(ring + [ring[0]], srid=4326))
+        self.assertEqual(vertices, 4001)
+        self.assertLess(area.num_coords, 1000)
+        self.assertEqual(area.geom_type, "MultiPolygon")
+
+        bowtie = Polygon([(0, 0), (1, 1), (1, 0), (0, 1), (0, 0)], srid=4326)
+        self.assertTrue(area_search.prepare(bowtie)[0].valid)
+        with self.assertRaises(area_search.InvalidArea):
+            area_search.prepare(Polygon([(0, 0), (200, 0), (200, 1), (0, 0)], srid=4326))
+
+    def test_search_streams_published_accommodations_inside(self):
+        response, data = self.search({"type": "Feature", "geometry": self.square})
+        self.assertEqual(response["Content-Type"], "application/geo+json")
+        self.assertEqual([f["properties"]["id"] for f in data["features"]], ["acc-in"])
+        self.assertEqual(data["features"][0]["geometry"], {"type": "Point", "coordinates": [2.35, 48.85]})
+        self.assertFalse(data["truncated"])
+        self.assertEqual(self.search({"type": "Point", "coordinates": [2, 48]})[0].status_code, 400)
+
+    def test_same_id_in_two_feeds_and_truncation(self):
+        Accommodation(
+            id="acc-in", feed=1, title="acc-in", country_code="FR", usd_rate=100, center=Point(2.35, 48.85),
+            location_id_id="loc-01", published=True,
+        ).save(force_insert=True)
+        _, data = self.search(self.square)
+        self.assertEqual([(f["properties"]["id"], f["properties"]["feed"]) for f in data["features"]], [("acc-in", 0), ("acc-in", 1)])
+        self.assertEqual(area_search.count(area_search.parse(json.dumps(self.square))[0]), 2)
+        with self.settings(AREA_SEARCH_MAX_RESULTS=1):
+            _, data = self.search(self.square)
+        self.assertEqual((len(data["features"]), data["truncated"]), (1, True))
+
+    def test_saved_search_counts(self):
+        self.assertEqual(self.search(self.square, save="paris")[0].status_code, 401)
+        self.client.force_login(User.objects.create_user(username="user", password="password123"))
+        response, _ = self.search(self.square, save="paris")
+        search = SavedAreaSearch.objects.get(pk=response["X-Saved-Search"])
+
+        # Counted by a job, never while listing
+        listed = self.client.get(reverse("area_search")).json()
+        self.assertEqual([(s["name"], s["result_count"]) for s in listed["results"]], [("paris", None)])
+        self.assertEqual((listed["page"], listed["pages"]), (1, 1))
+        self.client.get(reverse("area_search"))
+        job = Job.objects.get(kind="count_area_search", status=Job.QUEUED)
+        jobs.claim_job("test-worker")
+        self.assertEqual(jobs.execute_job(job.pk), Job.SUCCEEDED)
+        self.assertEqual(self.client.get(reverse("area_search")).json()["results"][0]["result_count"], 1)
+
+        Accommodation.objects.filter(pk="acc-draft").update(published=True)
+        self.client.get(reverse("area_search"))
+        self.assertFalse(Job.objects.filter(status=Job.QUEUED).exists())
+        with self.settings(AREA_SEARCH_COUNT_TTL=0):
+            self.client.get(reverse("area_search"))
+        self.assertTrue(Job.objects.filter(kind="count_area_search", status=Job.QUEUED).exists())
+        self.assertEqual(area_search.recount(search), 2)
+
+        response = self.client.get(reverse("saved_area_search", args=[search.pk]))
+        ids = sorted(f["properties"]["id"] for f in json.loads(b"".join(response.streaming_content))["features"])
+        self.assertEqual(ids, ["acc-draft", "acc-in"])
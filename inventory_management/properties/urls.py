@@ -1,9 +1,21 @@
-from django.urls import path
+from django.urls import path, re_path
 
-from .views import SignupView, LoginView, IndexView
+from .views import (
+    SignupView, LoginView, IndexView, ChangeFeedView, GeoGridView, AccommodationListView, LocationPageView,
+    PriceTrendView, AreaSearchView,
+)
 
 urlpatterns = [
     path('', IndexView.as_view(), name='index'),
     path('signup/', SignupView.as_view(), name='signup'),
     path('login/', LoginView.as_view(), name='login'),
+    path('api/changes/', ChangeFeedView.as_view(), name='changes'),
+    path('api/geogrid/', GeoGridView.as_view(), name='geogrid'),
+    # With or without the slash: the catch-all below would otherwise take the bare form
+    re_path(r'^api/accommodations/?$', AccommodationListView.as_view(), name='accommodations'),
+    path('api/price-trends/', PriceTrendView.as_view(), name='price_trends'),
+    path('api/area-search/', AreaSearchView.as_view(), name='area_search'),
+    path('api/area-search/<int:pk>/', AreaSearchView.as_view(), name='saved_area_search'),
+    # Sitemap URLs (country/state/city); keep this catch-all last
+    path('<path:slug_path>', LocationPageView.as_view(), name='location_page'),
 ]
@@ -6,9 +6,31 @@ from django.contrib.auth import authenticate, login
 from django.contrib.auth.models import Group
 from django.contrib.auth import get_user_model
 from django.contrib import messages
-from django.urls import reverse_lazy
+from django.urls import Resolver404, resolve, reverse_lazy
 from django.views.generic import TemplateView
+from django.views import View
+from django.conf import settings
+from django.http import HttpResponse, HttpResponsePermanentRedirect, JsonResponse, StreamingHttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.http import Http404, FileResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+from datetime import date, timedelta
+from decimal import Decimal
+from functools import partial
+import json
+import mimetypes
+import os
+import re
 from .forms import CustomUserCreationForm
+from .location_index import get_location_index, version_datetime
+from .models import PriceRollup, PublicCatalogEntry, SavedAreaSearch
+from .nearest import nearest_accommodations
+from . import area_search, changefeed, conditional, geogrid, listings, page_cache, prices
 
 User = get_user_model()
 
@@ -89,3 +111,406 @@ class LoginView(FormView):
         """
         messages.error(self.request, 'Invalid login attempt. Please correct the errors and try again.')
         return super().form_invalid(form)
+
+
+class ChangeFeedView(View):
+    """
+    Cursor-paginated change feed as NDJSON, one change per line:
+    ``{"m": model, "id": object id, "op": "u"|"d", "t": changed_at, "d": delta}``.
+    Pass the ``X-Next-Cursor`` response header back as ``?cursor=`` for the next page.
+    """
+
+    def is_authorized(self, request):
+        if request.user.is_authenticated and request.user.is_staff:
+            return True
+        auth = request.headers.get('Authorization', '')
+        return auth.startswith('Bearer ') and auth[len('Bearer '):] in settings.CHANGEFEED_TOKENS
+
+    def get(self, request):
+        if not self.is_authorized(request):
+            return JsonResponse({'error': 'Authentication required.'}, status=401)
+
+        models = [m for m in request.GET.get('models', '').split(',') if m]
+        unknown = set(models) - set(changefeed.TRACKED_MODELS)
+        if unknown:
+            return JsonResponse({'error': f"Unknown models: {', '.join(sorted(unknown))}"}, status=400)
+
+        try:
+            limit = min(int(request.GET.get('limit', settings.CHANGEFEED_PAGE_SIZE)), settings.CHANGEFEED_MAX_PAGE_SIZE)
+            entries = changefeed.changes_since(
+                cursor=request.GET.get('cursor'),
+                models=models,
+                limit=max(limit, 1),
+            )
+        except ValueError:
+            return JsonResponse({'error': 'Invalid cursor or limit.'}, status=400)
+
+        lines = [
+            json.dumps(
+                {'m': e.model, 'id': e.object_id, 'op': e.action, 't': e.changed_at, 'd': e.data},
+                cls=DjangoJSONEncoder,
+                separators=(',', ':'),
+            )
+            for e in entries
+        ]
+        response = HttpResponse(''.join(line + '\n' for line in lines), content_type='application/x-ndjson')
+        if entries:
+            response['X-Next-Cursor'] = changefeed.encode_cursor(entries[-1].txid, entries[-1].id)
+        else:
+            # Nothing new, the caller keeps polling with the same cursor
+            response['X-Next-Cursor'] = request.GET.get('cursor', '')
+        return response
+
+
+class GeoGridView(conditional.ConditionalMixin, View):
+    """
+    Precomputed accommodation statistics per grid cell for maps and area reports:
+    ``?bbox=west,south,east,north[&level=N]``. Without a level, the finest one
+    that keeps the response under GEOGRID_MAX_CELLS cells is used.
+    """
+
+    def parse(self, request):
+        """``(bbox, level)`` from the query string, or None if it is invalid."""
+        try:
+            bbox = [float(value) for value in request.GET['bbox'].split(',')]
+            west, south, east, north = bbox
+            level = int(request.GET['level']) if 'level' in request.GET else geogrid.level_for_bbox(bbox)
+        except (KeyError, ValueError):
+            return None
+        if west >= east or south >= north or not 1 <= level <= settings.GEOGRID_MAX_LEVEL:
+            return None
+        return bbox, level
+
+    def get_validators(self, request):
+        parsed = self.parse(request)
+        if parsed is None:
+            return None, None
+        # The count catches cells that were deleted
+        last_modified, count = conditional.last_updated(geogrid.cells_in_bbox(*parsed))
+        return conditional.make_etag(request.GET.urlencode(), last_modified, count), last_modified
+
+    def get(self, request):
+        parsed = self.parse(request)
+        if parsed is None:
+            return JsonResponse({'error': 'Expected bbox=west,south,east,north and an optional integer level.'}, status=400)
+        bbox, level = parsed
+
+        cells = geogrid.cells_in_bbox(bbox, level)
+        return JsonResponse({
+            'level': level,
+            'summary': geogrid.summarize(cells),
+            'cells': [
+                {
+                    'cell': cell.cell,
+                    'lon': cell.center.x,
+                    'lat': cell.center.y,
+                    'accommodation_count': cell.accommodation_count,
+                    'avg_usd_rate': cell.avg_usd_rate,
+                    'avg_review_score': cell.avg_review_score,
+                }
+                for cell in cells.order_by('cell')[:settings.GEOGRID_MAX_CELLS]
+            ],
+        })
+
+
+class AccommodationListView(View):
+    """
+    Public listing API: ``?location=&country_code=&min_price=&max_price=
+    &min_bedrooms=&min_review_score=&sort=price|-price|rating|recent&limit=&cursor=``.
+    Only published accommodations are listed, unless a staff user passes
+    ``published=false`` or ``published=any``. Pages are linked by the opaque
+    ``next`` cursor (see properties/listings.py).
+    """
+    NUMBER_FILTERS = {
+        'min_price': 'usd_rate__gte',
+        'max_price': 'usd_rate__lte',
+        'min_bedrooms': 'bedroom_count__gte',
+        'min_review_score': 'review_score__gte',
+    }
+
+    def get_filters(self, request):
+        """Q of the query string's filters. Raises ValueError for invalid values."""
+        filters = Q()
+        published = request.GET.get('published', 'true')
+        if not request.user.is_staff:
+            published = 'true'
+        if published != 'any':
+            if published not in ('true', 'false'):
+                raise ValueError('published must be true, false or any.')
+            filters &= Q(published=published == 'true')
+
+        if request.GET.get('location'):
+            subtree = listings.subtree_filter(get_location_index(), request.GET['location'])
+            if subtree is None:
+                raise ValueError('Unknown location.')
+            filters &= subtree
+        if request.GET.get('country_code'):
+            filters &= Q(country_code=request.GET['country_code'].upper())
+        for param, lookup in self.NUMBER_FILTERS.items():
+            if request.GET.get(param):
+                value = Decimal(request.GET[param])
+                if not value.is_finite():
+                    raise ValueError(f'{param} must be a number.')
+                filters &= Q(**{lookup: value})
+        return filters
+
+    def get(self, request):
+        sort = request.GET.get('sort', listings.DEFAULT_SORT)
+        if sort not in listings.SORTS:
+            return JsonResponse({'error': f"sort must be one of {', '.join(listings.SORTS)}."}, status=400)
+        try:
+            limit = min(max(int(request.GET.get('limit', settings.LISTINGS_API_PAGE_SIZE)), 1),
+                        settings.LISTINGS_API_MAX_PAGE_SIZE)
+            filters = self.get_filters(request)
+            rows, next_cursor = listings.page(filters, sort, request.GET.get('cursor'), limit)
+        except ValueError as e:
+            return JsonResponse({'error': str(e) or 'Invalid filter, limit or cursor.'}, status=400)
+        except ArithmeticError:
+            return JsonResponse({'error': 'Invalid number in filters.'}, status=400)
+
+        response = JsonResponse({'results': rows, 'next': next_cursor})
+        conditional.set_cache_headers(request, response)
+        return response
+
+
+class PriceTrendView(conditional.ConditionalMixin, View):
+    """
+    Price trend chart data from the price rollups (see properties/prices.py):
+    ``?accommodation=ID | location=ID | country_code=CC [&period=day|week]
+    [&start=YYYY-MM-DD&end=YYYY-MM-DD]``. Defaults to weekly points over the
+    last year. Locations, countries included, add up the rollups of their
+    subtree, like their pages; ``country_code`` uses the country rollups.
+    """
+
+    def parse(self, request):
+        """``(scope, keys, period, start, end)`` from the query string, or None if it is invalid."""
+        params = request.GET
+        if params.get('accommodation'):
+            scope, keys = PriceRollup.ACCOMMODATION, [params['accommodation']]
+        elif params.get('location'):
+            index = get_location_index()
+            if index.find(params['location']) is None:
+                return None
+            scope, keys = PriceRollup.LOCATION, listings.subtree_ids(params['location'])
+        elif params.get('country_code'):
+            scope, keys = PriceRollup.COUNTRY, [params['country_code'].upper()]
+        else:
+            return None
+
+        period = params.get('period', PriceRollup.WEEK)
+        try:
+            end = date.fromisoformat(params['end']) if params.get('end') else date.today()
+            start = date.fromisoformat(params['start']) if params.get('start') else end - timedelta(days=365)
+        except ValueError:
+            return None
+        if period not in (PriceRollup.DAY, PriceRollup.WEEK) or start > end:
+            return None
+        return scope, keys, period, start, end
+
+    def get_validators(self, request):
+        parsed = self.parse(request)
+        if parsed is None:
+            return None, None
+        last_modified, count = conditional.last_updated(prices.trend_rollups(*parsed))
+        return conditional.make_etag(request.GET.urlencode(), last_modified, count), last_modified
+
+    def get(self, request):
+        parsed = self.parse(request)
+        if parsed is None:
+            return JsonResponse({
+                'error': 'Expected one of accommodation, location or country_code, an optional period '
+                         '(day or week) and optional start/end dates (YYYY-MM-DD).'
+            }, status=400)
+        scope, keys, period, start, end = parsed
+        return JsonResponse({
+            'scope': scope,
+            'period': period,
+            'start': start,
+            'end': end,
+            'points': prices.trend(scope, keys, period, start, end),
+        })
+
+
+class AreaSearchView(View):
+    """
+    Published accommodations inside a polygon, as a streamed GeoJSON
+    FeatureCollection (see properties/area_search.py).
+
+    ``POST`` a GeoJSON Polygon, MultiPolygon or Feature to search it; signed-in
+    users may add ``?save=<name>`` to keep it. ``GET [?page=N]`` lists the
+    user's saved searches with their cached result counts (stale ones are
+    recounted by a job), and ``GET <id>/`` runs one.
+    """
+
+    def results(self, area, vertices, saved=None):
+        response = StreamingHttpResponse(area_search.stream(area, vertices), content_type='application/geo+json')
+        if saved is not None:
+            response['X-Saved-Search'] = saved.pk
+        return response
+
+    def post(self, request):
+        try:
+            area, vertices = area_search.parse(request.body)
+        except area_search.InvalidArea as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        saved = None
+        if request.GET.get('save'):
+            if not request.user.is_authenticated:
+                return JsonResponse({'error': 'Sign in to save searches.'}, status=401)
+            saved = SavedAreaSearch.objects.create(
+                name=request.GET['save'][:100], geometry=area, original_vertex_count=vertices,
+                vertex_count=area.num_coords, created_by=request.user,
+            )
+            area_search.schedule_recounts([saved])
+        return self.results(area, vertices, saved)
+
+    def get(self, request, pk=None):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'Sign in to use saved searches.'}, status=401)
+        searches = SavedAreaSearch.objects.all()
+        if not request.user.is_staff:
+            searches = searches.filter(created_by=request.user)
+
+        if pk is not None:
+            search = searches.filter(pk=pk).first()
+            if search is None:
+                raise Http404('No saved search matches this id.')
+            return self.results(search.geometry, search.original_vertex_count)
+
+        page = Paginator(searches, settings.AREA_SEARCH_PAGE_SIZE).get_page(request.GET.get('page'))
+        area_search.schedule_recounts(page)
+        return JsonResponse({
+            'results': [
+                {
+                    'id': search.pk,
+                    'name': search.name,
+                    'vertices': search.vertex_count,
+                    'result_count': search.result_count,
+                    'counted_at': search.counted_at,
+                    'created_at': search.created_at,
+                }
+                for search in page
+            ],
+            'page': page.number,
+            'pages': page.paginator.num_pages,
+        })
+
+
+class LocationPageView(conditional.ConditionalMixin, TemplateView):
+    """
+    Landing page for a sitemap URL such as ``france/ile-de-france/paris``.
+    The slug path is resolved with the in-memory location index, and the
+    listing queries only run when their cached fragment is missing.
+    """
+    template_name = 'location.html'
+
+    def dispatch(self, request, *args, **kwargs):
+        # This catch-all also matches other routes written without their slash (/admin, /login,
+        # /api/changes), so APPEND_SLASH never sees a 404 for them; redirect as it would
+        if settings.APPEND_SLASH and not request.path_info.endswith('/'):
+            try:
+                match = resolve(request.path_info + '/')
+            except Resolver404:
+                match = None
+            if match is not None and match.url_name != 'location_page':
+                return HttpResponsePermanentRedirect(request.get_full_path(force_append_slash=True))
+        return super().dispatch(request, *args, **kwargs)
+
+    def get_validators(self, request, slug_path):
+        index = get_location_index()
+        node = index.resolve_path(slug_path)
+        if node is None:
+            return None, None
+        location_id = index.id(node)
+        # The version token changes with every listing change in the subtree, deletes included
+        etag = conditional.make_etag(
+            page_cache.location_version(location_id), index.version[0], request.GET.urlencode()
+        )
+        last_modified = conditional.latest(
+            page_cache.listings_last_modified(index, location_id), version_datetime(index)
+        )
+        return etag, last_modified
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        index = get_location_index()
+        node = index.resolve_path(kwargs['slug_path'])
+        if node is None:
+            raise Http404('No location matches this URL.')
+        try:
+            page_number = max(int(self.request.GET.get('page', 1)), 1)
+        except ValueError:
+            raise Http404('Invalid page number.')
+
+        location_id = index.id(node)
+        # Only locations from the country down have sitemap URLs
+        trail = [n for n in index.ancestors(node) if index.location_type(n) != 'continent']
+        context.update({
+            'location': {
+                'id': location_id,
+                'title': index.title(node),
+                'type': index.location_type(node),
+                'path': index.path(node),
+            },
+            'breadcrumbs': [{'title': index.title(n), 'path': index.path(n)} for n in trail],
+            'sub_locations': [{'title': index.title(n), 'path': index.path(n)} for n in index.children(node)],
+            'page_number': page_number,
+            'version': page_cache.location_version(location_id),
+            'index_version': index.version[0],
+            'cache_timeout': settings.LOCATION_PAGE_CACHE_TIMEOUT,
+            # Called by the template only when the fragment is not cached
+            'listings_page': partial(self.get_listings_page, index, location_id, page_number),
+            'nearby': partial(nearest_accommodations, location_id),
+        })
+        return context
+
+    def get_listings_page(self, index, location_id, page_number):
+        """Published accommodations anywhere in the location's subtree, best ranked first, from the public catalog."""
+        queryset = (
+            PublicCatalogEntry.objects.filter(listings.subtree_filter(index, location_id))
+            .only('id', 'title', 'usd_rate', 'review_score', 'bedroom_count', 'images')
+            .order_by('-rank_score', 'id')
+        )
+        return Paginator(queryset, settings.LOCATION_PAGE_SIZE).get_page(page_number)
+
+
+class StaticAssetView(View):
+    """
+    Serve files from STATIC_ROOT, preferring the precompressed ``.br``/``.gz``
+    variant the client accepts. Content-hashed names (see properties/assets.py)
+    are cached for a year; other files for STATIC_ASSET_MAX_AGE.
+    """
+    HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.')
+    ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+    def get(self, request, path):
+        try:
+            full_path = safe_join(settings.STATIC_ROOT, path)
+        except SuspiciousFileOperation:
+            raise Http404
+        if not os.path.isfile(full_path):
+            raise Http404
+
+        stat = os.stat(full_path)
+        if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime):
+            response = HttpResponseNotModified()
+        else:
+            content_type, _ = mimetypes.guess_type(full_path)
+            served_path, encoding = full_path, None
+            accepted = request.headers.get('Accept-Encoding', '')
+            for name, suffix in self.ENCODINGS:
+                if name in accepted and os.path.isfile(full_path + suffix):
+                    served_path, encoding = full_path + suffix, name
+                    break
+            response = FileResponse(open(served_path, 'rb'), content_type=content_type or 'application/octet-stream')
+            if encoding:
+                response['Content-Encoding'] = encoding
+            response['Last-Modified'] = http_date(stat.st_mtime)
+
+        if self.HASHED_NAME.search(os.path.basename(path)):
+            response['Cache-Control'] = 'public, max-age=31536000, immutable'
+        else:
+            response['Cache-Control'] = f'public, max-age={settings.STATIC_ASSET_MAX_AGE}'
+        response['Vary'] = 'Accept-Encoding'
+        return response